@@ -3,6 +3,8 @@ from mysql.connector import Error
 from flask_bcrypt import Bcrypt
 from flask import Flask
 
+import stats
+
 # --- Flask + Bcrypt setup ---
 app = Flask(__name__)
 bcrypt = Bcrypt(app)
@@ -21,9 +23,9 @@ def recreate_schema(cursor):
 
     # Drop tables regardless of FK dependencies
     drop_order = [
-        "SHIPMENT", "MAINTENANCE", "TRIP",
+        "SHIPMENT", "MAINTENANCE", "TRIP", "SHIPMENT_ARCHIVE", "TRIP_ARCHIVE",
         "TRUCK", "DRIVER", "CLIENT",
-        "USERS", "GOODS", "OWNER"
+        "USERS", "GOODS", "OWNER", "STATS"
     ]
     for table in drop_order:
         cursor.execute(f"DROP TABLE IF EXISTS {table}")
@@ -95,13 +97,23 @@ def recreate_schema(cursor):
             Origin VARCHAR(100),
             Destination VARCHAR(100),
             StartDate DATE,
+            EndDate DATE,
             Status VARCHAR(50),
             TruckID INT,
             DriverID INT,
             ClientID INT,
             FOREIGN KEY (TruckID) REFERENCES TRUCK(TruckID),
             FOREIGN KEY (DriverID) REFERENCES DRIVER(DriverID),
-            FOREIGN KEY (ClientID) REFERENCES CLIENT(ClientID)
+            FOREIGN KEY (ClientID) REFERENCES CLIENT(ClientID),
+            -- Availability lookups in book_trip: leading on EndDate lets the
+            -- overlap check skip a resource's finished history.
+            INDEX idx_trip_truck_dates (TruckID, EndDate, StartDate),
+            INDEX idx_trip_driver_dates (DriverID, EndDate, StartDate),
+            -- Admin trip listing: keyset pages ordered by (StartDate, TripID). InnoDB
+            -- appends the primary key to secondary indexes, so TripID is covered.
+            INDEX idx_trip_start (StartDate),
+            INDEX idx_trip_status_start (Status, StartDate),
+            INDEX idx_trip_client_start (ClientID, StartDate)
         )
     """)
 
@@ -110,8 +122,12 @@ def recreate_schema(cursor):
             MaintenanceID INT AUTO_INCREMENT PRIMARY KEY,
             TruckID INT,
             MaintenanceDate DATE,
+            -- The truck is out of service for [MaintenanceDate, EndDate), like a trip.
+            EndDate DATE NOT NULL,
             Description VARCHAR(255),
-            FOREIGN KEY (TruckID) REFERENCES TRUCK(TruckID)
+            FOREIGN KEY (TruckID) REFERENCES TRUCK(TruckID),
+            -- Same shape as idx_trip_truck_dates, so the booking check skips past servicing.
+            INDEX idx_maintenance_truck_dates (TruckID, EndDate, MaintenanceDate)
         )
     """)
 
@@ -121,8 +137,60 @@ def recreate_schema(cursor):
             TripID INT,
             GoodsID INT,
             Quantity INT,
-            FOREIGN KEY (TripID) REFERENCES TRIP(TripID),
-            FOREIGN KEY (GoodsID) REFERENCES GOODS(GoodsID)
+            FOREIGN KEY (TripID) REFERENCES TRIP(TripID) ON DELETE CASCADE,
+            FOREIGN KEY (GoodsID) REFERENCES GOODS(GoodsID),
+            -- Per-trip load totals (SUM(Quantity) by TripID) are read from this index alone.
+            INDEX idx_shipment_trip (TripID, Quantity),
+            INDEX idx_shipment_goods (GoodsID)
+        )
+    """)
+
+    # Finished trips moved out of TRIP by archive.py. Partitioned by year of EndDate so old
+    # years can be dropped or exported wholesale; MySQL doesn't allow foreign keys on
+    # partitioned tables, and every unique key must include the partitioning column.
+    cursor.execute("""
+        CREATE TABLE TRIP_ARCHIVE (
+            TripID INT NOT NULL,
+            Origin VARCHAR(100),
+            Destination VARCHAR(100),
+            StartDate DATE,
+            EndDate DATE NOT NULL,
+            Status VARCHAR(50),
+            TruckID INT,
+            DriverID INT,
+            ClientID INT,
+            PRIMARY KEY (TripID, EndDate),
+            -- Same keyset listings as the hot table.
+            INDEX idx_trip_archive_start (StartDate),
+            INDEX idx_trip_archive_status_start (Status, StartDate),
+            INDEX idx_trip_archive_client_start (ClientID, StartDate),
+            INDEX idx_trip_archive_driver_start (DriverID, StartDate)
+        )
+        PARTITION BY RANGE COLUMNS (EndDate) (
+            PARTITION p2023 VALUES LESS THAN ('2024-01-01'),
+            PARTITION p2024 VALUES LESS THAN ('2025-01-01'),
+            PARTITION p2025 VALUES LESS THAN ('2026-01-01'),
+            PARTITION p2026 VALUES LESS THAN ('2027-01-01'),
+            PARTITION p2027 VALUES LESS THAN ('2028-01-01'),
+            PARTITION pmax VALUES LESS THAN (MAXVALUE)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE SHIPMENT_ARCHIVE (
+            ShipmentID INT PRIMARY KEY,
+            TripID INT NOT NULL,
+            GoodsID INT,
+            Quantity INT,
+            INDEX idx_shipment_archive_trip (TripID, Quantity)
+        )
+    """)
+
+    # Admin dashboard counters, maintained by app.py (see stats.py)
+    cursor.execute("""
+        CREATE TABLE STATS (
+            StatName VARCHAR(64) PRIMARY KEY,
+            StatValue BIGINT NOT NULL DEFAULT 0
         )
     """)
 
@@ -155,12 +223,12 @@ def seed_data(cursor):
     cursor.execute("INSERT INTO GOODS (GoodsName, GoodsType) VALUES ('Cement Bags', 'Construction')")
 
     # Trips
-    cursor.execute("INSERT INTO TRIP (Origin, Destination, StartDate, Status, TruckID, DriverID, ClientID) VALUES ('Chennai', 'Bangalore', '2025-10-10', 'Scheduled', 1, 1, 1)")
-    cursor.execute("INSERT INTO TRIP (Origin, Destination, StartDate, Status, TruckID, DriverID, ClientID) VALUES ('Mumbai', 'Pune', '2025-10-15', 'Scheduled', 2, 2, 1)")
+    cursor.execute("INSERT INTO TRIP (Origin, Destination, StartDate, EndDate, Status, TruckID, DriverID, ClientID) VALUES ('Chennai', 'Bangalore', '2025-10-10', '2025-10-17', 'Scheduled', 1, 1, 1)")
+    cursor.execute("INSERT INTO TRIP (Origin, Destination, StartDate, EndDate, Status, TruckID, DriverID, ClientID) VALUES ('Mumbai', 'Pune', '2025-10-15', '2025-10-22', 'Scheduled', 2, 2, 1)")
 
     # Maintenance
-    cursor.execute("INSERT INTO MAINTENANCE (TruckID, MaintenanceDate, Description) VALUES (1, '2025-09-01', 'Oil Change')")
-    cursor.execute("INSERT INTO MAINTENANCE (TruckID, MaintenanceDate, Description) VALUES (2, '2025-09-10', 'Brake Inspection')")
+    cursor.execute("INSERT INTO MAINTENANCE (TruckID, MaintenanceDate, EndDate, Description) VALUES (1, '2025-09-01', '2025-09-02', 'Oil Change')")
+    cursor.execute("INSERT INTO MAINTENANCE (TruckID, MaintenanceDate, EndDate, Description) VALUES (2, '2025-09-10', '2025-09-12', 'Brake Inspection')")
 
     # Shipments
     cursor.execute("INSERT INTO SHIPMENT (TripID, GoodsID, Quantity) VALUES (1, 1, 100)")
@@ -183,6 +251,9 @@ def run_seed():
         seed_data(cursor)
 
         conn.commit()
+
+        # Start the STATS counters at the seeded totals (see stats.py).
+        stats.reconcile_counters(conn)
         print("Dummy data inserted successfully!")
 
     except Error as err:
@@ -1,15 +1,40 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash
+from flask import (Flask, Response, request, session, jsonify, render_template, redirect, url_for, flash,
+                   stream_with_context, make_response, get_template_attribute)
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from flask_bcrypt import Bcrypt
 import mysql.connector
 from mysql.connector import Error
 from functools import wraps
+from markupsafe import Markup
 from datetime import date, timedelta, datetime
+import hashlib
+import io
+import os
+import time
+
+import db
+from db import get_db, get_read_db
+from cache import SharedCache, TTLCache
+from availability import (AvailabilityCalendar, BookingError, cancel_maintenance, list_maintenance, request_trip,
+                          reserve_trip, schedule_maintenance)
+from trips import (CLIENT_ID_SQL, DRIVER_OPTIONS_SQL, TRIP_STATUSES, TRUCK_OPTIONS_SQL, USER_SQL, client_trips_query,
+                   decode_cursor, list_trips, parse_trip_filters, trip_to_json)
+import stats
+import bulk
+import planning
+import scheduler
+import shipments
+import archive
+import lifecycle
+import reports
+from search import TripSearchIndex
+import instrumentation
+import events
+from hashing import HasherBusy, LoginThrottle, PasswordHasher
+from db import for_update
 
 # --- App and Extension Initialization ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'a-very-secret-key-that-you-should-change'
-bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
@@ -21,8 +46,100 @@ db_config = {
     'database': 'truck_management_system'
 }
 
-def create_connection():
-    return mysql.connector.connect(**db_config)
+# Connection pool settings. Set DB_BACKEND = 'sqlite' and SQLITE_PATH to run against a local SQLite file.
+app.config['DB_BACKEND'] = 'mysql'
+app.config['DB_POOL_SIZE'] = 5
+app.config['DB_POOL_MAX_OVERFLOW'] = 10
+app.config['DB_POOL_TIMEOUT'] = 30.0
+
+# Read replicas (see db.py): read-only queries go to them round-robin; MySQL entries are
+# overrides of db_config (e.g. {'host': 'replica-1'}), SQLite ones file paths. A replica
+# more than REPLICA_MAX_LAG_SECONDS behind is skipped, and a user's reads stay on the
+# primary for READ_YOUR_WRITES_SECONDS after each write they make.
+app.config['DB_REPLICAS'] = []
+app.config['REPLICA_MAX_LAG_SECONDS'] = 5.0
+app.config['REPLICA_LAG_CHECK_SECONDS'] = 2.0
+app.config['READ_YOUR_WRITES_SECONDS'] = 5
+
+# Used only when served through asgi.py: async MySQL pool size, and worker threads for the sync routes.
+app.config['ASYNC_DB_POOL_SIZE'] = 20
+app.config['ASGI_THREADS'] = 32
+
+def create_connection(**overrides):
+    return mysql.connector.connect(**{**db_config, **overrides})
+
+# Routes borrow a pooled connection with get_db(), or get_read_db() for read-only queries
+# that may be served by a replica; both are returned when the request ends.
+db.init_app(app, create_connection)
+
+# Query instrumentation: statements slower than SLOW_QUERY_MS are logged, with their
+# EXPLAIN plan when SLOW_QUERY_EXPLAIN is on.
+app.config['SLOW_QUERY_MS'] = 100
+app.config['SLOW_QUERY_EXPLAIN'] = False
+instrumentation.init_app(app)
+
+# In-memory truck/driver busy calendar used by the availability API.
+app.config['AVAILABILITY_REFRESH_SECONDS'] = 60
+availability_calendar = AvailabilityCalendar(refresh_seconds=app.config['AVAILABILITY_REFRESH_SECONDS'])
+
+app.config['ADMIN_TRIPS_PER_PAGE'] = 50
+
+# Admin KPI counters are maintained incrementally in STATS (reconciled by `python stats.py`);
+# the date-based fleet KPIs are recomputed this often.
+app.config['KPI_REFRESH_SECONDS'] = 600
+fleet_stats = stats.FleetStats(refresh_seconds=app.config['KPI_REFRESH_SECONDS'])
+
+app.config['IMPORT_CHUNK_SIZE'] = 1000
+
+# Load planning (see planning.py). DISTANCE_MATRIX_PATH is an optional CSV of measured
+# origin,destination,km road distances that override the computed ones.
+app.config['DISTANCE_MATRIX_PATH'] = None
+app.config['PLAN_DEFAULT_DAYS'] = 7
+
+# Trucks and drivers for 'Requested' trips are assigned in batches (see scheduler.py),
+# nightly via `python scheduler.py` or on demand from POST /admin/assign.
+app.config['ASSIGN_CHUNK_SIZE'] = 1000
+
+# Finished trips older than this move to the archive tables (see archive.py), nightly via
+# `python archive.py` or on demand from POST /admin/archive.
+app.config['ARCHIVE_HORIZON_DAYS'] = 365
+app.config['ARCHIVE_BATCH_SIZE'] = 1000
+
+# Trip statuses follow their dates (see lifecycle.py), hourly via `python lifecycle.py` or on
+# demand from POST /admin/lifecycle. Bulk status changes accept this many trips per request.
+app.config['LIFECYCLE_CHUNK_SIZE'] = 1000
+app.config['MAX_STATUS_UPDATES_PER_REQUEST'] = 1000
+
+# Trip status push (see events.py): events kept per user for reconnects, how often browsers
+# re-poll when served by plain WSGI, and the keep-alive interval of held-open ASGI streams.
+app.config['EVENTS_HISTORY'] = 50
+app.config['EVENTS_RETRY_MS'] = 10000
+app.config['EVENTS_HEARTBEAT_SECONDS'] = 20
+status_events = events.TripEvents(history=app.config['EVENTS_HISTORY'])
+
+# In-memory trip search for the admin console (see search.py), rebuilt this often to pick
+# up other processes' writes.
+app.config['SEARCH_REFRESH_SECONDS'] = 300
+app.config['SEARCH_MAX_RESULTS'] = 100
+search_index = TripSearchIndex(refresh_seconds=app.config['SEARCH_REFRESH_SECONDS'])
+
+# Upper bound on shipments attached to a trip in one POST (see shipments.py).
+app.config['MAX_SHIPMENTS_PER_REQUEST'] = 1000
+
+# Password hashing runs in a bounded process pool (HASH_WORKERS=0 hashes inline). Raising
+# BCRYPT_LOG_ROUNDS upgrades existing hashes the next time each user logs in.
+app.config['BCRYPT_LOG_ROUNDS'] = 12
+app.config['HASH_WORKERS'] = 2
+app.config['HASH_MAX_PENDING'] = 8
+app.config['LOGIN_MAX_FAILURES_PER_USER'] = 5
+app.config['LOGIN_MAX_FAILURES_PER_IP'] = 20
+app.config['LOGIN_FAILURE_WINDOW_SECONDS'] = 300
+password_hasher = PasswordHasher(rounds=app.config['BCRYPT_LOG_ROUNDS'],
+                                 workers=app.config['HASH_WORKERS'],
+                                 max_pending=app.config['HASH_MAX_PENDING'])
+login_throttle = LoginThrottle(max_per_user=app.config['LOGIN_MAX_FAILURES_PER_USER'],
+                               max_per_ip=app.config['LOGIN_MAX_FAILURES_PER_IP'],
+                               window_seconds=app.config['LOGIN_FAILURE_WINDOW_SECONDS'])
 
 # --- User Model and Loader ---
 class User(UserMixin):
@@ -31,15 +148,45 @@ class User(UserMixin):
         self.username = username
         self.role = role
 
+# Users are cached in-process so authenticated requests don't hit USERS every time.
+# Call invalidate_user() whenever a user's role or username changes.
+app.config['USER_CACHE_SIZE'] = 10000
+app.config['USER_CACHE_TTL'] = 300
+user_cache = TTLCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+
+# Rendered fragments (booking form option lists, admin trip tables) are cached under the
+# data versions kept in STATS, so they never need invalidating. Set FRAGMENT_CACHE_PATH to
+# share them between the worker processes on a host through a local SQLite file.
+app.config['FRAGMENT_CACHE_SIZE'] = 512
+app.config['FRAGMENT_CACHE_TTL'] = 3600
+app.config['FRAGMENT_CACHE_PATH'] = None
+app.config['DATA_VERSION_REFRESH_SECONDS'] = 2
+if app.config['FRAGMENT_CACHE_PATH']:
+    fragment_cache = SharedCache(app.config['FRAGMENT_CACHE_PATH'], maxsize=app.config['FRAGMENT_CACHE_SIZE'],
+                                 ttl=app.config['FRAGMENT_CACHE_TTL'])
+else:
+    fragment_cache = TTLCache(maxsize=app.config['FRAGMENT_CACHE_SIZE'], ttl=app.config['FRAGMENT_CACHE_TTL'])
+data_versions = stats.DataVersions(refresh_seconds=app.config['DATA_VERSION_REFRESH_SECONDS'])
+
+def cache_user(user_data):
+    user_cache.set(str(user_data['UserID']), (user_data['UserID'], user_data['Username'], user_data['Role']))
+
+def invalidate_user(user_id):
+    user_cache.invalidate(str(user_id))
+
 @login_manager.user_loader
 def load_user(user_id):
-    conn = create_connection()
+    cached = user_cache.get(str(user_id))
+    if cached:
+        return User(id=cached[0], username=cached[1], role=cached[2])
+
+    conn = get_read_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT UserID, Username, Role FROM USERS WHERE UserID = %s", (user_id,))
+    cursor.execute(USER_SQL, (user_id,))
     user_data = cursor.fetchone()
     cursor.close()
-    conn.close()
     if user_data:
+        cache_user(user_data)
         return User(id=user_data['UserID'], username=user_data['Username'], role=user_data['Role'])
     return None
 
@@ -53,22 +200,47 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def rehash_password(conn, user_id, password):
+    """Re-hashes a password at the current work factor. Skipped (until next login) when the hasher is busy."""
+    try:
+        new_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return
+    cursor = conn.cursor()
+    cursor.execute("UPDATE USERS SET PasswordHash = %s WHERE UserID = %s", (new_hash, user_id))
+    conn.commit()
+    cursor.close()
+
 # --- Authentication Routes ---
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
+
+        # Refuse throttled attempts before doing any bcrypt work.
+        if login_throttle.is_blocked(username, request.remote_addr):
+            flash('Too many failed login attempts. Please wait a few minutes and try again.', 'danger')
+            return render_template('login.html'), 429
         
-        conn = create_connection()
+        conn = get_db()
         cursor = conn.cursor(dictionary=True)
         cursor.execute("SELECT * FROM USERS WHERE Username = %s", (username,))
         user_data = cursor.fetchone()
         cursor.close()
-        conn.close()
 
-        if user_data and bcrypt.check_password_hash(user_data['PasswordHash'], password):
+        try:
+            valid = bool(user_data) and password_hasher.check(user_data['PasswordHash'], password)
+        except HasherBusy:
+            flash('The server is busy right now. Please try again in a moment.', 'danger')
+            return render_template('login.html'), 503
+
+        if valid:
+            login_throttle.reset(username)
+            if password_hasher.needs_rehash(user_data['PasswordHash']):
+                rehash_password(conn, user_data['UserID'], password)
             user = User(id=user_data['UserID'], username=user_data['Username'], role=user_data['Role'])
+            cache_user(user_data)
             login_user(user)
             flash('Logged in successfully!', 'success')
             if user.role == 'admin':
@@ -76,6 +248,7 @@ def login():
             else:
                 return redirect(url_for('dashboard'))
         else:
+            login_throttle.record_failure(username, request.remote_addr)
             flash('Login Unsuccessful. Please check username and password', 'danger')
     
     return render_template('login.html')
@@ -89,7 +262,7 @@ def register():
         billing_address = request.form.get('billing_address')
         contact_person = request.form.get('contact_person')
 
-        conn = create_connection()
+        conn = get_db()
         cursor = conn.cursor(dictionary=True)
 
         cursor.execute("SELECT * FROM USERS WHERE Username = %s", (username,))
@@ -98,17 +271,22 @@ def register():
             flash('Username already exists. Please choose a different one.', 'danger')
             return render_template('register.html')
         
-        password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        try:
+            password_hash = password_hasher.hash(password)
+        except HasherBusy:
+            flash('The server is busy right now. Please try again in a moment.', 'danger')
+            return render_template('register.html'), 503
         
         cursor.execute("INSERT INTO USERS (Username, PasswordHash, Role) VALUES (%s, %s, 'user')", (username, password_hash))
         new_user_id = cursor.lastrowid
         
         cursor.execute("INSERT INTO CLIENT (ClientName, BillingAddress, ContactPerson, UserID) VALUES (%s, %s, %s, %s)",
                        (client_name, billing_address, contact_person, new_user_id))
+        stats.bump(cursor, stats.USERS)
+        stats.bump_version(cursor, stats.USERS_VERSION)
         
         conn.commit()
         cursor.close()
-        conn.close()
         
         flash('Account created successfully! You can now log in.', 'success')
         return redirect(url_for('login'))
@@ -119,39 +297,120 @@ def register():
 @app.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
     logout_user()
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
+# --- Page and Fragment Caching ---
+def _template_stamp():
+    folder = os.path.join(app.root_path, app.template_folder)
+    return max(os.path.getmtime(os.path.join(folder, name)) for name in os.listdir(folder))
+
+TEMPLATE_STAMP = _template_stamp()
+
+@app.after_request
+def expire_data_versions(response):
+    # Writes bump their versions in STATS; make sure this process sees them on the next request.
+    if request.method not in ('GET', 'HEAD'):
+        data_versions.expire()
+    return response
+
+def current_versions():
+    """Data versions of the database this request reads from (see get_read_db)."""
+    return data_versions.current(get_read_db, db.read_source())
+
+def page_etag(user_id, full_path, versions=None):
+    """ETag for a page that depends only on the user, the URL, the data versions and the day."""
+    versions = versions or current_versions()
+    kpi_period = int(time.time() // app.config['KPI_REFRESH_SECONDS'])
+    key = repr((TEMPLATE_STAMP, user_id, full_path, sorted(versions.items()), date.today().isoformat(), kpi_period))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def conditional_page(f):
+    """Answers a matching If-None-Match with 304 before the view runs. Pages showing flashed messages get no ETag."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if '_flashes' in session:
+            return f(*args, **kwargs)
+        etag = page_etag(current_user.id, request.full_path)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+    return decorated_function
+
+def fleet_options_key(versions):
+    return f"fleet_options:{versions['fleet']}"
+
+def render_fleet_options(trucks, drivers):
+    return (str(get_template_attribute('_fleet_options.html', 'truck_options')(trucks)),
+            str(get_template_attribute('_fleet_options.html', 'driver_options')(drivers)))
+
+def fleet_options(cursor):
+    """The truck and driver <option> lists for the booking form, rendered once per fleet version."""
+    key = fleet_options_key(current_versions())
+    options = fragment_cache.get(key)
+    if options is None:
+        cursor.execute(TRUCK_OPTIONS_SQL)
+        trucks = cursor.fetchall()
+        cursor.execute(DRIVER_OPTIONS_SQL)
+        drivers = cursor.fetchall()
+        options = render_fleet_options(trucks, drivers)
+        fragment_cache.set(key, options)
+    return options
+
+def admin_trips_key(versions, filters, after):
+    return f"admin_trips:{versions['trips']}:{versions['fleet']}:{versions['users']}:{sorted(filters.items())}:{after}"
+
+def render_trip_rows(trips):
+    return str(get_template_attribute('_admin_trips.html', 'trip_rows')(trips, TRIP_STATUSES))
+
+def admin_trip_rows(cursor, filters, after):
+    """The admin trip table rows and next-page cursor, rendered once per data version and page."""
+    key = admin_trips_key(current_versions(), filters, after)
+    page = fragment_cache.get(key)
+    if page is None:
+        trips, next_cursor = list_trips(cursor, filters, after, app.config['ADMIN_TRIPS_PER_PAGE'])
+        page = (render_trip_rows(trips), next_cursor)
+        fragment_cache.set(key, page)
+    return page
+
 # --- User Routes ---
 @app.route('/')
 @app.route('/dashboard')
 @login_required
+@conditional_page
 def dashboard():
     if current_user.role == 'admin':
         return redirect(url_for('admin_dashboard'))
 
-    conn = create_connection()
+    # Taken before reading the bookings, so the page's event stream replays anything newer.
+    events_after = status_events.last_id()
+    conn = get_read_db()
     cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("SELECT ClientID FROM CLIENT WHERE UserID = %s", (current_user.id,))
+    cursor.execute(CLIENT_ID_SQL, (current_user.id,))
     client = cursor.fetchone()
     client_id = client['ClientID'] if client else None
 
     bookings = []
     if client_id:
-        cursor.execute("SELECT * FROM TRIP WHERE ClientID = %s ORDER BY StartDate DESC", (client_id,))
+        cursor.execute(*client_trips_query(client_id))
         bookings = cursor.fetchall()
 
-    cursor.execute("SELECT TruckID, RegistrationNum, Model_Id FROM TRUCK")
-    trucks = cursor.fetchall()
-    cursor.execute("SELECT DriverID, FirstName, LastName FROM DRIVER")
-    drivers = cursor.fetchall()
+    truck_options, driver_options = fleet_options(cursor)
 
     cursor.close()
-    conn.close()
 
-    return render_template('dashboard.html', bookings=bookings, trucks=trucks, drivers=drivers)
+    return render_template('dashboard.html', bookings=bookings, events_after=events_after,
+                           truck_options=Markup(truck_options), driver_options=Markup(driver_options))
 
 @app.route('/book_trip', methods=['POST'])
 @login_required
@@ -187,108 +446,255 @@ def book_trip():
         return redirect(url_for('dashboard'))
     # --- End of New Validation ---
 
-    conn = create_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    # --- Conflict Detection Logic ---
-    # Check if the selected TRUCK is already booked during the requested dates
-    cursor.execute("""
-        SELECT TripID FROM TRIP 
-        WHERE TruckID = %s AND Status != 'Completed' AND (%s < EndDate AND %s > StartDate)
-    """, (truck_id, start_date, end_date))
-    truck_conflict = cursor.fetchone()
-
-    if truck_conflict:
-        flash(f'Booking failed. The selected truck is already booked during this period (Trip ID: {truck_conflict["TripID"]}).', 'danger')
-        cursor.close()
-        conn.close()
+    # Without a truck and driver the trip is queued for the auto-assignment run (see scheduler.py).
+    if not truck_id and not driver_id:
+        try:
+            trip_id = request_trip(get_db(), current_user.id, origin, destination, start_date, end_date)
+            search_index.sync_trip(get_db(), trip_id)
+            status_events.publish(current_user.id, trip_id, 'Requested')
+            flash('Trip requested. A truck and driver will be assigned to it shortly.', 'success')
+        except BookingError as e:
+            flash(str(e), 'danger')
         return redirect(url_for('dashboard'))
-
-    # Check if the selected DRIVER is already booked during the requested dates
-    cursor.execute("""
-        SELECT TripID FROM TRIP 
-        WHERE DriverID = %s AND Status != 'Completed' AND (%s < EndDate AND %s > StartDate)
-    """, (driver_id, start_date, end_date))
-    driver_conflict = cursor.fetchone()
-
-    if driver_conflict:
-        flash(f'Booking failed. The selected driver is already assigned to a trip during this period (Trip ID: {driver_conflict["TripID"]}).', 'danger')
-        cursor.close()
-        conn.close()
+    if not truck_id or not driver_id:
+        flash('Booking failed. Choose both a truck and a driver, or neither to have them assigned.', 'danger')
+        return redirect(url_for('dashboard'))
+    try:
+        truck_id, driver_id = int(truck_id), int(driver_id)
+    except ValueError:
+        flash('Booking failed. Invalid truck or driver.', 'danger')
         return redirect(url_for('dashboard'))
-    # --- End of Conflict Detection ---
 
-    cursor.execute("SELECT ClientID FROM CLIENT WHERE UserID = %s", (current_user.id,))
-    client = cursor.fetchone()
-    
-    if client:
-        sql = "INSERT INTO TRIP (Origin, Destination, StartDate, EndDate, Status, TruckID, DriverID, ClientID) VALUES (%s, %s, %s, %s, 'Scheduled', %s, %s, %s)"
-        val = (origin, destination, start_date, end_date, truck_id, driver_id, client['ClientID'])
-        cursor.execute(sql, val)
-        conn.commit()
+    # Conflict detection and the insert run in one locked transaction (see availability.py).
+    try:
+        trip_id = reserve_trip(get_db(), current_user.id, origin, destination, start_date, end_date, truck_id, driver_id)
+        availability_calendar.add_trip(trip_id, truck_id, driver_id, start_date, end_date)
+        search_index.sync_trip(get_db(), trip_id)
+        status_events.publish(current_user.id, trip_id, 'Scheduled')
         flash('New trip booked successfully!', 'success')
-    else:
-        flash('Could not find a client profile for your account.', 'danger')
+    except BookingError as e:
+        flash(str(e), 'danger')
 
-    cursor.close()
-    conn.close()
     return redirect(url_for('dashboard'))
 
 @app.route('/cancel_trip/<int:trip_id>', methods=['POST'])
 @login_required
 def cancel_trip(trip_id):
-    conn = create_connection()
+    conn = get_db()
     cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("SELECT c.UserID FROM TRIP t JOIN CLIENT c ON t.ClientID = c.ClientID WHERE t.TripID = %s", (trip_id,))
+    cursor.execute("SELECT c.UserID, t.Status FROM TRIP t JOIN CLIENT c ON t.ClientID = c.ClientID WHERE t.TripID = %s" + for_update(conn), (trip_id,))
     trip_owner = cursor.fetchone()
 
-    if trip_owner and trip_owner['UserID'] == current_user.id:
-        cursor.execute("DELETE FROM SHIPMENT WHERE TripID = %s", (trip_id,))
-        cursor.execute("DELETE FROM TRIP WHERE TripID = %s", (trip_id,))
+    if not trip_owner or trip_owner['UserID'] != current_user.id:
+        conn.rollback()
+        flash('You do not have permission to cancel this booking.', 'danger')
+    elif trip_owner['Status'] not in shipments.OPEN_STATUSES:
+        conn.rollback()
+        flash(f"This booking can no longer be cancelled (it is {trip_owner['Status']}).", 'danger')
+    else:
+        # Cancelled trips stay in TRIP until archive.py moves them, shipments included.
+        cursor.execute("UPDATE TRIP SET Status = 'Cancelled' WHERE TripID = %s", (trip_id,))
+        stats.record_status_change(cursor, trip_owner['Status'], 'Cancelled')
+        stats.bump_version(cursor, stats.TRIPS_VERSION)
         conn.commit()
+        availability_calendar.remove_trip(trip_id)
+        search_index.set_status([trip_id], 'Cancelled')
+        status_events.publish(current_user.id, trip_id, 'Cancelled', trip_owner['Status'])
         flash('Booking has been successfully cancelled.', 'success')
-    else:
-        flash('You do not have permission to cancel this booking.', 'danger')
 
     cursor.close()
-    conn.close()
     return redirect(url_for('dashboard'))
 
+@app.route('/api/available_resources')
+@login_required
+def available_resources():
+    try:
+        start_date = datetime.strptime(request.args.get('start_date'), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date'), '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid date format. Please use YYYY-MM-DD.'}), 400
+    if end_date <= start_date:
+        return jsonify({'error': 'End date must be after start date.'}), 400
+    min_capacity = request.args.get('min_capacity', type=int)
+
+    availability_calendar.ensure_loaded(get_db())
+    trucks, drivers = availability_calendar.available(start_date, end_date, min_capacity)
+    return jsonify({'trucks': trucks, 'drivers': drivers})
+
+@app.route('/api/trip_events')
+@login_required
+def trip_events():
+    """
+    Status changes to the current user's trips as server-sent events. Here it sends
+    what is buffered and asks the browser to reconnect in EVENTS_RETRY_MS; asgi.py
+    serves the same URL as a held-open stream.
+    """
+    after = events.parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('after'))
+    body = events.format_events(status_events.since(current_user.id, after), retry_ms=app.config['EVENTS_RETRY_MS'])
+    return Response(body, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/goods')
+@login_required
+def goods():
+    cursor = get_read_db().cursor(dictionary=True)
+    rows = shipments.list_goods(cursor)
+    cursor.close()
+    return jsonify({'goods': rows})
+
+def _shipment_owner():
+    """Clients may only touch their own trips' shipments; admins any."""
+    return None if current_user.role == 'admin' else current_user.id
+
+@app.route('/api/trips/<int:trip_id>/shipments')
+@login_required
+def trip_shipments(trip_id):
+    cursor = get_read_db().cursor(dictionary=True)
+    archived = False
+    trip = shipments.trip_load(cursor, trip_id)
+    if trip is None:
+        archived = True
+        trip = shipments.trip_load(cursor, trip_id, archived=True)
+    owner = _shipment_owner()
+    if trip is None or (owner is not None and trip['UserID'] != owner):
+        cursor.close()
+        return jsonify({'error': f'Trip {trip_id} not found.'}), 404
+    rows = shipments.list_shipments(cursor, trip_id, archived)
+    cursor.close()
+    return jsonify({'trip_id': trip_id, 'status': trip['Status'], 'archived': archived, 'load': int(trip['Loaded']),
+                    'capacity': trip['Capacity'], 'shipments': rows})
+
+@app.route('/api/trips/<int:trip_id>/shipments', methods=['POST'])
+@login_required
+def add_trip_shipments(trip_id):
+    body = request.get_json(silent=True) or {}
+    try:
+        items = shipments.parse_items(body.get('shipments'), app.config['MAX_SHIPMENTS_PER_REQUEST'])
+        result = shipments.add_shipments(get_db(), trip_id, items, _shipment_owner())
+    except shipments.ShipmentError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify(result), 201
+
+@app.route('/api/trips/<int:trip_id>/shipments/<int:shipment_id>', methods=['DELETE'])
+@login_required
+def remove_trip_shipment(trip_id, shipment_id):
+    if not shipments.remove_shipment(get_db(), trip_id, shipment_id, _shipment_owner()):
+        return jsonify({'error': f'Shipment {shipment_id} not found on an open trip {trip_id}.'}), 404
+    return jsonify({'removed': shipment_id})
+
 # --- Admin Routes ---
 @app.route('/admin')
 @login_required
 @admin_required
+@conditional_page
 def admin_dashboard():
-    conn = create_connection()
+    conn = get_read_db()
     cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("SELECT COUNT(*) as total_users FROM USERS")
-    total_users = cursor.fetchone()['total_users']
-    
-    cursor.execute("SELECT COUNT(*) as ongoing_trips FROM TRIP WHERE Status IN ('Scheduled', 'In Progress')")
-    ongoing_trips = cursor.fetchone()['ongoing_trips']
-
-    cursor.execute("""
-        SELECT t.*, c.ClientName, d.FirstName, d.LastName 
-        FROM TRIP t 
-        JOIN CLIENT c ON t.ClientID = c.ClientID 
-        JOIN DRIVER d ON t.DriverID = d.DriverID
-        ORDER BY t.StartDate DESC
-    """)
-    all_trips = cursor.fetchall()
-
-    cursor.execute("SELECT * FROM USERS ORDER BY UserID")
-    all_users_list = cursor.fetchall()
+    kpis = fleet_stats.snapshot(conn)
+
+    filters = parse_trip_filters(request.args)
+    query = (request.args.get('q') or '').strip()
+    search = None
+    if query:
+        # Search results are ranked, so they page by offset rather than by cursor.
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        total, trips = search_trips(query, filters, app.config['ADMIN_TRIPS_PER_PAGE'], offset)
+        trip_rows, next_cursor = render_trip_rows(trips), None
+        search = {'query': query, 'total': total, 'offset': offset, 'limit': app.config['ADMIN_TRIPS_PER_PAGE']}
+    else:
+        after = decode_cursor(request.args.get('after'))
+        trip_rows, next_cursor = admin_trip_rows(cursor, filters, after)
     
     cursor.close()
-    conn.close()
     
     return render_template('admin.html', 
-                           total_users=total_users, 
-                           ongoing_trips=ongoing_trips, 
-                           all_trips=all_trips, 
-                           all_users_list=all_users_list)
+                           total_users=kpis['total_users'], 
+                           ongoing_trips=kpis['ongoing_trips'], 
+                           kpis=kpis,
+                           trip_rows=Markup(trip_rows), 
+                           next_cursor=next_cursor,
+                           filters=filters,
+                           search=search,
+                           trip_statuses=TRIP_STATUSES)
+
+def load_search_index():
+    """Loads search_index in an app context of its own, so it can run on search_index's rebuild thread."""
+    with app.app_context():
+        search_index.load(get_read_db())
+
+def search_trips(query, filters, limit, offset=0):
+    search_index.ensure_loaded(load_search_index)
+    return search_index.search(query, filters, limit, offset)
+
+@app.route('/admin/search')
+@login_required
+@admin_required
+def admin_search():
+    """Ranked trip search by client, origin/destination, driver or truck; filters as on /admin."""
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'q is required.'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), app.config['SEARCH_MAX_RESULTS'])
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    started = time.perf_counter()
+    total, trips = search_trips(query, parse_trip_filters(request.args), limit, offset)
+    return jsonify({'query': query, 'total': total, 'offset': offset,
+                    'next_offset': offset + limit if offset + limit < total else None,
+                    'seconds': round(time.perf_counter() - started, 4),
+                    'results': [trip_to_json(trip) for trip in trips]})
+
+@app.route('/admin/trips.json')
+@login_required
+@admin_required
+def admin_trips_json():
+    conn = get_read_db()
+    cursor = conn.cursor(dictionary=True)
+    filters = parse_trip_filters(request.args)
+    after = decode_cursor(request.args.get('after'))
+    trips, next_cursor = list_trips(cursor, filters, after, app.config['ADMIN_TRIPS_PER_PAGE'])
+    cursor.close()
+    return jsonify({'trips': [trip_to_json(trip) for trip in trips], 'next': next_cursor})
+
+@app.route('/admin/trips/import', methods=['POST'])
+@login_required
+@admin_required
+def import_trips():
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'Upload a CSV or JSONL file in the "file" field.'}), 400
+    fmt = request.form.get('format') or ('jsonl' if upload.filename.endswith('.jsonl') else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Format must be csv or jsonl.'}), 400
+
+    # Check the encoding before anything is imported; the stream is a spooled temp file, so it can be re-read.
+    bad_line = bulk.first_undecodable_line(upload.stream)
+    if bad_line:
+        return jsonify({'error': f'Line {bad_line} is not valid UTF-8. Nothing was imported.'}), 400
+    upload.stream.seek(0)
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    report = bulk.import_trips(get_db(), stream, fmt,
+                               chunk_size=app.config['IMPORT_CHUNK_SIZE'],
+                               dry_run=request.form.get('dry_run') == '1')
+    availability_calendar.invalidate()
+    search_index.invalidate()
+    return jsonify(report)
+
+@app.route('/admin/trips/export')
+@login_required
+@admin_required
+def export_trips():
+    fmt = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    return Response(stream_with_context(bulk.export_trips(get_read_db(), fmt)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=trips.{fmt}'})
+
+def publish_status_changes(changed, new_status):
+    """Pushes lifecycle.py/scheduler.py (TripID, UserID, previous status) changes to search and owners' streams."""
+    search_index.set_status([trip_id for trip_id, _, _ in changed], new_status)
+    for trip_id, user_id, previous in changed:
+        if user_id is not None:
+            status_events.publish(user_id, trip_id, new_status, previous)
 
 # --- Add this new route for updating trip status ---
 @app.route('/admin/update_trip_status/<int:trip_id>', methods=['POST'])
@@ -296,21 +702,251 @@ def admin_dashboard():
 @admin_required
 def update_trip_status(trip_id):
     new_status = request.form.get('status')
-    valid_statuses = ['Scheduled', 'In Progress', 'Completed', 'Cancelled']
-
-    if new_status in valid_statuses:
-        conn = create_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE TRIP SET Status = %s WHERE TripID = %s", (new_status, trip_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        flash(f'Trip #{trip_id} status has been updated to "{new_status}".', 'success')
+    if new_status in TRIP_STATUSES:
+        conn = get_db()
+        report = lifecycle.set_status(conn, [trip_id], new_status)
+        if report['missing']:
+            flash(f'Trip #{trip_id} was not found.', 'danger')
+        elif report['conflicts']:
+            flash(f'Trip #{trip_id} cannot be reopened. {report["conflicts"][0]["reason"]}.', 'danger')
+        elif report['rejected']:
+            # Requested trips have no truck or driver; only the auto-assignment run schedules them.
+            flash('Requested trips are scheduled by the auto-assignment run and can only be cancelled here.', 'danger')
+        else:
+            availability_calendar.sync_trip(conn, trip_id)
+            publish_status_changes(report['changed'], new_status)
+            flash(f'Trip #{trip_id} status has been updated to "{new_status}".', 'success')
     else:
         flash('Invalid status selected.', 'danger')
 
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/trips/status', methods=['POST'])
+@login_required
+@admin_required
+def bulk_update_trip_status():
+    """Sets one status on many trips: JSON {"trip_ids": [...], "status": ...} or form fields."""
+    body = request.get_json(silent=True) or {}
+    new_status = body.get('status', request.form.get('status'))
+    trip_ids = body.get('trip_ids', request.form.getlist('trip_ids'))
+    if new_status not in TRIP_STATUSES:
+        return jsonify({'error': f'status must be one of {", ".join(TRIP_STATUSES)}.'}), 400
+    try:
+        trip_ids = [int(trip_id) for trip_id in trip_ids]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'trip_ids must be a list of integers.'}), 400
+    max_trips = app.config['MAX_STATUS_UPDATES_PER_REQUEST']
+    if not trip_ids or len(trip_ids) > max_trips:
+        return jsonify({'error': f'Send between 1 and {max_trips} trip_ids.'}), 400
+
+    report = lifecycle.set_status(get_db(), trip_ids, new_status)
+    if report['changed']:
+        availability_calendar.invalidate()
+        publish_status_changes(report['changed'], new_status)
+    report['changed'] = [trip_id for trip_id, _, _ in report['changed']]
+    return jsonify(report)
+
+@app.route('/admin/lifecycle', methods=['POST'])
+@login_required
+@admin_required
+def admin_lifecycle():
+    dry_run = request.values.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    return jsonify(lifecycle.advance(get_db(), chunk_size=app.config['LIFECYCLE_CHUNK_SIZE'], dry_run=dry_run,
+                                     on_change=publish_status_changes))
+
+@app.route('/admin/plan')
+@login_required
+@admin_required
+def admin_plan():
+    filters = parse_trip_filters(request.args)
+    date_from = filters.get('date_from', date.today())
+    date_to = filters.get('date_to', date_from + timedelta(days=app.config['PLAN_DEFAULT_DAYS']))
+    conn = get_read_db()
+    cursor = conn.cursor(dictionary=True)
+    bookings = planning.load_pending(cursor, date_from, date_to)
+    trucks = planning.load_trucks(cursor)
+    cursor.close()
+    cursor = conn.cursor()
+    busy = planning.load_truck_busy(cursor, trucks, bookings)
+    cursor.close()
+    return jsonify(planning.plan(bookings, trucks, planning.distance_matrix(app.config['DISTANCE_MATRIX_PATH']), busy))
+
+@app.route('/admin/assign', methods=['POST'])
+@login_required
+@admin_required
+def admin_assign():
+    filters = parse_trip_filters(request.values)
+    dry_run = request.values.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    report = scheduler.assign_requests(get_db(), filters.get('date_from'), filters.get('date_to'), dry_run,
+                                       app.config['ASSIGN_CHUNK_SIZE'], on_change=publish_status_changes)
+    if not dry_run:
+        availability_calendar.invalidate()
+        search_index.invalidate()
+    return jsonify(report)
+
+@app.route('/admin/archive', methods=['POST'])
+@login_required
+@admin_required
+def admin_archive():
+    dry_run = request.values.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    horizon_days = request.values.get('horizon_days', app.config['ARCHIVE_HORIZON_DAYS'], type=int)
+    if horizon_days < 1:
+        return jsonify({'error': 'horizon_days must be at least 1.'}), 400
+    report = archive.archive_trips(get_db(), horizon_days, app.config['ARCHIVE_BATCH_SIZE'], dry_run)
+    if report['trips']:
+        search_index.invalidate()
+    return jsonify(report)
+
+def report_data(name, start, end):
+    """A report's (columns, rows), cached per period until trips or the fleet change."""
+    versions = current_versions()
+    key = f"report:{name}:{start}:{end}:{versions['trips']}:{versions['fleet']}"
+    data = fragment_cache.get(key)
+    if data is None:
+        data = reports.REPORTS[name](get_read_db(), start, end)
+        fragment_cache.set(key, data)
+    return data
+
+@app.route('/admin/reports')
+@login_required
+@admin_required
+def admin_reports():
+    return jsonify({'reports': sorted(reports.REPORTS)})
+
+@app.route('/admin/reports/<name>')
+@login_required
+@admin_required
+def admin_report(name):
+    if name not in reports.REPORTS:
+        return jsonify({'error': f"Unknown report '{name}'."}), 404
+    # The period is [date_from, date_to] by trip start date; the default is the last twelve months.
+    filters = parse_trip_filters(request.args)
+    start, end = reports.default_period()
+    start = filters.get('date_from', start)
+    end = filters['date_to'] + timedelta(days=1) if 'date_to' in filters else end
+    if end <= start:
+        return jsonify({'error': 'date_to must not be before date_from.'}), 400
+    columns, rows = report_data(name, start, end)
+
+    fmt = request.args.get('format', 'json')
+    filename = f'{name}_{start}_{end - timedelta(days=1)}'
+    if fmt == 'csv':
+        return Response(reports.to_csv(columns, rows), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}.csv'})
+    if fmt == 'parquet':
+        try:
+            body = reports.to_parquet(columns, rows)
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 501
+        return Response(body, mimetype='application/vnd.apache.parquet',
+                        headers={'Content-Disposition': f'attachment; filename={filename}.parquet'})
+    return jsonify({'report': name, 'date_from': start.isoformat(), 'date_to': (end - timedelta(days=1)).isoformat(),
+                    'columns': columns, 'rows': rows})
+
+@app.route('/admin/maintenance')
+@login_required
+@admin_required
+def admin_maintenance():
+    filters = parse_trip_filters(request.args)
+    cursor = get_read_db().cursor(dictionary=True)
+    windows = list_maintenance(cursor, request.args.get('truck_id', type=int), filters.get('date_from'))
+    cursor.close()
+    return jsonify({'maintenance': [trip_to_json(window) for window in windows]})
+
+@app.route('/admin/maintenance', methods=['POST'])
+@login_required
+@admin_required
+def admin_schedule_maintenance():
+    truck_id = request.values.get('truck_id', type=int)
+    if not truck_id:
+        return jsonify({'error': 'truck_id is required.'}), 400
+    # The window is [start_date, end_date); end_date defaults to start_date + duration_days (1).
+    try:
+        start_date = datetime.strptime(request.values.get('start_date', ''), '%Y-%m-%d').date()
+        if request.values.get('end_date'):
+            end_date = datetime.strptime(request.values['end_date'], '%Y-%m-%d').date()
+        else:
+            end_date = start_date + timedelta(days=request.values.get('duration_days', 1, type=int))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Please use YYYY-MM-DD.'}), 400
+    if end_date <= start_date:
+        return jsonify({'error': 'End date must be after start date.'}), 400
+    description = (request.values.get('description') or '').strip()[:255] or None
+
+    try:
+        maintenance_id = schedule_maintenance(get_db(), truck_id, start_date, end_date, description)
+    except BookingError as e:
+        return jsonify({'error': str(e)}), 409
+    availability_calendar.add_maintenance(maintenance_id, truck_id, start_date, end_date)
+    return jsonify(trip_to_json({'MaintenanceID': maintenance_id, 'TruckID': truck_id, 'MaintenanceDate': start_date,
+                                 'EndDate': end_date, 'Description': description})), 201
+
+@app.route('/admin/maintenance/<int:maintenance_id>', methods=['DELETE'])
+@login_required
+@admin_required
+def admin_cancel_maintenance(maintenance_id):
+    if cancel_maintenance(get_db(), maintenance_id) is None:
+        return jsonify({'error': f'Maintenance {maintenance_id} not found.'}), 404
+    availability_calendar.remove_maintenance(maintenance_id)
+    return jsonify({'cancelled': maintenance_id})
+
+@app.route('/admin/goods', methods=['POST'])
+@login_required
+@admin_required
+def admin_add_goods():
+    body = request.get_json(silent=True) or {}
+    items = body.get('goods') if isinstance(body.get('goods'), list) else [request.form]
+    goods = [((item.get('name') or '').strip()[:100], (item.get('type') or '').strip()[:100]) for item in items]
+    if not goods or not all(name for name, _ in goods):
+        return jsonify({'error': 'Every goods entry needs a name.'}), 400
+    return jsonify({'added': shipments.add_goods(get_db(), goods)}), 201
+
+@app.route('/admin/pool_stats')
+@login_required
+@admin_required
+def pool_stats():
+    replicas = db.get_replicas()
+    return jsonify({**db.get_pool().stats(), 'replicas': replicas.stats() if replicas else None})
+
+@app.route('/admin/slow_queries')
+@login_required
+@admin_required
+def slow_queries():
+    return jsonify(list(reversed(instrumentation.recent_slow_queries)))
+
+@app.route('/metrics')
+def metrics():
+    gauges = {f'tms_db_pool_{name}': value for name, value in db.get_pool().stats().items()}
+    replicas = db.get_replicas()
+    if replicas:
+        gauges['tms_db_replica_fallbacks'] = replicas.fallbacks
+        gauges.update({f'tms_db_replica{i}_reads': reads for i, reads in enumerate(replicas.stats()['reads'])})
+    gauges.update({f'tms_user_cache_{name}': value for name, value in user_cache.stats().items()})
+    gauges.update({f'tms_fragment_cache_{name}': value for name, value in fragment_cache.stats().items()})
+    gauges.update({f'tms_trip_events_{name}': value for name, value in status_events.stats().items()})
+    gauges.update({f'tms_password_hasher_{name}': value for name, value in password_hasher.stats().items()})
+    gauges['tms_login_throttled_total'] = login_throttle.blocked_attempts
+    return Response(instrumentation.metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/kpis')
+@login_required
+@admin_required
+def admin_kpis():
+    return jsonify(fleet_stats.snapshot(get_read_db()))
+
+@app.route('/admin/kpis/reconcile', methods=['POST'])
+@login_required
+@admin_required
+def reconcile_kpis():
+    drift = fleet_stats.reconcile(get_db())
+    return jsonify({'drift': {name: {'was': was, 'now': now} for name, (was, now) in drift.items()}})
+
+@app.route('/admin/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify({'users': user_cache.stats(), 'fragments': fragment_cache.stats(), 'data_versions': data_versions.cached()})
+
 
 if __name__ == '__main__':
     app.run(debug=True)
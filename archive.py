@@ -0,0 +1,112 @@
+"""
+Moves finished trips out of the hot TRIP table.
+
+    python archive.py [--horizon-days 365] [--batch-size 1000] [--dry-run]
+
+Completed and Cancelled trips that ended more than the horizon ago are copied,
+with their shipments, to TRIP_ARCHIVE / SHIPMENT_ARCHIVE and deleted from TRIP
+(SHIPMENT rows follow by cascade). Each batch is one transaction, so a trip is
+always in exactly one of the two tables. Listings and exports read through to
+the archive (see trips.list_trips), and the STATS trip counters keep counting
+archived trips, so moving them changes no totals.
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import date, timedelta
+
+import stats
+from db import for_update, is_sqlite
+from trips import ARCHIVED_STATUSES
+
+TRIP_COLUMNS = ['TripID', 'Origin', 'Destination', 'StartDate', 'EndDate', 'Status', 'TruckID', 'DriverID', 'ClientID']
+SHIPMENT_COLUMNS = ['ShipmentID', 'TripID', 'GoodsID', 'Quantity']
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _due_filter():
+    # StartDate < cutoff is implied by EndDate < cutoff; it lets (Status, StartDate) drive the scan.
+    return f"Status IN ({_placeholders(ARCHIVED_STATUSES)}) AND StartDate < %s AND EndDate < %s"
+
+
+def count_due(cursor, cutoff):
+    cursor.execute(f"SELECT COUNT(*) FROM TRIP WHERE {_due_filter()}", [*ARCHIVED_STATUSES, cutoff, cutoff])
+    return cursor.fetchone()[0]
+
+
+def archive_batch(conn, cutoff, batch_size):
+    """Moves up to `batch_size` trips that ended before `cutoff`. Returns (trips, shipments) moved."""
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        if is_sqlite(conn):
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f"SELECT TripID FROM TRIP WHERE {_due_filter()} LIMIT %s" + for_update(conn),
+                       [*ARCHIVED_STATUSES, cutoff, cutoff, batch_size])
+        trip_ids = [row[0] for row in cursor.fetchall()]
+        if not trip_ids:
+            conn.rollback()
+            return 0, 0
+
+        in_batch = f"TripID IN ({_placeholders(trip_ids)})"
+        columns = ', '.join(TRIP_COLUMNS)
+        cursor.execute(f"INSERT INTO TRIP_ARCHIVE ({columns}) SELECT {columns} FROM TRIP WHERE {in_batch}", trip_ids)
+        columns = ', '.join(SHIPMENT_COLUMNS)
+        cursor.execute(f"INSERT INTO SHIPMENT_ARCHIVE ({columns}) SELECT {columns} FROM SHIPMENT WHERE {in_batch}", trip_ids)
+        shipments = cursor.rowcount
+        cursor.execute(f"DELETE FROM TRIP WHERE {in_batch}", trip_ids)
+        stats.bump_version(cursor, stats.TRIPS_VERSION)
+        conn.commit()
+        return len(trip_ids), shipments
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def archive_trips(conn, horizon_days=365, batch_size=1000, dry_run=False):
+    """Archives every finished trip that ended more than `horizon_days` ago. Returns a report."""
+    started = time.perf_counter()
+    cutoff = date.today() - timedelta(days=horizon_days)
+    report = {'dry_run': dry_run, 'cutoff': cutoff.isoformat(), 'trips': 0, 'shipments': 0, 'batches': 0}
+    if dry_run:
+        cursor = conn.cursor()
+        report['trips'] = count_due(cursor, cutoff)
+        cursor.close()
+        conn.rollback()
+    else:
+        while True:
+            trips, shipments = archive_batch(conn, cutoff, batch_size)
+            if not trips:
+                break
+            report['trips'] += trips
+            report['shipments'] += shipments
+            report['batches'] += 1
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+# --- CLI ---
+def main(argv=None):
+    from app import app
+    from db import get_db
+
+    parser = argparse.ArgumentParser(description='Move finished trips to the archive tables.')
+    parser.add_argument('--horizon-days', type=int, default=app.config['ARCHIVE_HORIZON_DAYS'])
+    parser.add_argument('--batch-size', type=int, default=app.config['ARCHIVE_BATCH_SIZE'])
+    parser.add_argument('--dry-run', action='store_true', help='Only count the trips that would move')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        report = archive_trips(get_db(), args.horizon_days, args.batch_size, args.dry_run)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
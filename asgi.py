@@ -0,0 +1,593 @@
+"""
+ASGI serving mode.
+
+    uvicorn asgi:application --workers 4
+
+The read-heavy pages run natively on the event loop: dashboard, the admin
+dashboard, /admin/trips.json and /api/available_resources. Their queries go
+through an async MySQL pool (aiomysql), and independent lookups are issued
+concurrently, e.g. the dashboard's bookings, trucks and drivers. A slow
+client or query then only holds a coroutine, not a thread. /api/trip_events
+is held open as a server-sent event stream (see events.py), so thousands of
+idle browsers cost suspended coroutines rather than threads. They share
+templates, cached fragments and page ETags with app.py, and fall back to it
+whenever they would need to change the session (flash messages, login
+redirects).
+
+Every other route (login, register, bookings, admin writes, import/export)
+runs the regular Flask app in a thread pool, so behaviour is identical.
+
+With DB_BACKEND = 'sqlite', or if aiomysql isn't installed, the native pages
+run their queries on the regular connection pool in worker threads instead.
+Their reads follow the same replica routing and read-your-writes pin as the
+Flask routes (see db.py).
+
+The native pages share their SQL with app.py (see trips.py) and are
+instrumented like the Flask routes: each statement is timed into a per-request
+profile, so /metrics, the X-DB-Queries / X-DB-Time-ms / Server-Timing headers
+and the slow query log cover them too (see instrumentation.py).
+"""
+import asyncio
+import contextvars
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from flask import g, render_template
+from markupsafe import Markup
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+
+import app as webapp
+import db
+import events
+import instrumentation
+import stats
+from trips import (CLIENT_ID_SQL, DRIVER_OPTIONS_SQL, TRIP_STATUSES, TRUCK_OPTIONS_SQL, USER_SQL, client_trips_query,
+                   decode_cursor, merge_pages, parse_trip_filters, trip_page_queries, trip_to_json)
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+flask_app = webapp.app
+
+# The RequestProfile of the native route being served; tasks started by the route share it.
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+# --- Async Database Access ---
+def record_query(sql, params, elapsed, rows):
+    """Records a statement in the current request's profile. Call it on the event loop."""
+    instrumentation.record_statement(flask_app, current_profile.get(), sql, params, elapsed, rows)
+
+
+class AioMySQLDatabase:
+    def __init__(self, config, size):
+        self._config = config
+        self._size = size
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    async def _get_pool(self):
+        async with self._lock:
+            if self._pool is None:
+                self._pool = await aiomysql.create_pool(
+                    host=self._config['host'], user=self._config['user'], password=self._config['password'],
+                    db=self._config['database'], minsize=1, maxsize=self._size, autocommit=True)
+        return self._pool
+
+    async def fetchall(self, sql, params=()):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                started = time.perf_counter()
+                await cursor.execute(sql, params)
+                rows = list(await cursor.fetchall())
+                record_query(sql, params, time.perf_counter() - started, len(rows))
+                return rows
+
+    async def fetchone(self, sql, params=()):
+        rows = await self.fetchall(sql, params)
+        return rows[0] if rows else None
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+
+
+class ThreadedDatabase:
+    """Runs queries on the app's regular connection pool (or replica `replica`'s) in worker threads."""
+
+    def __init__(self, executor, replica=None):
+        self._executor = executor
+        self._replica = replica
+
+    def _query(self, sql, params, one):
+        with flask_app.app_context():
+            pool = db.get_pool() if self._replica is None else db.get_replicas().pools[self._replica]
+            conn = pool.acquire()
+            try:
+                # The raw connection: the statement is recorded once, by record_query() on the event loop.
+                cursor = getattr(conn, 'raw', conn).cursor(dictionary=True)
+                started = time.perf_counter()
+                cursor.execute(sql, params)
+                result = cursor.fetchone() if one else cursor.fetchall()
+                elapsed = time.perf_counter() - started
+                cursor.close()
+                return result, elapsed
+            finally:
+                pool.release(conn)
+
+    async def _run(self, sql, params, one):
+        result, elapsed = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._query, sql, params, one)
+        record_query(sql, params, elapsed, (result is not None) if one else len(result))
+        return result
+
+    async def fetchall(self, sql, params=()):
+        return await self._run(sql, params, False)
+
+    async def fetchone(self, sql, params=()):
+        return await self._run(sql, params, True)
+
+    async def close(self):
+        pass
+
+
+# --- Requests and Responses ---
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'').decode('latin-1')
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.headers = [(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope.get('headers', [])]
+        cookie = SimpleCookie()
+        for name, value in self.headers:
+            if name.lower() == 'cookie':
+                cookie.load(value)
+        self.cookies = {key: morsel.value for key, morsel in cookie.items()}
+        self.session = self._load_session()
+        # Same form as Flask's request.full_path, so page ETags match between both paths.
+        self.full_path = f'{self.path}?{self.query_string}'
+        self.if_none_match = parse_etags(next((v for k, v in self.headers if k.lower() == 'if-none-match'), None))
+        self.reads = None  # (database, source) once AsyncApp.read_db() has picked one
+
+    def _load_session(self):
+        token = self.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+        serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        if not token or serializer is None:
+            return {}
+        try:
+            return serializer.loads(token, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return {}
+
+
+async def send_response(send, status, body, content_type, headers=()):
+    headers = [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())] + [
+        (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def page_headers(etag):
+    return [('etag', f'"{etag}"'), ('cache-control', 'private, no-cache'), ('vary', 'Cookie')]
+
+
+def html(body, etag):
+    return 200, body.encode('utf-8'), 'text/html; charset=utf-8', page_headers(etag)
+
+
+def not_modified(etag):
+    return 304, b'', 'text/html; charset=utf-8', page_headers(etag)
+
+
+def json_response(data, status=200):
+    return status, flask_app.json.dumps(data).encode('utf-8'), 'application/json'
+
+
+# --- WSGI Fallback ---
+class WSGIBridge:
+    """Runs the Flask app for a request in a worker thread, streaming its response body back."""
+
+    def __init__(self, wsgi_app, executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'CONTENT_LENGTH':
+                environ['CONTENT_LENGTH'] = value
+            else:
+                key = 'HTTP_' + name
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    async def __call__(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        environ = self._environ(scope, io.BytesIO(b''.join(chunks)))
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+        loop = asyncio.get_running_loop()
+        # Each step may land on a different worker thread. Running them all in one context keeps
+        # the contextvars Flask pushes (e.g. stream_with_context) visible where they are popped.
+        context = contextvars.copy_context()
+        result = await loop.run_in_executor(self.executor, context.run, self.wsgi_app, environ, start_response)
+        iterator = iter(result)
+        try:
+            first = await loop.run_in_executor(self.executor, context.run, next, iterator, None)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            chunk = first
+            while chunk is not None:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.executor, context.run, next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, context.run, result.close)
+
+
+# --- Application ---
+class AsyncApp:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(flask_app.config['ASGI_THREADS'])
+        self.wsgi = WSGIBridge(flask_app.wsgi_app, self.executor)
+        self.db = None
+        self.replica_dbs = {}
+        self.routes = {
+            ('GET', '/'): self.dashboard,
+            ('GET', '/dashboard'): self.dashboard,
+            ('GET', '/admin'): self.admin_dashboard,
+            ('GET', '/admin/trips.json'): self.admin_trips_json,
+            ('GET', '/api/available_resources'): self.available_resources,
+        }
+        # Flask's endpoint names for the native routes, so their metrics line up with app.py's.
+        urls = flask_app.url_map.bind('localhost')
+        self.endpoints = {(method, path): urls.match(path, method)[0] for method, path in self.routes}
+        # Handlers that write their own (streamed) response; they return False to defer to Flask.
+        self.streams = {
+            ('GET', '/api/trip_events'): self.trip_events,
+        }
+
+    def _use_aiomysql(self):
+        return aiomysql is not None and flask_app.config.get('DB_BACKEND', 'mysql') == 'mysql'
+
+    def _get_db(self):
+        if self.db is None:
+            if self._use_aiomysql():
+                self.db = AioMySQLDatabase(webapp.db_config, flask_app.config['ASYNC_DB_POOL_SIZE'])
+            else:
+                self.db = ThreadedDatabase(self.executor)
+        return self.db
+
+    def _replica_db(self, index):
+        if index not in self.replica_dbs:
+            if self._use_aiomysql():
+                config = {**webapp.db_config, **flask_app.config['DB_REPLICAS'][index]}
+                self.replica_dbs[index] = AioMySQLDatabase(config, flask_app.config['ASYNC_DB_POOL_SIZE'])
+            else:
+                self.replica_dbs[index] = ThreadedDatabase(self.executor, index)
+        return self.replica_dbs[index]
+
+    async def read_db(self, request):
+        """(database, source) for the request's reads, like db.get_read_db(): a fit replica or the primary."""
+        if request.reads is None:
+            index = None
+            if flask_app.config['DB_REPLICAS'] and not db.pinned_to_primary(request.session):
+                # A due lag check queries the replica, so choose off the event loop.
+                def choose():
+                    with flask_app.app_context():
+                        return db.choose_replica(request.session)
+                index = await asyncio.get_running_loop().run_in_executor(self.executor, choose)
+            if index is None:
+                request.reads = (self._get_db(), 'primary')
+            else:
+                request.reads = (self._replica_db(index), f'replica{index}')
+        return request.reads
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        stream = self.streams.get((scope['method'], scope['path']))
+        if stream is not None and await stream(Request(scope), receive, send):
+            return
+        route = (scope['method'], scope['path'])
+        handler = self.routes.get(route)
+        if handler is not None:
+            request = Request(scope)
+            profile = instrumentation.RequestProfile()
+            token = current_profile.set(profile)
+            try:
+                response = await handler(request)
+            finally:
+                current_profile.reset(token)
+            if response is not None:
+                status, body, content_type, *headers = response
+                timing = await self.finish_profile(profile, self.endpoints[route], request.path)
+                await send_response(send, status, body, content_type, [*(headers[0] if headers else ()), *timing])
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def finish_profile(self, profile, endpoint, path):
+        """instrumentation.finish_request() for a native route; slow statements get EXPLAINed off the loop."""
+        if profile.slow and flask_app.config.get('SLOW_QUERY_EXPLAIN'):
+            return await self.run_sync(lambda conn: instrumentation.finish_request(flask_app, profile, endpoint, path, conn))
+        return instrumentation.finish_request(flask_app, profile, endpoint, path)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._get_db()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for database in [self.db, *self.replica_dbs.values()]:
+                    if database is not None:
+                        await database.close()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run_sync(self, fn, *args):
+        """
+        Runs fn(conn, *args) in a worker thread with a pooled connection (app
+        context included). Its statements count towards the current request.
+        """
+        def call():
+            with flask_app.app_context():
+                g._db_profile = instrumentation.RequestProfile()
+                return fn(db.get_db(), *args), g._db_profile
+
+        result, profile = await asyncio.get_running_loop().run_in_executor(self.executor, call)
+        if current_profile.get() is not None:
+            current_profile.get().merge(profile)
+        return result
+
+    # --- Auth ---
+    async def current_user(self, request):
+        """The logged-in user from the session cookie, or None (Flask then handles the redirect)."""
+        user_id = request.session.get('_user_id')
+        if not user_id:
+            return None
+        cached = webapp.user_cache.get(str(user_id))
+        if cached:
+            return webapp.User(id=cached[0], username=cached[1], role=cached[2])
+        database, _ = await self.read_db(request)
+        user_data = await database.fetchone(USER_SQL, (user_id,))
+        if not user_data:
+            return None
+        webapp.cache_user(user_data)
+        return webapp.User(id=user_data['UserID'], username=user_data['Username'], role=user_data['Role'])
+
+    async def data_versions(self, request):
+        """Data versions of the database the request reads from."""
+        database, source = await self.read_db(request)
+        return (webapp.data_versions.cached(source) or
+                webapp.data_versions.remember(await database.fetchall(stats.VERSIONS_SQL, stats.VERSIONS), source))
+
+    async def trip_page(self, request, filters, after, limit):
+        """One admin trip page; the hot and archive tables are queried concurrently."""
+        database, _ = await self.read_db(request)
+        rows = await asyncio.gather(*(database.fetchall(sql, params)
+                                      for sql, params in trip_page_queries(filters, after, limit)))
+        return merge_pages(rows, limit)
+
+    def render(self, request, user, template, build_fragments=None, **context):
+        """Renders inside a request context for `user`. build_fragments() runs there too and adds to the context."""
+        with flask_app.test_request_context(request.path, query_string=request.query_string,
+                                            headers=request.headers):
+            g._login_user = user
+            if build_fragments is not None:
+                context.update(build_fragments())
+            return render_template(template, **context)
+
+    # --- Native Routes ---
+    async def dashboard(self, request):
+        user = await self.current_user(request)
+        if user is None or user.role == 'admin' or request.session.get('_flashes'):
+            return None
+        events_after = webapp.status_events.last_id()
+        versions = await self.data_versions(request)
+        etag = webapp.page_etag(user.id, request.full_path, versions)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        database, _ = await self.read_db(request)
+        options_key = webapp.fleet_options_key(versions)
+        options = webapp.fragment_cache.get(options_key)
+
+        async def client_bookings():
+            client = await database.fetchone(CLIENT_ID_SQL, (user.id,))
+            if not client:
+                return []
+            return await database.fetchall(*client_trips_query(client['ClientID']))
+
+        async def fleet():
+            if options is not None:
+                return None
+            return await asyncio.gather(
+                database.fetchall(TRUCK_OPTIONS_SQL),
+                database.fetchall(DRIVER_OPTIONS_SQL),
+            )
+
+        bookings, fleet_rows = await asyncio.gather(client_bookings(), fleet())
+
+        def fragments():
+            rendered = options
+            if rendered is None:
+                rendered = webapp.render_fleet_options(*fleet_rows)
+                webapp.fragment_cache.set(options_key, rendered)
+            return {'truck_options': Markup(rendered[0]), 'driver_options': Markup(rendered[1])}
+
+        return html(self.render(request, user, 'dashboard.html', fragments, bookings=bookings,
+                                events_after=events_after), etag)
+
+    async def admin_dashboard(self, request):
+        user = await self.current_user(request)
+        # Searches (?q=) are served by Flask from the in-memory index (see search.py).
+        if user is None or user.role != 'admin' or request.session.get('_flashes') or request.args.get('q'):
+            return None
+        versions = await self.data_versions(request)
+        etag = webapp.page_etag(user.id, request.full_path, versions)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        filters = parse_trip_filters(request.args)
+        after = decode_cursor(request.args.get('after'))
+        limit = flask_app.config['ADMIN_TRIPS_PER_PAGE']
+        rows_key = webapp.admin_trips_key(versions, filters, after)
+        page = webapp.fragment_cache.get(rows_key)
+
+        async def trip_page():
+            if page is not None:
+                return None
+            return await self.trip_page(request, filters, after, limit)
+
+        kpis, rows = await asyncio.gather(self.run_sync(webapp.fleet_stats.snapshot), trip_page())
+        if page is None:
+            trips, next_cursor = rows
+        else:
+            next_cursor = page[1]
+
+        def fragments():
+            rendered = page
+            if rendered is None:
+                rendered = (webapp.render_trip_rows(trips), next_cursor)
+                webapp.fragment_cache.set(rows_key, rendered)
+            return {'trip_rows': Markup(rendered[0])}
+
+        return html(self.render(request, user, 'admin.html', fragments,
+                                total_users=kpis['total_users'],
+                                ongoing_trips=kpis['ongoing_trips'],
+                                kpis=kpis,
+                                next_cursor=next_cursor,
+                                filters=filters,
+                                trip_statuses=TRIP_STATUSES), etag)
+
+    async def admin_trips_json(self, request):
+        user = await self.current_user(request)
+        if user is None or user.role != 'admin':
+            return None
+        filters = parse_trip_filters(request.args)
+        after = decode_cursor(request.args.get('after'))
+        limit = flask_app.config['ADMIN_TRIPS_PER_PAGE']
+        trips, next_cursor = await self.trip_page(request, filters, after, limit)
+        return json_response({'trips': [trip_to_json(trip) for trip in trips], 'next': next_cursor})
+
+    async def available_resources(self, request):
+        user = await self.current_user(request)
+        if user is None:
+            return None
+        try:
+            start_date = datetime.strptime(request.args.get('start_date'), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.args.get('end_date'), '%Y-%m-%d').date()
+        except (ValueError, TypeError):
+            return json_response({'error': 'Invalid date format. Please use YYYY-MM-DD.'}, 400)
+        if end_date <= start_date:
+            return json_response({'error': 'End date must be after start date.'}, 400)
+        min_capacity = request.args.get('min_capacity', type=int)
+
+        await self.run_sync(webapp.availability_calendar.ensure_loaded)
+        trucks, drivers = webapp.availability_calendar.available(start_date, end_date, min_capacity)
+        return json_response({'trucks': trucks, 'drivers': drivers})
+
+    # --- Streams ---
+    async def trip_events(self, request, receive, send):
+        """Streams the user's trip status changes until the client goes away."""
+        user = await self.current_user(request)
+        if user is None:
+            return False
+        headers = dict((k.lower(), v) for k, v in request.headers)
+        last_sent = events.parse_event_id(headers.get('last-event-id') or request.args.get('after'))
+        # Subscribe before reading the backlog, so nothing published in between is lost.
+        queue = webapp.status_events.subscribe(user.id, asyncio.get_running_loop())
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no')]})
+            backlog = webapp.status_events.since(user.id, last_sent)
+            await self._send_events(send, backlog, retry_ms=flask_app.config['EVENTS_RETRY_MS'])
+            if backlog:
+                last_sent = backlog[-1][0]
+            heartbeat = flask_app.config['EVENTS_HEARTBEAT_SECONDS']
+            while not disconnected.done():
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, disconnected}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    if not disconnected.done():
+                        await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                    continue
+                item = getter.result()
+                if item is None:
+                    # The queue overflowed; the page reloads and reconnects.
+                    await self._send_events(send, [None])
+                    break
+                if last_sent is not None and item[0] <= last_sent:
+                    continue
+                await self._send_events(send, [item])
+                last_sent = item[0]
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            pass  # the client went away mid-write
+        finally:
+            webapp.status_events.unsubscribe(user.id, queue)
+            disconnected.cancel()
+        return True
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    async def _send_events(send, items, retry_ms=None):
+        await send({'type': 'http.response.body', 'body': events.format_events(items, retry_ms).encode('utf-8'),
+                    'more_body': True})
+
+application = AsyncApp()
@@ -0,0 +1,403 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+import stats
+from db import for_update, is_sqlite
+from trips import ACTIVE_TRIP_FILTER, INACTIVE_STATUSES
+
+
+class BookingError(Exception):
+    pass
+
+
+# --- Conflict Detection ---
+def find_conflicts(cursor, truck_id, driver_id, start_date, end_date):
+    """
+    Checks the truck (trips and maintenance windows) and the driver in one round
+    trip. Returns a dict with the first overlapping TripID for 'truck' and
+    'driver' and MaintenanceID for 'maintenance' (None when free). Each subquery
+    is a range scan on the (TruckID, EndDate, StartDate) / (DriverID, EndDate,
+    StartDate) / (TruckID, EndDate, MaintenanceDate) indexes, so finished
+    history is skipped.
+    """
+    cursor.execute(f"""
+        SELECT
+            (SELECT TripID FROM TRIP
+             WHERE TruckID = %s AND EndDate > %s AND StartDate < %s AND {ACTIVE_TRIP_FILTER}
+             LIMIT 1) AS TruckConflict,
+            (SELECT TripID FROM TRIP
+             WHERE DriverID = %s AND EndDate > %s AND StartDate < %s AND {ACTIVE_TRIP_FILTER}
+             LIMIT 1) AS DriverConflict,
+            (SELECT MaintenanceID FROM MAINTENANCE
+             WHERE TruckID = %s AND EndDate > %s AND MaintenanceDate < %s
+             LIMIT 1) AS MaintenanceConflict
+    """, (truck_id, start_date, end_date, driver_id, start_date, end_date, truck_id, start_date, end_date))
+    row = cursor.fetchone()
+    if isinstance(row, dict):
+        return {'truck': row['TruckConflict'], 'driver': row['DriverConflict'], 'maintenance': row['MaintenanceConflict']}
+    return {'truck': row[0], 'driver': row[1], 'maintenance': row[2]}
+
+
+def lock_resources(conn, cursor, truck_id, driver_id):
+    """
+    Locks the truck and driver rows for the rest of the transaction so concurrent
+    bookings of the same resources are serialized. Always locks truck before driver
+    to avoid deadlocks. Returns (truck_exists, driver_exists).
+    """
+    if is_sqlite(conn):
+        # SQLite has no row locks; take the database write lock up front instead.
+        cursor.execute("BEGIN IMMEDIATE")
+
+    cursor.execute("SELECT TruckID FROM TRUCK WHERE TruckID = %s" + for_update(conn), (truck_id,))
+    truck = cursor.fetchone()
+    cursor.execute("SELECT DriverID FROM DRIVER WHERE DriverID = %s" + for_update(conn), (driver_id,))
+    driver = cursor.fetchone()
+    return truck is not None, driver is not None
+
+
+# --- Reservation ---
+def reserve_trip(conn, user_id, origin, destination, start_date, end_date, truck_id, driver_id):
+    """
+    Books a trip for the client owned by `user_id` as a single transaction:
+    lock truck + driver, check for overlaps, insert. Returns the new TripID or
+    raises BookingError with a user-facing message.
+    """
+    # Start a fresh transaction so the conflict check sees everything committed before our locks.
+    conn.rollback()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        truck_exists, driver_exists = lock_resources(conn, cursor, truck_id, driver_id)
+        if not truck_exists:
+            raise BookingError('Booking failed. The selected truck does not exist.')
+        if not driver_exists:
+            raise BookingError('Booking failed. The selected driver does not exist.')
+
+        conflicts = find_conflicts(cursor, truck_id, driver_id, start_date, end_date)
+        if conflicts['truck']:
+            raise BookingError(f'Booking failed. The selected truck is already booked during this period (Trip ID: {conflicts["truck"]}).')
+        if conflicts['maintenance']:
+            raise BookingError(f'Booking failed. The selected truck is scheduled for maintenance during this period (Maintenance ID: {conflicts["maintenance"]}).')
+        if conflicts['driver']:
+            raise BookingError(f'Booking failed. The selected driver is already assigned to a trip during this period (Trip ID: {conflicts["driver"]}).')
+
+        # Resolve the client inside the INSERT instead of a separate lookup.
+        cursor.execute("""
+            INSERT INTO TRIP (Origin, Destination, StartDate, EndDate, Status, TruckID, DriverID, ClientID)
+            SELECT %s, %s, %s, %s, 'Scheduled', %s, %s, ClientID FROM CLIENT WHERE UserID = %s
+        """, (origin, destination, start_date, end_date, truck_id, driver_id, user_id))
+        if cursor.rowcount == 0:
+            raise BookingError('Could not find a client profile for your account.')
+        trip_id = cursor.lastrowid
+        stats.bump(cursor, stats.trip_stat('Scheduled'))
+        stats.bump_version(cursor, stats.TRIPS_VERSION)
+        conn.commit()
+        return trip_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def request_trip(conn, user_id, origin, destination, start_date, end_date):
+    """
+    Books a trip without a truck or driver ('Requested'); scheduler.py assigns
+    them in its next run. Returns the new TripID or raises BookingError.
+    """
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO TRIP (Origin, Destination, StartDate, EndDate, Status, ClientID)
+            SELECT %s, %s, %s, %s, 'Requested', ClientID FROM CLIENT WHERE UserID = %s
+        """, (origin, destination, start_date, end_date, user_id))
+        if cursor.rowcount == 0:
+            raise BookingError('Could not find a client profile for your account.')
+        trip_id = cursor.lastrowid
+        stats.bump(cursor, stats.trip_stat('Requested'))
+        stats.bump_version(cursor, stats.TRIPS_VERSION)
+        conn.commit()
+        return trip_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# --- Maintenance ---
+def schedule_maintenance(conn, truck_id, start_date, end_date, description):
+    """
+    Takes the truck out of service for [start_date, end_date). Locks the truck
+    like reserve_trip, so a booking can't land in the window between the check
+    and the insert, and rejects windows overlapping an active trip or another
+    maintenance window. Returns the new MaintenanceID or raises BookingError.
+    """
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        if is_sqlite(conn):
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT TruckID FROM TRUCK WHERE TruckID = %s" + for_update(conn), (truck_id,))
+        if cursor.fetchone() is None:
+            raise BookingError(f'Truck {truck_id} does not exist.')
+
+        # No driver is involved; DriverID = NULL never matches.
+        conflicts = find_conflicts(cursor, truck_id, None, start_date, end_date)
+        if conflicts['truck']:
+            raise BookingError(f'Truck {truck_id} is booked during this period (Trip ID: {conflicts["truck"]}).')
+        if conflicts['maintenance']:
+            raise BookingError(f'Truck {truck_id} already has maintenance scheduled during this period (Maintenance ID: {conflicts["maintenance"]}).')
+
+        cursor.execute(
+            "INSERT INTO MAINTENANCE (TruckID, MaintenanceDate, EndDate, Description) VALUES (%s, %s, %s, %s)",
+            (truck_id, start_date, end_date, description),
+        )
+        maintenance_id = cursor.lastrowid
+        conn.commit()
+        return maintenance_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def list_maintenance(cursor, truck_id=None, since=None):
+    """Maintenance windows still running at `since` (default today), optionally for one truck."""
+    sql = "SELECT MaintenanceID, TruckID, MaintenanceDate, EndDate, Description FROM MAINTENANCE WHERE EndDate > %s"
+    params = [since or date.today()]
+    if truck_id is not None:
+        sql += " AND TruckID = %s"
+        params.append(truck_id)
+    cursor.execute(sql + " ORDER BY MaintenanceDate, MaintenanceID", params)
+    return cursor.fetchall()
+
+
+def cancel_maintenance(conn, maintenance_id):
+    """Deletes a maintenance window. Returns its TruckID, or None if there was no such window."""
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT TruckID FROM MAINTENANCE WHERE MaintenanceID = %s" + for_update(conn), (maintenance_id,))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute("DELETE FROM MAINTENANCE WHERE MaintenanceID = %s", (maintenance_id,))
+        conn.commit()
+        return row[0] if row else None
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# --- Batch Checks ---
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def existing_ids(cursor, table, column, ids, lock_suffix=''):
+    """Which of `ids` exist in `table`, in one query. Pass for_update(conn) to lock them in id order."""
+    if not ids:
+        return set()
+    ids = sorted(ids)
+    cursor.execute(f"SELECT {column} FROM {table} WHERE {column} IN ({_placeholders(ids)}) ORDER BY {column}{lock_suffix}", ids)
+    return {row[0] for row in cursor.fetchall()}
+
+
+def load_busy(cursor, column, ids, start, end):
+    """
+    Busy intervals for the given trucks or drivers, overlapping [start, end), in
+    one query. Trucks also include their maintenance windows, with
+    ('maintenance', MaintenanceID) as the ref.
+    """
+    busy = BusyIntervals()
+    if not ids:
+        return busy
+    ids = sorted(ids)
+    sql = f"""
+        SELECT {column}, StartDate, EndDate, TripID, 0 FROM TRIP
+        WHERE {column} IN ({_placeholders(ids)}) AND EndDate > %s AND StartDate < %s AND {ACTIVE_TRIP_FILTER}
+    """
+    params = ids + [start, end]
+    if column == 'TruckID':
+        sql += f"""
+        UNION ALL
+        SELECT TruckID, MaintenanceDate, EndDate, MaintenanceID, 1 FROM MAINTENANCE
+        WHERE TruckID IN ({_placeholders(ids)}) AND EndDate > %s AND MaintenanceDate < %s
+        """
+        params += ids + [start, end]
+    cursor.execute(sql, params)
+    for resource_id, busy_start, busy_end, ref, is_maintenance in cursor.fetchall():
+        busy.add(resource_id, busy_start, busy_end, ('maintenance', ref) if is_maintenance else ref)
+    return busy
+
+
+# --- In-Memory Busy Calendar ---
+class BusyIntervals:
+    """
+    Busy intervals per resource, each list kept sorted by start date with a running
+    max of end dates, so "is this resource free in [start, end)?" is one bisect.
+    """
+
+    def __init__(self):
+        self._starts = {}
+        self._entries = {}
+        self._max_ends = {}
+
+    def add(self, resource_id, start, end, ref):
+        starts = self._starts.setdefault(resource_id, [])
+        entries = self._entries.setdefault(resource_id, [])
+        i = bisect_right(starts, start)
+        starts.insert(i, start)
+        entries.insert(i, (start, end, ref))
+        self._rebuild_max_ends(resource_id, i)
+
+    def remove_from(self, resource_id, ref):
+        entries = self._entries.get(resource_id, [])
+        for i, entry in enumerate(entries):
+            if entry[2] == ref:
+                del entries[i]
+                del self._starts[resource_id][i]
+                self._rebuild_max_ends(resource_id, i)
+                return True
+        return False
+
+    def is_free(self, resource_id, start, end):
+        starts = self._starts.get(resource_id)
+        if not starts:
+            return True
+        i = bisect_left(starts, end)
+        return i == 0 or self._max_ends[resource_id][i - 1] <= start
+
+    def _rebuild_max_ends(self, resource_id, i):
+        entries = self._entries[resource_id]
+        max_ends = self._max_ends.setdefault(resource_id, [])
+        del max_ends[i:]
+        running = max_ends[-1] if max_ends else None
+        for _, end, _ in entries[i:]:
+            running = end if running is None or end > running else running
+            max_ends.append(running)
+
+
+class AvailabilityCalendar:
+    """
+    In-process view of the fleet, of every active trip that hasn't ended yet and
+    of upcoming maintenance windows, which share the trucks' busy intervals.
+    Answers "which trucks/drivers are free in this window" without querying TRIP
+    or MAINTENANCE.
+
+    Each process keeps its own copy, updated by the booking/cancel/status routes
+    and fully reloaded every `refresh_seconds` to pick up changes made elsewhere.
+    It is only used to filter choices; reserve_trip() still does the authoritative
+    check in the database.
+    """
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self.trucks = {}
+        self.drivers = {}
+        self._trips = {}
+        self._maintenance = {}
+        self._truck_busy = BusyIntervals()
+        self._driver_busy = BusyIntervals()
+
+    def ensure_loaded(self, conn):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+                self.load(conn)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def load(self, conn):
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT TruckID, RegistrationNum, Model_Id, Capacity_in_Tons FROM TRUCK ORDER BY TruckID")
+        trucks = {row['TruckID']: row for row in cursor.fetchall()}
+        cursor.execute("SELECT DriverID, FirstName, LastName FROM DRIVER ORDER BY DriverID")
+        drivers = {row['DriverID']: row for row in cursor.fetchall()}
+        cursor.execute(f"""
+            SELECT TripID, TruckID, DriverID, StartDate, EndDate FROM TRIP
+            WHERE EndDate > %s AND {ACTIVE_TRIP_FILTER}
+        """, (date.today(),))
+        trips = cursor.fetchall()
+        maintenance = list_maintenance(cursor)
+        cursor.close()
+
+        with self._lock:
+            self.trucks = trucks
+            self.drivers = drivers
+            self._trips = {}
+            self._maintenance = {}
+            self._truck_busy = BusyIntervals()
+            self._driver_busy = BusyIntervals()
+            for trip in trips:
+                self._add(trip)
+            for window in maintenance:
+                self._add_maintenance(window)
+            self._loaded_at = time.monotonic()
+
+    def _add(self, trip):
+        self._trips[trip['TripID']] = trip
+        self._truck_busy.add(trip['TruckID'], trip['StartDate'], trip['EndDate'], trip['TripID'])
+        self._driver_busy.add(trip['DriverID'], trip['StartDate'], trip['EndDate'], trip['TripID'])
+
+    def add_trip(self, trip_id, truck_id, driver_id, start_date, end_date):
+        with self._lock:
+            self.remove_trip(trip_id)
+            self._add({'TripID': trip_id, 'TruckID': truck_id, 'DriverID': driver_id,
+                       'StartDate': start_date, 'EndDate': end_date})
+
+    def remove_trip(self, trip_id):
+        with self._lock:
+            trip = self._trips.pop(trip_id, None)
+            if trip:
+                self._truck_busy.remove_from(trip['TruckID'], trip_id)
+                self._driver_busy.remove_from(trip['DriverID'], trip_id)
+
+    def _add_maintenance(self, window):
+        self._maintenance[window['MaintenanceID']] = window
+        self._truck_busy.add(window['TruckID'], window['MaintenanceDate'], window['EndDate'],
+                             ('maintenance', window['MaintenanceID']))
+
+    def add_maintenance(self, maintenance_id, truck_id, start_date, end_date):
+        with self._lock:
+            self.remove_maintenance(maintenance_id)
+            self._add_maintenance({'MaintenanceID': maintenance_id, 'TruckID': int(truck_id),
+                                   'MaintenanceDate': start_date, 'EndDate': end_date})
+
+    def remove_maintenance(self, maintenance_id):
+        with self._lock:
+            window = self._maintenance.pop(maintenance_id, None)
+            if window:
+                self._truck_busy.remove_from(window['TruckID'], ('maintenance', maintenance_id))
+
+    def sync_trip(self, conn, trip_id):
+        """Re-reads one trip (e.g. after a status change) and updates the calendar to match."""
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT TripID, TruckID, DriverID, StartDate, EndDate, Status FROM TRIP WHERE TripID = %s", (trip_id,))
+        trip = cursor.fetchone()
+        cursor.close()
+        if trip and trip['Status'] not in INACTIVE_STATUSES and trip['EndDate'] and trip['EndDate'] > date.today():
+            self.add_trip(trip['TripID'], trip['TruckID'], trip['DriverID'], trip['StartDate'], trip['EndDate'])
+        else:
+            self.remove_trip(trip_id)
+
+    def available(self, start_date, end_date, min_capacity=None):
+        with self._lock:
+            trucks = [
+                truck for truck_id, truck in self.trucks.items()
+                if (min_capacity is None or (truck['Capacity_in_Tons'] or 0) >= min_capacity)
+                and self._truck_busy.is_free(truck_id, start_date, end_date)
+            ]
+            drivers = [
+                driver for driver_id, driver in self.drivers.items()
+                if self._driver_busy.is_free(driver_id, start_date, end_date)
+            ]
+        return trucks, drivers
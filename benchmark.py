@@ -0,0 +1,321 @@
+"""
+Benchmarks the booking and dashboard hot paths.
+
+    python benchmark.py --trips 50000 --requests 200 --output results.json
+    python benchmark.py --database tms.db --compare results.json
+    python benchmark.py --url http://127.0.0.1:5000 --requests 500 --concurrency 8
+
+By default a dataset is generated into a temporary SQLite file (see
+generate_data.py) and the app is driven in-process through Flask's test
+client. With --url the same scenarios run over HTTP against a live server
+instead (the server must already have data loaded from generate_data.py).
+Queries per request come from the X-DB-Queries response header.
+
+The results file is JSON and stable across runs, so two runs can be diffed;
+--compare prints the change per metric and exits non-zero when a latency or
+query count regressed by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+SCENARIOS = ['login', 'dashboard', 'book_trip', 'cancel_trip', 'admin_dashboard']
+USER_LOGIN = ('testuser', 'user123')
+ADMIN_LOGIN = ('admin', 'admin123')
+
+
+# --- Clients ---
+def query_count(headers):
+    value = headers.get('X-DB-Queries')
+    return int(value) if value is not None else None
+
+
+class TestClientDriver:
+    """Issues requests through Flask's test client (no redirects followed)."""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, form=None):
+        response = self._client.open(path, method=method, data=form)
+        return response.status_code, query_count(response.headers)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPDriver:
+    """Issues requests to a live server over HTTP, keeping cookies like a browser would."""
+
+    def __init__(self, base_url):
+        self._base = base_url.rstrip('/')
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        req = urllib.request.Request(self._base + path, data=data, method=method)
+        try:
+            with self._opener.open(req) as response:
+                response.read()
+                return response.status, query_count(response.headers)
+        except urllib.error.HTTPError as e:
+            return e.code, query_count(e.headers)
+
+
+# --- Measurement ---
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(make_driver, setup, step, requests, concurrency):
+    """
+    Runs `requests` calls of step(driver, i) spread over `concurrency` threads,
+    each with its own logged-in driver. Returns latency/throughput/query stats.
+    """
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        driver = make_driver()
+        setup(driver)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            status, query_count = step(driver, i)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if query_count is not None:
+                    queries.append(query_count)
+                if status >= 400:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def login(driver, credentials):
+    driver.request('POST', '/login', {'username': credentials[0], 'password': credentials[1]})
+
+
+def build_scenarios(num_trucks, num_drivers, booked_trip_ids, booking_base):
+    """Returns {name: (setup, step)}. Bookings use far-future dates so they rarely conflict."""
+    rng = random.Random(7)
+
+    def book(driver, i):
+        start = booking_base + timedelta(days=(i % 1000) * 8)
+        return driver.request('POST', '/book_trip', {
+            'origin': 'Chennai', 'destination': 'Mumbai',
+            'start_date': start.isoformat(), 'end_date': (start + timedelta(days=7)).isoformat(),
+            'truck_id': str(rng.randint(1, num_trucks)), 'driver_id': str(rng.randint(1, num_drivers)),
+        })
+
+    def cancel(driver, i):
+        trip_id = booked_trip_ids[i % len(booked_trip_ids)] if booked_trip_ids else 0
+        return driver.request('POST', f'/cancel_trip/{trip_id}')
+
+    return {
+        'login': (lambda d: None, lambda d, i: d.request('POST', '/login', {'username': USER_LOGIN[0], 'password': USER_LOGIN[1]})),
+        'dashboard': (lambda d: login(d, USER_LOGIN), lambda d, i: d.request('GET', '/dashboard')),
+        'book_trip': (lambda d: login(d, USER_LOGIN), book),
+        'cancel_trip': (lambda d: login(d, USER_LOGIN), cancel),
+        'admin_dashboard': (lambda d: login(d, ADMIN_LOGIN), lambda d, i: d.request('GET', '/admin')),
+    }
+
+
+# --- Setup ---
+def prepare_in_process(args):
+    """Generates (or reuses) the dataset and returns (app, dataset path)."""
+    if args.database:
+        path = args.database
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='tms-bench-'), 'bench.db')
+        import generate_data
+        generate_data.main(['--sqlite', path, '--trips', str(args.trips), '--trucks', str(args.trucks),
+                            '--drivers', str(args.drivers), '--clients', str(args.clients), '--seed', str(args.seed)])
+
+    from app import app
+
+    app.config.update(DB_BACKEND='sqlite', SQLITE_PATH=path, DB_POOL_SIZE=args.concurrency,
+                      DB_POOL_MAX_OVERFLOW=args.concurrency, TESTING=True)
+    return app, path
+
+
+def dataset_counts(path):
+    import db
+    conn = db.connect_sqlite(path)
+    cursor = conn.cursor()
+    counts = {}
+    for table in ('TRUCK', 'DRIVER', 'CLIENT', 'TRIP', 'SHIPMENT'):
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        counts[table] = cursor.fetchone()[0]
+    conn.close()
+    return counts
+
+
+def booked_trips(path, since):
+    import db
+    conn = db.connect_sqlite(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT TripID FROM TRIP WHERE ClientID = 1 AND StartDate >= %s ORDER BY TripID", (since,))
+    ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return ids
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    selected = args.scenarios.split(',') if args.scenarios else SCENARIOS
+    booking_base = date.today() + timedelta(days=3650)
+
+    if args.url:
+        make_driver = lambda: HTTPDriver(args.url)
+        counts = {'TRUCK': args.trucks, 'DRIVER': args.drivers}
+        path = None
+    else:
+        app, path = prepare_in_process(args)
+        make_driver = lambda: TestClientDriver(app)
+        counts = dataset_counts(path)
+
+    results = {}
+    booked = []
+    for name in SCENARIOS:
+        if name not in selected:
+            continue
+        if name == 'cancel_trip' and path:
+            booked = booked_trips(path, booking_base)
+        setup, step = build_scenarios(counts['TRUCK'], counts['DRIVER'], booked, booking_base)[name]
+        if args.warmup and name not in ('book_trip', 'cancel_trip'):
+            run_scenario(make_driver, setup, step, args.warmup, 1)
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = run_scenario(make_driver, setup, step, args.requests, args.concurrency)
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'mode': 'http' if args.url else 'test_client',
+            'concurrency': args.concurrency,
+            'requests_per_scenario': args.requests,
+            'dataset': counts,
+        },
+        'results': results,
+    }
+
+
+# --- Reporting ---
+COMPARED_METRICS = ['p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request']
+
+
+def print_report(report):
+    header = f"{'scenario':<16}{'reqs':>6}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>10}{'q/req':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, r in report['results'].items():
+        fmt = lambda v: '-' if v is None else v
+        print(f"{name:<16}{r['requests']:>6}{r['errors']:>6}{fmt(r['p50_ms']):>10}{fmt(r['p95_ms']):>10}"
+              f"{fmt(r['p99_ms']):>10}{fmt(r['throughput_rps']):>10}{fmt(r['queries_per_request']):>8}")
+
+
+def compare(report, baseline, threshold):
+    """Prints the relative change of each metric against `baseline`. Returns True if anything regressed."""
+    regressed = False
+    print(f"\nCompared with {baseline['meta'].get('revision') or 'baseline'} (threshold {threshold:.0%}):")
+    for name, r in report['results'].items():
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = old.get(metric), r.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            flag = ''
+            if change > threshold:
+                flag = '  <-- REGRESSION'
+                regressed = True
+            print(f"  {name:<16}{metric:<22}{before:>10} -> {after:<10}{change:+.1%}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the booking and dashboard hot paths.')
+    parser.add_argument('--database', metavar='PATH', help='Reuse an existing SQLite dataset instead of generating one')
+    parser.add_argument('--url', help='Benchmark a running server over HTTP instead of in-process')
+    parser.add_argument('--trips', type=int, default=20000)
+    parser.add_argument('--trucks', type=int, default=200)
+    parser.add_argument('--drivers', type=int, default=250)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--scenarios', help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--output', metavar='PATH', help='Write results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown before flagging')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""
+Bulk trip import and export.
+
+    python bulk.py import trips.csv [--chunk-size 1000] [--dry-run]
+    python bulk.py export trips.jsonl [--format jsonl]
+
+Imports accept CSV (with a header row) or JSONL with the columns Origin,
+Destination, StartDate, EndDate, TruckID, DriverID, ClientID and optionally
+Status (defaults to 'Scheduled').
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import stats
+from availability import existing_ids, load_busy
+from db import for_update, is_sqlite
+from trips import INACTIVE_STATUSES, TRIP_STATUSES
+
+IMPORT_COLUMNS = ['Origin', 'Destination', 'StartDate', 'EndDate', 'Status', 'TruckID', 'DriverID', 'ClientID']
+EXPORT_COLUMNS = ['TripID', 'Origin', 'Destination', 'StartDate', 'EndDate', 'Status', 'TruckID', 'DriverID',
+                  'ClientID', 'ShipmentID', 'GoodsID', 'Quantity']
+
+
+# --- Reading and Validation ---
+def first_undecodable_line(stream, encoding='utf-8'):
+    """Line number of the first line of a binary stream that isn't valid `encoding`, or None. Reads to the end."""
+    for line_num, line in enumerate(stream, start=1):
+        try:
+            line.decode(encoding)
+        except UnicodeDecodeError:
+            return line_num
+    return None
+
+
+def read_rows(stream, fmt):
+    """Yields (line_number, dict) pairs from a text stream without loading the whole file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, {'_error': f'Invalid JSON: {e}'}
+                continue
+            if not isinstance(row, dict):
+                row = {'_error': 'Each line must be a JSON object.'}
+            yield line_num, row
+    else:
+        raise ValueError(f"Unsupported format '{fmt}'")
+
+
+def validate_row(row):
+    """Returns (record, None) for a valid row or (None, error message)."""
+    if '_error' in row:
+        return None, row['_error']
+    try:
+        record = {
+            'Origin': str(row.get('Origin') or '').strip(),
+            'Destination': str(row.get('Destination') or '').strip(),
+            'StartDate': datetime.strptime(str(row.get('StartDate')), '%Y-%m-%d').date(),
+            'EndDate': datetime.strptime(str(row.get('EndDate')), '%Y-%m-%d').date(),
+            'Status': str(row.get('Status') or 'Scheduled'),
+            'TruckID': int(row.get('TruckID')),
+            'DriverID': int(row.get('DriverID')),
+            'ClientID': int(row.get('ClientID')),
+        }
+    except (AttributeError, TypeError, ValueError):
+        return None, 'Dates must be YYYY-MM-DD and TruckID, DriverID, ClientID must be integers.'
+    if not record['Origin'] or not record['Destination']:
+        return None, 'Origin and Destination are required.'
+    if record['EndDate'] <= record['StartDate']:
+        return None, 'EndDate must be after StartDate.'
+    if record['Status'] not in TRIP_STATUSES:
+        return None, f"Unknown status '{record['Status']}'."
+    return record, None
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+# --- Import ---
+def import_chunk(conn, numbered_rows, check_conflicts=True, dry_run=False):
+    """
+    Validates and inserts one chunk of (line_number, row) pairs as a single
+    transaction. Returns (inserted_count, errors).
+    """
+    errors = []
+    records = []
+    for line_num, row in numbered_rows:
+        record, error = validate_row(row)
+        if error:
+            errors.append({'line': line_num, 'error': error})
+        else:
+            records.append((line_num, record))
+    if not records:
+        return 0, errors
+
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        if is_sqlite(conn):
+            cursor.execute("BEGIN IMMEDIATE")
+        # Lock the referenced trucks and drivers (same order as reserve_trip) so live
+        # bookings can't slip in between the conflict check and the insert.
+        lock = for_update(conn)
+        trucks = existing_ids(cursor, 'TRUCK', 'TruckID', {r['TruckID'] for _, r in records}, lock)
+        drivers = existing_ids(cursor, 'DRIVER', 'DriverID', {r['DriverID'] for _, r in records}, lock)
+        clients = existing_ids(cursor, 'CLIENT', 'ClientID', {r['ClientID'] for _, r in records})
+
+        active = [r for _, r in records if r['Status'] not in INACTIVE_STATUSES]
+        if check_conflicts and active:
+            start = min(r['StartDate'] for r in active)
+            end = max(r['EndDate'] for r in active)
+            truck_busy = load_busy(cursor, 'TruckID', {r['TruckID'] for r in active}, start, end)
+            driver_busy = load_busy(cursor, 'DriverID', {r['DriverID'] for r in active}, start, end)
+
+        accepted = []
+        for line_num, r in records:
+            if r['TruckID'] not in trucks:
+                errors.append({'line': line_num, 'error': f"Truck {r['TruckID']} does not exist."})
+                continue
+            if r['DriverID'] not in drivers:
+                errors.append({'line': line_num, 'error': f"Driver {r['DriverID']} does not exist."})
+                continue
+            if r['ClientID'] not in clients:
+                errors.append({'line': line_num, 'error': f"Client {r['ClientID']} does not exist."})
+                continue
+            if check_conflicts and r['Status'] not in INACTIVE_STATUSES:
+                if not truck_busy.is_free(r['TruckID'], r['StartDate'], r['EndDate']):
+                    errors.append({'line': line_num, 'error': f"Truck {r['TruckID']} is already booked during this period."})
+                    continue
+                if not driver_busy.is_free(r['DriverID'], r['StartDate'], r['EndDate']):
+                    errors.append({'line': line_num, 'error': f"Driver {r['DriverID']} is already assigned during this period."})
+                    continue
+                # Rows in the same file must not overlap each other either.
+                truck_busy.add(r['TruckID'], r['StartDate'], r['EndDate'], ('line', line_num))
+                driver_busy.add(r['DriverID'], r['StartDate'], r['EndDate'], ('line', line_num))
+            accepted.append(r)
+        # Row errors were found before the chunk's checks; report them all in file order.
+        errors.sort(key=lambda e: e['line'])
+
+        if accepted and not dry_run:
+            # mysql.connector rewrites this into a single multi-row INSERT.
+            cursor.executemany(
+                f"INSERT INTO TRIP ({', '.join(IMPORT_COLUMNS)}) VALUES ({_placeholders(IMPORT_COLUMNS)})",
+                [[r[col] for col in IMPORT_COLUMNS] for r in accepted],
+            )
+            per_status = {}
+            for r in accepted:
+                per_status[r['Status']] = per_status.get(r['Status'], 0) + 1
+            for status, count in per_status.items():
+                stats.bump(cursor, stats.trip_stat(status), count)
+            stats.bump_version(cursor, stats.TRIPS_VERSION)
+            conn.commit()
+        else:
+            conn.rollback()
+        return len(accepted), errors
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def import_trips(conn, stream, fmt='csv', chunk_size=1000, check_conflicts=True, dry_run=False, max_errors=1000):
+    """
+    Streams trips from `stream` into TRIP, one transaction per chunk. Returns a
+    report with the number inserted and per-line errors (capped at `max_errors`).
+    """
+    report = {'inserted': 0, 'rejected': 0, 'chunks': 0, 'dry_run': dry_run, 'errors': []}
+    for chunk in chunked(read_rows(stream, fmt), chunk_size):
+        inserted, errors = import_chunk(conn, chunk, check_conflicts, dry_run)
+        report['inserted'] += inserted
+        report['rejected'] += len(errors)
+        report['chunks'] += 1
+        room = max_errors - len(report['errors'])
+        if room > 0:
+            report['errors'].extend(errors[:room])
+    return report
+
+
+# --- Export ---
+def export_trips(conn, fmt='csv', batch_size=1000):
+    """
+    Yields TRIP and TRIP_ARCHIVE rows joined with their shipments as CSV or
+    JSONL text, a batch at a time. The cursor is unbuffered, so rows stream from the server instead
+    of the whole result being held in memory.
+    """
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+    # Live trips first, then archived ones (see archive.py).
+    for trip_table, shipment_table in (('TRIP', 'SHIPMENT'), ('TRIP_ARCHIVE', 'SHIPMENT_ARCHIVE')):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT t.TripID, t.Origin, t.Destination, t.StartDate, t.EndDate, t.Status, t.TruckID, t.DriverID,
+                       t.ClientID, s.ShipmentID, s.GoodsID, s.Quantity
+                FROM {trip_table} t
+                LEFT JOIN {shipment_table} s ON s.TripID = t.TripID
+                ORDER BY t.TripID, s.ShipmentID
+            """)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                else:
+                    yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + '\n' for row in rows)
+        finally:
+            cursor.close()
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import/export of trips.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='Import trips from a CSV or JSONL file')
+    imp.add_argument('path')
+    imp.add_argument('--format', choices=['csv', 'jsonl'])
+    imp.add_argument('--chunk-size', type=int, default=1000)
+    imp.add_argument('--no-conflict-check', action='store_true')
+    imp.add_argument('--dry-run', action='store_true')
+    exp = sub.add_parser('export', help='Export trips and shipments to a CSV or JSONL file')
+    exp.add_argument('path')
+    exp.add_argument('--format', choices=['csv', 'jsonl'])
+    args = parser.parse_args(argv)
+    fmt = args.format or ('jsonl' if args.path.endswith('.jsonl') else 'csv')
+    if args.command == 'import':
+        with open(args.path, 'rb') as f:
+            bad_line = first_undecodable_line(f)
+        if bad_line:
+            parser.error(f'Line {bad_line} is not valid UTF-8.')
+
+    from app import app
+    from db import get_db
+
+    with app.app_context():
+        conn = get_db()
+        if args.command == 'import':
+            with open(args.path, newline='', encoding='utf-8') as f:
+                report = import_trips(conn, f, fmt, args.chunk_size, not args.no_conflict_check, args.dry_run)
+            json.dump(report, sys.stdout, indent=2, default=str)
+            print()
+        else:
+            with open(args.path, 'w', newline='', encoding='utf-8') as f:
+                for text in export_trips(conn, fmt):
+                    f.write(text)
+            print(f"Exported trips to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
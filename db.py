@@ -0,0 +1,468 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from flask import current_app, g, has_request_context, request, session
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# --- Connection Pool ---
+class ConnectionPool:
+    """
+    A bounded pool of DB connections. Keeps up to `size` idle connections
+    around and allows `max_overflow` extra ones under load. When everything
+    is checked out, callers wait up to `timeout` seconds for a free slot.
+    """
+
+    def __init__(self, connect, size=5, max_overflow=10, timeout=30.0):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._open = 0
+
+        # Metrics
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def acquire(self):
+        started = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    conn = None
+                    break
+                if started is None:
+                    started = time.monotonic()
+                    self.waits += 1
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.wait_time += time.monotonic() - started
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._cond.wait(remaining)
+
+            if started is not None:
+                self.wait_time += time.monotonic() - started
+            self.in_use += 1
+            self.checkouts += 1
+
+        # Health check (or connect) outside the lock so a slow server doesn't block other callers.
+        try:
+            if conn is not None and not self._is_healthy(conn):
+                self._close_quietly(conn)
+                with self._cond:
+                    self.discarded += 1
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self.in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard:
+            try:
+                # Drop any open transaction so the next borrower starts clean.
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self.in_use -= 1
+            if discard or len(self._idle) >= self.size:
+                self._open -= 1
+                if discard:
+                    self.discarded += 1
+                close_it = True
+            else:
+                self._idle.append(conn)
+                close_it = False
+            self._cond.notify()
+
+        if close_it:
+            self._close_quietly(conn)
+
+    def dispose(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time_seconds': round(self.wait_time, 6),
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+            }
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.ping()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# --- Read Replicas ---
+def replica_lag(conn):
+    """
+    Seconds `conn`'s server is behind its source: 0 if it isn't replicating (e.g. a
+    second SQLite file standing in for a replica), None if replication is broken.
+    """
+    if is_sqlite(conn):
+        return 0
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Exception:
+            cursor.execute("SHOW SLAVE STATUS")  # MySQL before 8.0.22
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if row is None:
+        return 0
+    return row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+
+
+class ReplicaSet:
+    """
+    Connection pools for read replicas, used round-robin. Each replica's lag is
+    re-measured at most every `check_seconds`; one that is unreachable or more
+    than `max_lag` seconds behind is skipped until a later check finds it fit.
+    choose() returns None when no replica is usable, and reads go to the primary.
+    """
+
+    def __init__(self, pools, max_lag=5.0, check_seconds=2.0, measure=replica_lag):
+        self.pools = pools
+        self.max_lag = max_lag
+        self.check_seconds = check_seconds
+        self._measure = measure
+        self._lock = threading.Lock()
+        self._lag = [None] * len(pools)
+        self._checked_at = [float('-inf')] * len(pools)
+        self._next = 0
+
+        # Metrics
+        self.reads = [0] * len(pools)
+        self.fallbacks = 0
+
+    def lag(self, index):
+        """The replica's last measured lag, measuring it first if the reading is stale."""
+        with self._lock:
+            due = time.monotonic() - self._checked_at[index] >= self.check_seconds
+            if due:
+                # Claim the check so concurrent callers keep using the previous reading meanwhile.
+                self._checked_at[index] = time.monotonic()
+            else:
+                return self._lag[index]
+        pool = self.pools[index]
+        try:
+            conn = pool.acquire()
+        except Exception:
+            lag = None
+        else:
+            try:
+                lag = self._measure(conn)
+                pool.release(conn)
+            except Exception:
+                lag = None
+                pool.release(conn, discard=True)
+        with self._lock:
+            self._lag[index] = lag
+        return lag
+
+    def choose(self):
+        """Index of the next replica fit for reads, or None to read from the primary."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.pools)
+        for offset in range(len(self.pools)):
+            index = (start + offset) % len(self.pools)
+            lag = self.lag(index)
+            if lag is not None and lag <= self.max_lag:
+                with self._lock:
+                    self.reads[index] += 1
+                return index
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def mark_down(self, index):
+        """Skips a replica until its next lag check, e.g. after a failed connect."""
+        with self._lock:
+            self._lag[index] = None
+            self._checked_at[index] = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'replicas': len(self.pools),
+                'lag_seconds': list(self._lag),
+                'reads': list(self.reads),
+                'fallbacks': self.fallbacks,
+            }
+
+
+# --- SQLite Backend ---
+# A thin adapter so the routes' mysql.connector-style calls (`%s` params,
+# `cursor(dictionary=True)`) also work against a local SQLite file. Used for tests
+# and local runs without a MySQL server.
+class SQLiteCursor:
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), tuple(params or ()))
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(sql.replace('%s', '?'), [tuple(p) for p in seq_of_params])
+
+    def _convert(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {col[0]: value for col, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._convert(row)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    dialect = 'sqlite'
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self):
+        self._conn.execute("SELECT 1")
+
+    def is_connected(self):
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._conn.close()
+
+
+def connect_sqlite(path):
+    return SQLiteConnection(path)
+
+
+def is_sqlite(conn):
+    return getattr(conn, 'dialect', 'mysql') == 'sqlite'
+
+
+def for_update(conn):
+    """The row-locking suffix for SELECTs; SQLite has no row locks, so it gets none."""
+    return '' if is_sqlite(conn) else ' FOR UPDATE'
+
+
+# --- Flask Integration ---
+def init_app(app, connect):
+    """
+    Registers the pool with the app. `connect(**overrides)` opens a new MySQL
+    connection, with overrides (e.g. a host) for each of DB_REPLICAS; when DB_BACKEND
+    is 'sqlite' connections go to SQLITE_PATH, and DB_REPLICAS are file paths.
+    Pools are built lazily on first use so tests can adjust app.config after import.
+    """
+    app.extensions['db_connect'] = connect
+    app.after_request(pin_after_write)
+    app.teardown_appcontext(close_db)
+
+
+_pool_lock = threading.Lock()
+
+
+def _make_pool(app, target=None):
+    """A pool for the primary (target None) or for one DB_REPLICAS entry."""
+    if app.config.get('DB_BACKEND', 'mysql') == 'sqlite':
+        path = target or app.config['SQLITE_PATH']
+        connect = lambda: connect_sqlite(path)
+    elif target is None:
+        connect = app.extensions['db_connect']
+    else:
+        connect = lambda: app.extensions['db_connect'](**target)
+    # Extensions (e.g. query instrumentation) can wrap every new connection.
+    for wrap in app.extensions.get('db_wrappers', []):
+        connect = wrap(connect)
+    return ConnectionPool(
+        connect,
+        size=app.config.get('DB_POOL_SIZE', 5),
+        max_overflow=app.config.get('DB_POOL_MAX_OVERFLOW', 10),
+        timeout=app.config.get('DB_POOL_TIMEOUT', 30.0),
+    )
+
+
+def get_pool():
+    app = current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                pool = app.extensions['db_pool'] = _make_pool(app)
+    return pool
+
+
+def get_replicas():
+    """The app's ReplicaSet, or None when DB_REPLICAS is empty."""
+    app = current_app._get_current_object()
+    if not app.config.get('DB_REPLICAS'):
+        return None
+    replicas = app.extensions.get('db_replicas')
+    if replicas is None:
+        with _pool_lock:
+            replicas = app.extensions.get('db_replicas')
+            if replicas is None:
+                replicas = app.extensions['db_replicas'] = ReplicaSet(
+                    [_make_pool(app, target) for target in app.config['DB_REPLICAS']],
+                    max_lag=app.config.get('REPLICA_MAX_LAG_SECONDS', 5.0),
+                    check_seconds=app.config.get('REPLICA_LAG_CHECK_SECONDS', 2.0),
+                )
+    return replicas
+
+
+def get_db():
+    """Returns the connection checked out for the current request, borrowing one on first use."""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+# --- Read/Write Routing ---
+# Routes pass get_read_db() to queries that only read. It returns a replica connection
+# unless the session is pinned to the primary: every non-GET request pins it for
+# READ_YOUR_WRITES_SECONDS, so a user always sees their own writes. The pin lives in
+# the session cookie, so it holds whichever worker process serves the next request.
+PIN_KEY = '_read_primary_until'
+
+
+def pinned_to_primary(session_data=None):
+    if session_data is None:
+        # Outside a request (e.g. a background thread) nothing is pinned.
+        session_data = session if has_request_context() else {}
+    return session_data.get(PIN_KEY, 0) > time.time()
+
+
+def choose_replica(session_data=None):
+    """Index of the replica this request should read from, or None for the primary."""
+    replicas = get_replicas()
+    if replicas is None or pinned_to_primary(session_data):
+        return None
+    return replicas.choose()
+
+
+def get_read_db():
+    """The connection for this request's read-only queries: a fit replica, or else get_db()."""
+    if 'read_db' not in g:
+        index = choose_replica()
+        if index is not None:
+            pool = get_replicas().pools[index]
+            try:
+                g.read_db = pool.acquire()
+                g.read_pool, g.read_source = pool, f'replica{index}'
+                return g.read_db
+            except Exception:
+                get_replicas().mark_down(index)
+        g.read_db = get_db()
+        g.read_source = 'primary'
+    return g.read_db
+
+
+def read_source():
+    """'primary' or 'replica<N>': where get_read_db() reads from in this request."""
+    get_read_db()
+    return g.read_source
+
+
+def pin_after_write(response):
+    if request.method not in ('GET', 'HEAD') and current_app.config.get('DB_REPLICAS'):
+        session[PIN_KEY] = time.time() + current_app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+    return response
+
+
+def close_db(exc=None):
+    read_conn, read_pool = g.pop('read_db', None), g.pop('read_pool', None)
+    g.pop('read_source', None)
+    if read_pool is not None:
+        read_pool.release(read_conn)
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
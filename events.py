@@ -0,0 +1,111 @@
+"""
+Trip status push: an in-process pub/sub feeding the /api/trip_events stream.
+
+The booking, cancel and status routes publish each change to the trip owner's
+channel. Each user keeps the last `history` events, so a reconnecting browser
+(which sends Last-Event-ID) gets whatever it missed. Event ids are
+milliseconds-since-epoch based, so they keep increasing across restarts.
+
+asgi.py holds the stream open: a subscriber is an asyncio.Queue, fed from any
+thread with call_soon_threadsafe. An idle connection costs a queue and a
+suspended coroutine, not a thread. Under plain WSGI the route answers with the
+backlog and a `retry:` hint, and the browser reconnects on its own, so polling
+never touches the database.
+
+Events only reach subscribers in the process that published them (like
+AvailabilityCalendar); with several workers, clients still see their own
+changes plus whatever that worker handled.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class TripEvents:
+    def __init__(self, history=50, max_queue=100):
+        self.history = history
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._last_id = int(time.time() * 1000)
+        self._backlog = {}      # user_id -> deque of (event_id, event)
+        self._subscribers = {}  # user_id -> {queue: loop}
+        self.published = 0
+        self.overflows = 0
+
+    def last_id(self):
+        with self._lock:
+            return self._last_id
+
+    def publish(self, user_id, trip_id, status, previous=None):
+        """Records a status change for `user_id`'s trip and wakes their open streams. Safe from any thread."""
+        event = {'trip_id': trip_id, 'status': status, 'previous': previous,
+                 'at': datetime.now().isoformat(timespec='seconds')}
+        with self._lock:
+            self._last_id += 1
+            item = (self._last_id, event)
+            self._backlog.setdefault(user_id, deque(maxlen=self.history)).append(item)
+            subscribers = list(self._subscribers.get(user_id, {}).items())
+            self.published += 1
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, item)
+
+    def _deliver(self, queue, item):
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # A stuck consumer: drop its queue and tell it to reload instead of growing without bound.
+            self.overflows += 1
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def since(self, user_id, after):
+        """Buffered (event_id, event) pairs for `user_id` newer than `after` (None means none)."""
+        if after is None:
+            return []
+        with self._lock:
+            return [item for item in self._backlog.get(user_id, ()) if item[0] > after]
+
+    def subscribe(self, user_id, loop):
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[queue] = loop
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': sum(len(queues) for queues in self._subscribers.values()),
+                'published': self.published,
+                'overflows': self.overflows,
+            }
+
+
+# --- Wire Format ---
+def parse_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_events(items, retry_ms=None):
+    """Server-sent event text for (event_id, event) pairs; None (an overflow) becomes a 'resync' event."""
+    lines = [f'retry: {retry_ms}\n\n'] if retry_ms else []
+    for item in items:
+        if item is None:
+            lines.append('event: resync\ndata: {}\n\n')
+        else:
+            event_id, event = item
+            lines.append(f'id: {event_id}\nevent: status\ndata: {json.dumps(event)}\n\n')
+    return ''.join(lines)
@@ -0,0 +1,316 @@
+"""
+Generates a synthetic dataset of configurable size for local testing and load tests.
+
+    python generate_data.py --trucks 2000 --drivers 2500 --clients 5000 --trips 1000000
+    python generate_data.py --sqlite tms.db --trips 10000
+
+Recreates the schema (see Serial_2_db_values_insertion.py), then fills every
+table with batched multi-row INSERTs. IDs are assigned here rather than relying
+on AUTO_INCREMENT, and each truck's and driver's trips never overlap. The same
+--seed always produces the same data. Logins: admin/admin123, testuser/user123,
+and user<N>/user123 for the generated clients.
+"""
+import argparse
+import heapq
+import random
+import time
+from datetime import date, timedelta
+
+import mysql.connector
+from flask import Flask
+from flask_bcrypt import Bcrypt
+
+import stats
+from db import connect_sqlite
+
+app = Flask(__name__)
+bcrypt = Bcrypt(app)
+
+db_config = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': '',
+    'database': 'truck_management_system'
+}
+
+CITIES = ['Chennai', 'Bangalore', 'Mumbai', 'Pune', 'Delhi', 'Hyderabad', 'Kolkata', 'Ahmedabad', 'Jaipur',
+          'Lucknow', 'Kochi', 'Coimbatore', 'Nagpur', 'Indore', 'Bhopal', 'Surat', 'Vizag', 'Madurai']
+STATE_CODES = ['TN', 'KA', 'MH', 'DL', 'TS', 'WB', 'GJ', 'RJ', 'UP', 'KL', 'MP', 'AP']
+TRUCK_MODELS = [('Tata Ultra', 10), ('Ashok Leyland Dost', 8), ('Eicher Pro 2049', 5), ('BharatBenz 1617R', 16),
+                ('Tata Signa 2823', 25), ('Mahindra Blazo X 28', 28), ('Eicher Pro 3015', 15)]
+FIRST_NAMES = ['Rajesh', 'Anil', 'Suresh', 'Priya', 'Amit', 'Vikram', 'Kavya', 'Ravi', 'Meena', 'Arjun',
+               'Deepak', 'Lakshmi', 'Sanjay', 'Pooja', 'Karthik', 'Neha', 'Manoj', 'Divya']
+LAST_NAMES = ['Kumar', 'Mehta', 'Sharma', 'Iyer', 'Patel', 'Reddy', 'Nair', 'Singh', 'Gupta', 'Das',
+              'Rao', 'Joshi', 'Menon', 'Verma']
+COMPANY_WORDS = ['Global', 'Bharat', 'Sunrise', 'Apex', 'Metro', 'Prime', 'Star', 'United', 'Eastern', 'Coastal']
+COMPANY_KINDS = ['Electronics', 'Textiles', 'Foods', 'Pharma', 'Steel', 'Cement', 'Furniture', 'Motors', 'Agro']
+GOODS = [('Electronic Components', 'Fragile'), ('Cement Bags', 'Construction'), ('Steel Rods', 'Construction'),
+         ('Rice', 'Food'), ('Medicines', 'Pharma'), ('Furniture', 'Household'), ('Cotton Bales', 'Textile'),
+         ('Auto Parts', 'Industrial'), ('Fertilizer', 'Agriculture'), ('Glassware', 'Fragile')]
+MAINTENANCE_TASKS = ['Oil Change', 'Brake Inspection', 'Tyre Replacement', 'Engine Service', 'Battery Check',
+                     'Clutch Repair', 'Annual Fitness Check']
+
+SQLITE_SCHEMA = [
+    "CREATE TABLE OWNER (OwnerID INTEGER PRIMARY KEY, OwnerName VARCHAR(100), ContactInfo VARCHAR(100), Address VARCHAR(255))",
+    "CREATE TABLE USERS (UserID INTEGER PRIMARY KEY, Username VARCHAR(50) UNIQUE, PasswordHash VARCHAR(255), Role VARCHAR(10))",
+    "CREATE TABLE CLIENT (ClientID INTEGER PRIMARY KEY, ClientName VARCHAR(100), BillingAddress VARCHAR(255), ContactPerson VARCHAR(100), UserID INT REFERENCES USERS(UserID))",
+    "CREATE TABLE DRIVER (DriverID INTEGER PRIMARY KEY, FirstName VARCHAR(50), LastName VARCHAR(50), LicenseNumber VARCHAR(50))",
+    "CREATE TABLE TRUCK (TruckID INTEGER PRIMARY KEY, RegistrationNum VARCHAR(50), Model_Id VARCHAR(100), Capacity_in_Tons INT, OwnerID INT REFERENCES OWNER(OwnerID))",
+    "CREATE TABLE GOODS (GoodsID INTEGER PRIMARY KEY, GoodsName VARCHAR(100), GoodsType VARCHAR(100))",
+    "CREATE TABLE TRIP (TripID INTEGER PRIMARY KEY AUTOINCREMENT, Origin VARCHAR(100), Destination VARCHAR(100), StartDate DATE, EndDate DATE, Status VARCHAR(50), "
+    "TruckID INT REFERENCES TRUCK(TruckID), DriverID INT REFERENCES DRIVER(DriverID), ClientID INT REFERENCES CLIENT(ClientID))",
+    "CREATE TABLE MAINTENANCE (MaintenanceID INTEGER PRIMARY KEY, TruckID INT REFERENCES TRUCK(TruckID), MaintenanceDate DATE, EndDate DATE NOT NULL, Description VARCHAR(255))",
+    "CREATE TABLE SHIPMENT (ShipmentID INTEGER PRIMARY KEY AUTOINCREMENT, TripID INT REFERENCES TRIP(TripID) ON DELETE CASCADE, GoodsID INT REFERENCES GOODS(GoodsID), Quantity INT)",
+    "CREATE TABLE TRIP_ARCHIVE (TripID INTEGER PRIMARY KEY, Origin VARCHAR(100), Destination VARCHAR(100), StartDate DATE, EndDate DATE NOT NULL, "
+    "Status VARCHAR(50), TruckID INT, DriverID INT, ClientID INT)",
+    "CREATE TABLE SHIPMENT_ARCHIVE (ShipmentID INTEGER PRIMARY KEY, TripID INT NOT NULL, GoodsID INT, Quantity INT)",
+    "CREATE TABLE STATS (StatName VARCHAR(64) PRIMARY KEY, StatValue BIGINT NOT NULL DEFAULT 0)",
+    "CREATE INDEX idx_client_user ON CLIENT (UserID)",
+    "CREATE INDEX idx_trip_truck_dates ON TRIP (TruckID, EndDate, StartDate)",
+    "CREATE INDEX idx_trip_driver_dates ON TRIP (DriverID, EndDate, StartDate)",
+    "CREATE INDEX idx_trip_start ON TRIP (StartDate, TripID)",
+    "CREATE INDEX idx_trip_status_start ON TRIP (Status, StartDate)",
+    "CREATE INDEX idx_trip_client_start ON TRIP (ClientID, StartDate)",
+    "CREATE INDEX idx_shipment_trip ON SHIPMENT (TripID, Quantity)",
+    "CREATE INDEX idx_shipment_goods ON SHIPMENT (GoodsID)",
+    "CREATE INDEX idx_trip_archive_start ON TRIP_ARCHIVE (StartDate, TripID)",
+    "CREATE INDEX idx_trip_archive_status_start ON TRIP_ARCHIVE (Status, StartDate)",
+    "CREATE INDEX idx_trip_archive_client_start ON TRIP_ARCHIVE (ClientID, StartDate)",
+    "CREATE INDEX idx_trip_archive_driver_start ON TRIP_ARCHIVE (DriverID, StartDate)",
+    "CREATE INDEX idx_shipment_archive_trip ON SHIPMENT_ARCHIVE (TripID, Quantity)",
+    "CREATE INDEX idx_maintenance_truck_dates ON MAINTENANCE (TruckID, EndDate, MaintenanceDate)",
+]
+
+
+# --- Helpers ---
+def insert_rows(cursor, table, columns, rows, batch_size):
+    """Inserts `rows` (any iterable) with multi-row INSERTs of `batch_size` rows. Returns the row count."""
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def hash_passwords(passwords):
+    """bcrypt is deliberately slow, so each distinct password is hashed exactly once."""
+    return {password: bcrypt.generate_password_hash(password).decode('utf-8') for password in set(passwords)}
+
+
+def trip_status(start, end, today, rng, cancel_rate):
+    if end <= today:
+        return 'Cancelled' if rng.random() < cancel_rate else 'Completed'
+    if start <= today:
+        return 'In Progress'
+    return 'Scheduled'
+
+
+# --- Generators ---
+def generate_schedule(rng, num_trips, truck_ids, driver_ids, first_day):
+    """
+    Yields (truck_id, driver_id, start, end) in start order. Trucks and drivers sit in
+    min-heaps keyed on the day they become free, so the next trip always goes to the
+    earliest free truck and driver and nothing ever overlaps.
+    """
+    trucks = [(first_day + timedelta(days=rng.randint(0, 30)), truck_id) for truck_id in truck_ids]
+    drivers = [(first_day + timedelta(days=rng.randint(0, 30)), driver_id) for driver_id in driver_ids]
+    heapq.heapify(trucks)
+    heapq.heapify(drivers)
+    for _ in range(num_trips):
+        truck_free, truck_id = heapq.heappop(trucks)
+        driver_free, driver_id = heapq.heappop(drivers)
+        start = max(truck_free, driver_free) + timedelta(days=rng.randint(0, 6))
+        end = start + timedelta(days=rng.randint(7, 14))
+        heapq.heappush(trucks, (end, truck_id))
+        heapq.heappush(drivers, (end, driver_id))
+        yield truck_id, driver_id, start, end
+
+
+def generate(conn, args):
+    rng = random.Random(args.seed)
+    cursor = conn.cursor()
+    today = date.today()
+    first_day = today - timedelta(days=args.history_days)
+    timings = {}
+
+    def step(name, table, columns, rows):
+        started = time.perf_counter()
+        count = insert_rows(cursor, table, columns, rows, args.batch_size)
+        conn.commit()
+        timings[name] = (count, time.perf_counter() - started)
+        print(f"  {name}: {count} rows in {timings[name][1]:.1f}s")
+
+    owner_ids = range(1, args.owners + 1)
+    step('owners', 'OWNER', ['OwnerID', 'OwnerName', 'ContactInfo', 'Address'], (
+        (i, f"{rng.choice(COMPANY_WORDS)} Logistics {i}", f"owner{i}@example.com",
+         f"{rng.randint(1, 999)} Transport Nagar, {rng.choice(CITIES)}")
+        for i in owner_ids
+    ))
+
+    # USERS: 1 = admin, 2 = testuser (client 1), then user<N> for the remaining clients.
+    hashes = hash_passwords(['admin123', 'user123'])
+    non_admin_users = max(args.users, args.clients)
+
+    def user_rows():
+        yield 1, 'admin', hashes['admin123'], 'admin'
+        yield 2, 'testuser', hashes['user123'], 'user'
+        for i in range(3, non_admin_users + 2):
+            yield i, f"user{i}", hashes['user123'], 'user'
+
+    step('users', 'USERS', ['UserID', 'Username', 'PasswordHash', 'Role'], user_rows())
+
+    client_ids = range(1, args.clients + 1)
+    step('clients', 'CLIENT', ['ClientID', 'ClientName', 'BillingAddress', 'ContactPerson', 'UserID'], (
+        (i, f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_KINDS)} {i}", f"{rng.randint(1, 999)} Industrial Area, {rng.choice(CITIES)}",
+         f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", i + 1)
+        for i in client_ids
+    ))
+
+    driver_ids = range(1, args.drivers + 1)
+    step('drivers', 'DRIVER', ['DriverID', 'FirstName', 'LastName', 'LicenseNumber'], (
+        (i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"{rng.choice(STATE_CODES)}{i:08d}")
+        for i in driver_ids
+    ))
+
+    truck_ids = range(1, args.trucks + 1)
+    capacities = {}
+
+    def truck_rows():
+        for i in truck_ids:
+            model, capacity = rng.choice(TRUCK_MODELS)
+            capacities[i] = capacity
+            reg = f"{rng.choice(STATE_CODES)}-{rng.randint(1, 99):02d}-{chr(65 + i % 26)}{chr(65 + (i // 26) % 26)}-{i % 10000:04d}"
+            yield i, reg, model, capacity, rng.choice(owner_ids)
+
+    step('trucks', 'TRUCK', ['TruckID', 'RegistrationNum', 'Model_Id', 'Capacity_in_Tons', 'OwnerID'], truck_rows())
+
+    step('goods', 'GOODS', ['GoodsID', 'GoodsName', 'GoodsType'], (
+        (i, name, kind) for i, (name, kind) in enumerate(GOODS, start=1)
+    ))
+
+    # Trips, shipments and maintenance come from one pass over the schedule. Each batch
+    # of trips is written before its shipments so nothing is held for the whole run.
+    trip_sql = ("INSERT INTO TRIP (TripID, Origin, Destination, StartDate, EndDate, Status, TruckID, DriverID, ClientID) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)")
+    shipment_sql = "INSERT INTO SHIPMENT (TripID, GoodsID, Quantity) VALUES (%s, %s, %s)"
+    maintenance_sql = "INSERT INTO MAINTENANCE (TruckID, MaintenanceDate, EndDate, Description) VALUES (%s, %s, %s, %s)"
+    counts = {'trips': 0, 'shipments': 0, 'maintenance': 0}
+    trips, shipments, maintenance = [], [], []
+    truck_last_end = {}
+
+    def flush():
+        for key, sql, rows in (('trips', trip_sql, trips), ('shipments', shipment_sql, shipments),
+                               ('maintenance', maintenance_sql, maintenance)):
+            if rows:
+                cursor.executemany(sql, rows)
+                counts[key] += len(rows)
+                rows.clear()
+        conn.commit()
+
+    started = time.perf_counter()
+    schedule = generate_schedule(rng, args.trips, truck_ids, driver_ids, first_day)
+    for trip_id, (truck_id, driver_id, start, end) in enumerate(schedule, start=1):
+        origin, destination = rng.sample(CITIES, 2)
+        status = trip_status(start, end, today, rng, args.cancel_rate)
+        trips.append((trip_id, origin, destination, start, end, status, truck_id, driver_id, rng.choice(client_ids)))
+
+        # Split up to the truck's capacity (tons) across 1-3 shipments.
+        load = rng.randint(1, capacities[truck_id])
+        parts = rng.randint(1, min(3, load))
+        for part in range(parts):
+            quantity = load // parts + (1 if part < load % parts else 0)
+            shipments.append((trip_id, rng.randint(1, len(GOODS)), quantity))
+
+        # Service the truck in the gap before this trip, when there is one.
+        previous_end = truck_last_end.get(truck_id)
+        if previous_end and start > previous_end and rng.random() < args.maintenance_rate:
+            service_end = min(start, previous_end + timedelta(days=rng.randint(1, 3)))
+            maintenance.append((truck_id, previous_end, service_end, rng.choice(MAINTENANCE_TASKS)))
+        truck_last_end[truck_id] = end
+
+        if len(trips) >= args.batch_size:
+            flush()
+
+    # Upcoming trips booked without a truck or driver, for scheduler.py to assign.
+    max_capacity = max(capacities.values())
+    for trip_id in range(args.trips + 1, args.trips + args.requests + 1):
+        origin, destination = rng.sample(CITIES, 2)
+        start = today + timedelta(days=rng.randint(1, args.request_days))
+        end = start + timedelta(days=rng.randint(7, 14))
+        trips.append((trip_id, origin, destination, start, end, 'Requested', None, None, rng.choice(client_ids)))
+        shipments.append((trip_id, rng.randint(1, len(GOODS)), rng.randint(1, max_capacity)))
+        if len(trips) >= args.batch_size:
+            flush()
+    flush()
+    elapsed = time.perf_counter() - started
+    for key, count in counts.items():
+        timings[key] = (count, elapsed)
+    print(f"  trips: {counts['trips']}, shipments: {counts['shipments']}, maintenance: {counts['maintenance']} rows in {elapsed:.1f}s")
+
+    stats.reconcile_counters(conn)
+    cursor.close()
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic truck management dataset.')
+    parser.add_argument('--owners', type=int, default=20)
+    parser.add_argument('--trucks', type=int, default=200)
+    parser.add_argument('--drivers', type=int, default=250)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--users', type=int, default=0, help='Total non-admin users (at least one per client)')
+    parser.add_argument('--trips', type=int, default=20000)
+    parser.add_argument('--history-days', type=int, default=730, help='How far back the schedule starts')
+    parser.add_argument('--requests', type=int, default=0, help="Upcoming 'Requested' trips with no truck or driver")
+    parser.add_argument('--request-days', type=int, default=90, help='Requested trips start within this many days')
+    parser.add_argument('--cancel-rate', type=float, default=0.05)
+    parser.add_argument('--maintenance-rate', type=float, default=0.2)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sqlite', metavar='PATH', help='Write to a SQLite file instead of MySQL')
+    args = parser.parse_args(argv)
+    if min(args.owners, args.trucks, args.drivers, args.clients) < 1:
+        parser.error('owners, trucks, drivers and clients must all be at least 1')
+
+    started = time.perf_counter()
+    if args.sqlite:
+        conn = connect_sqlite(args.sqlite)
+        cursor = conn.cursor()
+        for table in ['SHIPMENT', 'MAINTENANCE', 'TRIP', 'SHIPMENT_ARCHIVE', 'TRIP_ARCHIVE', 'TRUCK', 'DRIVER', 'CLIENT', 'USERS', 'GOODS', 'OWNER', 'STATS']:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in SQLITE_SCHEMA:
+            cursor.execute(statement)
+        conn.commit()
+    else:
+        from Serial_2_db_values_insertion import recreate_schema
+        conn = mysql.connector.connect(**db_config)
+        cursor = conn.cursor()
+        print("Dropping & recreating schema...")
+        recreate_schema(cursor)
+        # Referential integrity is guaranteed by construction; skip the per-row checks during the load.
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        cursor.execute("SET UNIQUE_CHECKS = 0")
+    cursor.close()
+
+    print("Generating data...")
+    generate(conn, args)
+
+    if not args.sqlite:
+        cursor = conn.cursor()
+        cursor.execute("SET UNIQUE_CHECKS = 1")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        cursor.close()
+    conn.close()
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
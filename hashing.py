@@ -0,0 +1,196 @@
+"""
+Password hashing off the request thread, plus login throttling.
+
+bcrypt is CPU-bound by design, so a burst of logins used to pin every WSGI
+worker. PasswordHasher runs it in a small process pool and refuses new work
+(HasherBusy) once too many hashes are queued, so the app answers quickly
+instead of stalling. Hashes are plain bcrypt, compatible with flask_bcrypt.
+"""
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+# bcrypt only ever looked at the first 72 bytes; newer releases raise instead of truncating.
+MAX_PASSWORD_BYTES = 72
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password_hash, password):
+    try:
+        return bcrypt.checkpw(_encode(password), password_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def hash_rounds(password_hash):
+    """The work factor stored in a bcrypt hash ('$2b$12$...' -> 12)."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords in `workers` separate processes. At most
+    `max_pending` calls may be queued or running; beyond that HasherBusy is
+    raised immediately. Calls that time out or hit a dead worker raise
+    HasherBusy too; a timed-out call keeps its slot until its worker is
+    actually done with it, and a broken pool is replaced on the next call. With
+    workers=0 hashing runs inline (handy for tests).
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=8, timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # 'spawn' so workers never inherit locks held by other threads at fork time.
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy('Too many password operations in progress')
+            self._pending += 1
+        executor = self._get_executor()
+        future = None
+        try:
+            future = executor.submit(fn, *args)
+            future.add_done_callback(self._release)
+            result = future.result(self.timeout)
+        except (FutureTimeout, BrokenProcessPool) as e:
+            with self._lock:
+                self.failed += 1
+                if isinstance(e, BrokenProcessPool) and self._executor is executor:
+                    # A worker died (e.g. OOM-killed); the pool is unusable from now on.
+                    self._executor = None
+            if isinstance(e, BrokenProcessPool):
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise HasherBusy('Password operation failed; try again') from e
+        finally:
+            if future is None:
+                self._release()
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, password_hash, password):
+        return self._run(_check, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'rounds': self.rounds,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'failed': self.failed,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Login Throttling ---
+class LoginThrottle:
+    """
+    Counts failed logins per username and per client IP over a sliding window
+    and blocks further attempts once either limit is hit, before any bcrypt
+    work is done. At most `max_keys` usernames and IPs are tracked; past that,
+    expired entries are dropped and then the least recently failed ones.
+    """
+
+    def __init__(self, max_per_user=5, max_per_ip=20, window_seconds=300, max_keys=100000):
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self.window = window_seconds
+        self.max_keys = max_keys
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+        self.blocked_attempts = 0
+
+    def _recent(self, key, now):
+        attempts = self._failures.get(key)
+        if not attempts:
+            return 0
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self._failures[key]
+            return 0
+        return len(attempts)
+
+    def is_blocked(self, username, ip):
+        now = time.monotonic()
+        with self._lock:
+            blocked = (self._recent(('user', username), now) >= self.max_per_user
+                       or self._recent(('ip', ip), now) >= self.max_per_ip)
+            if blocked:
+                self.blocked_attempts += 1
+            return blocked
+
+    def record_failure(self, username, ip):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._failures) >= self.max_keys:
+                self._prune(now)
+            for key in (('user', username), ('ip', ip)):
+                self._failures.setdefault(key, deque()).append(now)
+                self._failures.move_to_end(key)
+
+    def reset(self, username):
+        with self._lock:
+            self._failures.pop(('user', username), None)
+
+    def _prune(self, now):
+        for key in list(self._failures):
+            self._recent(key, now)
+        # Evict a tenth at a time so a flood of new keys doesn't rescan on every failure.
+        while len(self._failures) > self.max_keys * 0.9:
+            self._failures.popitem(last=False)
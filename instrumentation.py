@@ -0,0 +1,303 @@
+"""
+Per-request query instrumentation.
+
+Every pooled connection is wrapped so each statement is timed and its rows
+counted. Totals for the current request go out as X-DB-Queries / X-DB-Time-ms
+and Server-Timing headers, and are aggregated into Prometheus metrics served
+by /metrics. Statements slower than SLOW_QUERY_MS are logged; with
+SLOW_QUERY_EXPLAIN on, their EXPLAIN plan is captured at the end of the request
+and kept with the recent slow queries shown at /admin/slow_queries.
+
+asgi.py's native pages don't pass through Flask's request hooks; they record
+their async queries with record_statement() and end with finish_request(),
+the same as the Flask routes.
+"""
+import threading
+import time
+from collections import deque
+
+from flask import current_app, g, has_app_context, request
+
+from db import is_sqlite
+
+STATEMENT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# --- Cursor Wrapper ---
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = None
+
+    def execute(self, sql, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params, *args, **kwargs)
+        finally:
+            self._statement = _record(sql, params, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq_of_params, *args, **kwargs)
+        finally:
+            self._statement = _record(sql, None, time.perf_counter() - started)
+
+    def _fetched(self, rows, started):
+        # Row transfer happens during fetch on unbuffered cursors, so it counts towards the statement.
+        _add_fetch(self._statement, rows, time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(0 if row is None else 1, started)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._fetched(len(rows), started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows), started)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            _add_fetch(self._statement, 1, 0.0)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def wrap_connect(connect):
+    return lambda: InstrumentedConnection(connect())
+
+
+# --- Per-Request Profile ---
+class RequestProfile:
+    __slots__ = ('queries', 'rows', 'db_time', 'slow', 'started')
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.slow = []
+        self.started = time.perf_counter()
+
+    def add(self, sql, params, elapsed, threshold, rows=0):
+        """Counts one statement and returns its record (kept in `slow` if it took `threshold` seconds or more)."""
+        self.queries += 1
+        self.rows += rows
+        self.db_time += elapsed
+        statement = {'sql': ' '.join(str(sql).split()), 'params': params, 'seconds': elapsed, 'rows': rows}
+        if elapsed >= threshold:
+            self.slow.append(statement)
+        return statement
+
+    def merge(self, other):
+        self.queries += other.queries
+        self.rows += other.rows
+        self.db_time += other.db_time
+        self.slow.extend(other.slow)
+
+
+def _profile():
+    if not has_app_context():
+        return None
+    return g.get('_db_profile')
+
+
+def slow_threshold(app):
+    return app.config.get('SLOW_QUERY_MS', 100) / 1000
+
+
+def _record(sql, params, elapsed):
+    metrics.observe_statement(elapsed)
+    profile = _profile()
+    if profile is None:
+        return None
+    return profile.add(sql, params, elapsed, slow_threshold(current_app))
+
+
+def record_statement(app, profile, sql, params, elapsed, rows):
+    """Records a statement run outside an instrumented cursor (asgi.py's async queries), fetch included."""
+    metrics.observe_statement(elapsed)
+    if profile is not None:
+        profile.add(sql, params, elapsed, slow_threshold(app), rows)
+
+
+def _add_fetch(statement, rows, elapsed):
+    profile = _profile()
+    if profile is None:
+        return
+    profile.rows += rows
+    profile.db_time += elapsed
+    if statement is None:
+        return
+    statement['rows'] += rows
+    statement['seconds'] += elapsed
+    if statement['seconds'] >= slow_threshold(current_app) and not any(s is statement for s in profile.slow):
+        profile.slow.append(statement)
+
+
+# --- Metrics Registry ---
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+    def render(self, name, labels=''):
+        sep = ',' if labels else ''
+        lines = [f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}' for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.total}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum:.6f}')
+        lines.append(f'{name}_count{suffix} {self.total}')
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statement_seconds = Histogram(STATEMENT_BUCKETS)
+        self.requests = {}          # endpoint -> request count
+        self.queries = {}           # endpoint -> statements issued
+        self.db_seconds = {}        # endpoint -> seconds spent in the DB
+        self.request_seconds = {}   # endpoint -> Histogram
+        self.slow_queries = 0
+
+    def observe_statement(self, elapsed):
+        with self._lock:
+            self.statement_seconds.observe(elapsed)
+
+    def observe_request(self, endpoint, profile, elapsed):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.queries[endpoint] = self.queries.get(endpoint, 0) + profile.queries
+            self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0.0) + profile.db_time
+            self.request_seconds.setdefault(endpoint, Histogram(REQUEST_BUCKETS)).observe(elapsed)
+            self.slow_queries += len(profile.slow)
+
+    def render(self, gauges=None):
+        """Prometheus text exposition format. `gauges` adds {name: value} point-in-time values."""
+        with self._lock:
+            lines = [
+                '# HELP tms_http_requests_total HTTP requests handled, by endpoint.',
+                '# TYPE tms_http_requests_total counter',
+            ]
+            lines += [f'tms_http_requests_total{{endpoint="{e}"}} {n}' for e, n in sorted(self.requests.items())]
+            lines += ['# HELP tms_db_queries_total SQL statements issued, by endpoint.',
+                      '# TYPE tms_db_queries_total counter']
+            lines += [f'tms_db_queries_total{{endpoint="{e}"}} {n}' for e, n in sorted(self.queries.items())]
+            lines += ['# HELP tms_db_seconds_total Time spent in the database, by endpoint.',
+                      '# TYPE tms_db_seconds_total counter']
+            lines += [f'tms_db_seconds_total{{endpoint="{e}"}} {s:.6f}' for e, s in sorted(self.db_seconds.items())]
+            lines += ['# HELP tms_request_duration_seconds Request latency, by endpoint.',
+                      '# TYPE tms_request_duration_seconds histogram']
+            for e, hist in sorted(self.request_seconds.items()):
+                lines += hist.render('tms_request_duration_seconds', f'endpoint="{e}"')
+            lines += ['# HELP tms_db_statement_seconds Latency of individual SQL statements.',
+                      '# TYPE tms_db_statement_seconds histogram']
+            lines += self.statement_seconds.render('tms_db_statement_seconds')
+            lines += ['# HELP tms_db_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+                      '# TYPE tms_db_slow_queries_total counter',
+                      f'tms_db_slow_queries_total {self.slow_queries}']
+        for name, value in sorted((gauges or {}).items()):
+            lines += [f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+recent_slow_queries = deque(maxlen=50)
+
+
+# --- EXPLAIN Capture ---
+def explain(conn, sql, params):
+    """Returns the plan for a SELECT as a list of rows (EXPLAIN on MySQL, EXPLAIN QUERY PLAN on SQLite)."""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if is_sqlite(conn) else 'EXPLAIN '
+    conn = getattr(conn, 'raw', conn)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(prefix + sql, params or ())
+        return [{k: str(v) if v is not None else None for k, v in row.items()} for row in cursor.fetchall()]
+    except Exception as e:
+        return [{'error': str(e)}]
+    finally:
+        cursor.close()
+
+
+# --- Request Completion ---
+def finish_request(app, profile, endpoint, path, conn=None):
+    """
+    Records a finished request's profile in the metrics and logs its slow
+    statements, with EXPLAIN plans from `conn` when SLOW_QUERY_EXPLAIN is on.
+    Returns the X-DB-Queries, X-DB-Time-ms and Server-Timing headers.
+    """
+    elapsed = time.perf_counter() - profile.started
+    metrics.observe_request(endpoint, profile, elapsed)
+
+    for statement in profile.slow:
+        app.logger.warning('Slow query (%.1f ms, %d rows) on %s: %s params=%r',
+                           statement['seconds'] * 1000, statement['rows'], path,
+                           statement['sql'], statement['params'])
+        entry = dict(statement, path=path, seconds=round(statement['seconds'], 6), at=time.time())
+        if app.config.get('SLOW_QUERY_EXPLAIN') and conn is not None:
+            entry['explain'] = explain(conn, statement['sql'], statement['params'])
+        entry['params'] = repr(statement['params'])
+        recent_slow_queries.append(entry)
+
+    db_ms = profile.db_time * 1000
+    return [('X-DB-Queries', str(profile.queries)),
+            ('X-DB-Time-ms', f'{db_ms:.2f}'),
+            ('Server-Timing', f'db;dur={db_ms:.2f};desc="{profile.queries} queries", app;dur={elapsed * 1000:.2f}')]
+
+
+# --- Flask Integration ---
+def init_app(app):
+    app.extensions.setdefault('db_wrappers', []).append(wrap_connect)
+
+    @app.before_request
+    def start_profile():
+        g._db_profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('_db_profile', None)
+        if profile is None:
+            return response
+        headers = finish_request(app, profile, request.endpoint or 'unknown', request.path, g.get('db'))
+        for name, value in headers:
+            response.headers[name] = value
+        return response
@@ -0,0 +1,240 @@
+"""
+Trip status transitions: bulk admin changes and the date-driven lifecycle.
+
+    python lifecycle.py [--date YYYY-MM-DD] [--chunk-size 1000] [--dry-run]
+
+set_status() moves any number of trips to one status with a single UPDATE
+in one transaction. advance() is the lifecycle job, run hourly or nightly
+like scheduler.py and archive.py, or on demand from POST /admin/lifecycle.
+It marks Scheduled trips whose StartDate has come as 'In Progress', and
+Scheduled or In Progress trips whose EndDate has passed as 'Completed'.
+Trips occupy [StartDate, EndDate), so a trip ending today is already done.
+
+Each step works in chunks: lock up to `chunk_size` due TripIDs through the
+(Status, StartDate) index, update them by primary key, commit. Updated rows
+leave the filter, so the next chunk starts where the last one ended. The job
+only ever scans trips whose status is stale.
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+from datetime import date
+
+import stats
+from availability import existing_ids, load_busy
+from db import for_update, is_sqlite
+from trips import ARCHIVED_STATUSES, INACTIVE_STATUSES, TRIP_STATUSES
+
+# (from statuses, new status, due filter). Completion runs first so a trip that
+# started and ended since the last run goes straight to 'Completed'.
+# StartDate < %s is implied by EndDate <= %s; it lets (Status, StartDate) drive the scan.
+STEPS = (
+    (('Scheduled', 'In Progress'), 'Completed', "StartDate < %s AND EndDate <= %s"),
+    (('Scheduled',), 'In Progress', "StartDate <= %s AND EndDate > %s"),
+)
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _owner_column():
+    return "(SELECT UserID FROM CLIENT WHERE ClientID = TRIP.ClientID)"
+
+
+def _apply(cursor, rows, new_status):
+    """One UPDATE for the locked `rows` (TripID, Status, UserID), plus the matching counter changes."""
+    trip_ids = [row[0] for row in rows]
+    cursor.execute(f"UPDATE TRIP SET Status = %s WHERE TripID IN ({_placeholders(trip_ids)})", [new_status, *trip_ids])
+    for old_status, count in Counter(row[1] for row in rows).items():
+        stats.bump(cursor, stats.trip_stat(old_status), -count)
+    stats.bump(cursor, stats.trip_stat(new_status), len(rows))
+    stats.bump_version(cursor, stats.TRIPS_VERSION)
+
+
+# --- Bulk Changes ---
+def _reopened(rows, new_status):
+    """The rows (TripID, Status, UserID, TruckID, DriverID, StartDate, EndDate) that would take their truck and driver back."""
+    if new_status in INACTIVE_STATUSES:
+        return []
+    return [row for row in rows if row[1] in ARCHIVED_STATUSES]
+
+
+def _reopen_conflicts(cursor, rows, locked_trucks, locked_drivers):
+    """
+    Checks the trips being reopened against everything else on their trucks and
+    drivers, each other included. Returns {TripID: reason} for the ones that can't be.
+    """
+    start = min(row[5] for row in rows)
+    end = max(row[6] for row in rows)
+    truck_busy = load_busy(cursor, 'TruckID', locked_trucks, start, end)
+    driver_busy = load_busy(cursor, 'DriverID', locked_drivers, start, end)
+    conflicts = {}
+    for trip_id, _, _, truck_id, driver_id, start, end in rows:
+        if truck_id is None or driver_id is None:
+            # Cancelled while still Requested: there is nothing to take back.
+            conflicts[trip_id] = 'It was never assigned a truck and driver'
+        elif truck_id not in locked_trucks or driver_id not in locked_drivers:
+            conflicts[trip_id] = 'Its truck or driver no longer exists'
+        elif not truck_busy.is_free(truck_id, start, end):
+            conflicts[trip_id] = 'Its truck has been booked or sent to maintenance since'
+        elif not driver_busy.is_free(driver_id, start, end):
+            conflicts[trip_id] = 'Its driver has been booked since'
+        else:
+            truck_busy.add(truck_id, start, end, trip_id)
+            driver_busy.add(driver_id, start, end, trip_id)
+    return conflicts
+
+
+def set_status(conn, trip_ids, new_status):
+    """
+    Moves `trip_ids` to `new_status` in one transaction. Returns a report whose
+    'changed' list holds (TripID, UserID, previous status) for each trip updated.
+    Trips already in that status are 'unchanged'. Requested trips have no truck
+    or driver, so they can only be cancelled, and nothing moves back to Requested:
+    those are 'rejected'. Unknown ids are 'missing'.
+
+    Reopening a Completed or Cancelled trip takes its truck and driver back, so
+    like reserve_trip() it locks them and re-checks their other trips and
+    maintenance; a trip whose resources were booked since is 'rejected' too and
+    listed in 'conflicts' with the reason.
+    """
+    if new_status not in TRIP_STATUSES:
+        raise ValueError(f'Unknown status {new_status!r}.')
+    trip_ids = sorted(set(trip_ids))
+    report = {'status': new_status, 'changed': [], 'unchanged': [], 'rejected': [], 'missing': [], 'conflicts': []}
+    if not trip_ids:
+        return report
+
+    select_trips = (f"SELECT TripID, Status, {_owner_column()}, TruckID, DriverID, StartDate, EndDate FROM TRIP "
+                    f"WHERE TripID IN ({_placeholders(trip_ids)})")
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        if is_sqlite(conn):
+            cursor.execute("BEGIN IMMEDIATE")
+        lock = for_update(conn)
+        # Trucks and drivers are locked before the trips, in the same order as
+        # reserve_trip() and scheduler.apply_chunk(), so the three never deadlock.
+        locked_trucks, locked_drivers = set(), set()
+        if new_status not in INACTIVE_STATUSES:
+            cursor.execute(select_trips, trip_ids)
+            reopening = _reopened(cursor.fetchall(), new_status)
+            locked_trucks = existing_ids(cursor, 'TRUCK', 'TruckID', {row[3] for row in reopening} - {None}, lock)
+            locked_drivers = existing_ids(cursor, 'DRIVER', 'DriverID', {row[4] for row in reopening} - {None}, lock)
+        cursor.execute(select_trips + lock, trip_ids)
+        rows = cursor.fetchall()
+        found = {row[0] for row in rows}
+        report['missing'] = [trip_id for trip_id in trip_ids if trip_id not in found]
+        reopening = _reopened(rows, new_status)
+        conflicts = _reopen_conflicts(cursor, reopening, locked_trucks, locked_drivers) if reopening else {}
+        changed = []
+        for row in rows:
+            if row[1] == new_status:
+                report['unchanged'].append(row[0])
+            elif 'Requested' in (row[1], new_status) and new_status != 'Cancelled':
+                report['rejected'].append(row[0])
+            elif row[0] in conflicts:
+                report['rejected'].append(row[0])
+                report['conflicts'].append({'trip_id': row[0], 'reason': conflicts[row[0]]})
+            else:
+                changed.append(row)
+        if changed:
+            _apply(cursor, changed, new_status)
+        conn.commit()
+        report['changed'] = [(row[0], row[2], row[1]) for row in changed]
+        return report
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# --- Lifecycle Job ---
+def advance_batch(conn, from_statuses, new_status, due_filter, today, chunk_size):
+    """Moves up to `chunk_size` due trips to `new_status`. Returns their (TripID, UserID, previous status)."""
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        if is_sqlite(conn):
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f"SELECT TripID, Status, {_owner_column()} FROM TRIP "
+                       f"WHERE Status IN ({_placeholders(from_statuses)}) AND {due_filter} LIMIT %s" + for_update(conn),
+                       [*from_statuses, today, today, chunk_size])
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return []
+        _apply(cursor, rows, new_status)
+        conn.commit()
+        return [(trip_id, user_id, old_status) for trip_id, old_status, user_id in rows]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def count_due(cursor, today):
+    """{new status: trips due for it}. Trips counted for 'Completed' are not counted again."""
+    due = {}
+    for from_statuses, new_status, due_filter in STEPS:
+        cursor.execute(f"SELECT COUNT(*) FROM TRIP WHERE Status IN ({_placeholders(from_statuses)}) AND {due_filter}",
+                       [*from_statuses, today, today])
+        due[new_status] = cursor.fetchone()[0]
+    return due
+
+
+def advance(conn, today=None, chunk_size=1000, dry_run=False, on_change=None):
+    """
+    Brings every trip's status in line with its dates as of `today`. Calls
+    on_change(changed, new_status) after each committed chunk, with changed as
+    (TripID, UserID, previous status) tuples.
+    Returns a report of the rows affected per status and the runtime.
+    """
+    started = time.perf_counter()
+    today = today or date.today()
+    report = {'dry_run': dry_run, 'date': today.isoformat(), 'chunks': 0}
+    if dry_run:
+        cursor = conn.cursor()
+        report['updated'] = count_due(cursor, today)
+        cursor.close()
+        conn.rollback()
+    else:
+        report['updated'] = {}
+        for from_statuses, new_status, due_filter in STEPS:
+            report['updated'][new_status] = 0
+            while True:
+                changed = advance_batch(conn, from_statuses, new_status, due_filter, today, chunk_size)
+                if not changed:
+                    break
+                report['updated'][new_status] += len(changed)
+                report['chunks'] += 1
+                if on_change is not None:
+                    on_change(changed, new_status)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+# --- CLI ---
+def main(argv=None):
+    from app import app
+    from db import get_db
+
+    parser = argparse.ArgumentParser(description='Advance trip statuses by their start and end dates.')
+    parser.add_argument('--date', type=date.fromisoformat, help='Treat this as today (default: today)')
+    parser.add_argument('--chunk-size', type=int, default=app.config['LIFECYCLE_CHUNK_SIZE'])
+    parser.add_argument('--dry-run', action='store_true', help='Only count the trips that would change')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        report = advance(get_db(), args.date, args.chunk_size, args.dry_run)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
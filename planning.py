@@ -0,0 +1,312 @@
+"""
+Load consolidation and multi-stop route planning.
+
+Requested bookings (booked without a truck, see scheduler.py) that leave the
+same city on the same day are pooled, and their loads (SHIPMENT.Quantity, in
+tons) are packed onto trucks as multi-stop tours: origin -> drop 1 -> drop 2
+-> ... -> origin. Tours are built with the Clarke-Wright savings heuristic,
+capped at the largest truck's capacity, and each tour's stop order is then
+improved with 2-opt. Finally every tour gets the smallest truck it fits on
+that is free for the tour's whole duration, from its start date to its last
+booking's end date: not on an active trip, in maintenance, or on a tour
+planned earlier in the same run.
+
+Distances come from an offline matrix: great-circle distance between city
+coordinates, scaled by ROAD_FACTOR to approximate road distance. A CSV of
+measured road distances (origin,destination,km) overrides individual pairs.
+The matrix is computed once per process.
+
+The plan is advisory: nothing is written back to TRIP.
+"""
+import csv
+import math
+import time
+from bisect import bisect_left
+from datetime import timedelta
+from functools import lru_cache
+
+from availability import BusyIntervals, load_busy
+
+CITY_COORDINATES = {
+    'Ahmedabad': (23.0225, 72.5714), 'Bangalore': (12.9716, 77.5946), 'Bhopal': (23.2599, 77.4126),
+    'Chennai': (13.0827, 80.2707), 'Coimbatore': (11.0168, 76.9558), 'Delhi': (28.7041, 77.1025),
+    'Hyderabad': (17.3850, 78.4867), 'Indore': (22.7196, 75.8577), 'Jaipur': (26.9124, 75.7873),
+    'Kochi': (9.9312, 76.2673), 'Kolkata': (22.5726, 88.3639), 'Lucknow': (26.8467, 80.9462),
+    'Madurai': (9.9252, 78.1198), 'Mumbai': (19.0760, 72.8777), 'Nagpur': (21.1458, 79.0882),
+    'Pune': (18.5204, 73.8567), 'Surat': (21.1702, 72.8311), 'Vizag': (17.6868, 83.2185),
+}
+ROAD_FACTOR = 1.25
+EARTH_RADIUS_KM = 6371.0
+
+
+# --- Distance Matrix ---
+def great_circle_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+class DistanceMatrix:
+    """Dense city-to-city road distances in km, addressed by city index."""
+
+    def __init__(self, coordinates=None, road_factor=ROAD_FACTOR):
+        coordinates = coordinates or CITY_COORDINATES
+        self.cities = sorted(coordinates)
+        self._index = {name.lower(): i for i, name in enumerate(self.cities)}
+        points = [coordinates[name] for name in self.cities]
+        self.km = [[round(great_circle_km(a, b) * road_factor, 1) for b in points] for a in points]
+
+    def city_index(self, name):
+        """Index of a city by (case-insensitive) name, or None if it isn't in the matrix."""
+        return self._index.get((name or '').strip().lower())
+
+    def load_csv(self, path):
+        """Overrides pairs with measured distances from a CSV of origin,destination,km rows."""
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 3:
+                    continue
+                i, j = self.city_index(row[0]), self.city_index(row[1])
+                try:
+                    km = float(row[2])
+                except ValueError:
+                    continue  # header
+                if i is not None and j is not None:
+                    self.km[i][j] = self.km[j][i] = km
+
+
+@lru_cache(maxsize=4)
+def distance_matrix(path=None):
+    matrix = DistanceMatrix()
+    if path:
+        matrix.load_csv(path)
+    return matrix
+
+
+# --- Loading ---
+def load_pending(cursor, date_from, date_to):
+    """Requested trips (no truck yet) starting in [date_from, date_to] with their total shipment tons."""
+    cursor.execute("""
+        SELECT t.TripID, t.Origin, t.Destination, t.StartDate, t.EndDate, COALESCE(SUM(s.Quantity), 0) AS Quantity
+        FROM TRIP t LEFT JOIN SHIPMENT s ON s.TripID = t.TripID
+        WHERE t.Status = 'Requested' AND t.StartDate >= %s AND t.StartDate <= %s
+        GROUP BY t.TripID, t.Origin, t.Destination, t.StartDate, t.EndDate
+    """, (date_from, date_to))
+    return cursor.fetchall()
+
+
+def load_trucks(cursor):
+    cursor.execute("SELECT TruckID, Capacity_in_Tons FROM TRUCK WHERE Capacity_in_Tons > 0")
+    return cursor.fetchall()
+
+
+def load_truck_busy(cursor, trucks, bookings):
+    """Active trips and maintenance on `trucks` during the bookings' dates. Needs a tuple cursor (see load_busy)."""
+    if not bookings:
+        return BusyIntervals()
+    start = min(booking['StartDate'] for booking in bookings)
+    end = max(booking['EndDate'] for booking in bookings)
+    return load_busy(cursor, 'TruckID', {truck['TruckID'] for truck in trucks}, start, end)
+
+
+# --- Solver ---
+def _pack_by_destination(items, capacity):
+    """
+    First-fit decreasing per destination, so each node the savings step sees is
+    one drop of at most `capacity` tons. Returns [(city, load, bookings)].
+    """
+    by_city = {}
+    for city, booking in items:
+        by_city.setdefault(city, []).append(booking)
+    nodes = []
+    for city, bookings in by_city.items():
+        bins = []  # [load, bookings]
+        for booking in sorted(bookings, key=lambda b: -b['Quantity']):
+            for b in bins:
+                if b[0] + booking['Quantity'] <= capacity:
+                    b[0] += booking['Quantity']
+                    b[1].append(booking)
+                    break
+            else:
+                bins.append([booking['Quantity'], [booking]])
+        nodes += [(city, load, packed) for load, packed in bins]
+    return nodes
+
+
+def _savings_routes(origin, nodes, capacity, km):
+    """Clarke-Wright (parallel) savings. Returns lists of node indexes, one per tour."""
+    depot = km[origin]
+    cities = [node[0] for node in nodes]
+    savings = []
+    for i in range(len(nodes)):
+        for j in range(i + 1, len(nodes)):
+            saving = depot[cities[i]] + depot[cities[j]] - km[cities[i]][cities[j]]
+            if saving > 0:
+                savings.append((saving, i, j))
+    savings.sort(reverse=True)
+
+    route_of = list(range(len(nodes)))
+    routes = {i: [i] for i in range(len(nodes))}
+    loads = {i: nodes[i][1] for i in range(len(nodes))}
+    for _, i, j in savings:
+        ri, rj = route_of[i], route_of[j]
+        if ri == rj or loads[ri] + loads[rj] > capacity:
+            continue
+        a, b = routes[ri], routes[rj]
+        # Only tour ends can be joined.
+        if a[-1] == i and b[0] == j:
+            merged = a + b
+        elif a[0] == i and b[-1] == j:
+            merged = b + a
+        elif a[-1] == i and b[-1] == j:
+            merged = a + b[::-1]
+        elif a[0] == i and b[0] == j:
+            merged = a[::-1] + b
+        else:
+            continue
+        routes[ri] = merged
+        loads[ri] += loads.pop(rj)
+        del routes[rj]
+        for node in b:
+            route_of[node] = ri
+    return list(routes.values())
+
+
+def _two_opt(tour, dist):
+    """Improves a closed tour (first and last entries fixed at the depot) in place."""
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(tour) - 2):
+            for j in range(i + 1, len(tour) - 1):
+                a, b, c, d = tour[i - 1], tour[i], tour[j], tour[j + 1]
+                if dist(a, c) + dist(b, d) < dist(a, b) + dist(c, d) - 1e-9:
+                    tour[i:j + 1] = tour[i:j + 1][::-1]
+                    improved = True
+    return tour
+
+
+def _tour_km(cities, km):
+    return sum(km[a][b] for a, b in zip(cities, cities[1:]))
+
+
+def plan_group(origin, items, capacity, matrix):
+    """Tours for one (day, origin) pool. `items` are (destination index, booking) pairs."""
+    km = matrix.km
+    nodes = _pack_by_destination(items, capacity)
+    tours = []
+    for route in _savings_routes(origin, nodes, capacity, km):
+        # 2-opt over node indexes, with -1 standing for the depot.
+        city = lambda n: origin if n < 0 else nodes[n][0]
+        order = _two_opt([-1] + route + [-1], lambda a, b: km[city(a)][city(b)])[1:-1]
+
+        stops, items = [], []
+        for n in order:
+            dest, load, packed = nodes[n]
+            trip_ids = [booking['TripID'] for booking in packed]
+            items += [(dest, booking) for booking in packed]
+            if stops and stops[-1]['city_index'] == dest:
+                stops[-1]['load'] += load
+                stops[-1]['trip_ids'] += trip_ids
+            else:
+                stops.append({'city_index': dest, 'load': load, 'trip_ids': trip_ids})
+        path = [origin] + [stop['city_index'] for stop in stops] + [origin]
+        tours.append({'stops': stops, 'items': items, 'load': sum(stop['load'] for stop in stops),
+                      'end_date': max(booking['EndDate'] for _, booking in items),
+                      'distance_km': round(_tour_km(path, km), 1)})
+    return tours
+
+
+def _route(day, origin, truck_id, capacity, tour, matrix):
+    return {
+        'date': day.isoformat(),
+        'end_date': tour['end_date'].isoformat(),
+        'origin': matrix.cities[origin],
+        'truck_id': truck_id,
+        'capacity': capacity,
+        'load': tour['load'],
+        'stops': [{'city': matrix.cities[stop['city_index']], 'load': stop['load'], 'trip_ids': stop['trip_ids']}
+                  for stop in tour['stops']],
+        'distance_km': tour['distance_km'],
+        'direct_distance_km': round(sum(2 * matrix.km[origin][stop['city_index']] * len(stop['trip_ids'])
+                                        for stop in tour['stops']), 1),
+    }
+
+
+def _free_truck(fleet, busy, load, start, end):
+    """The smallest (capacity, TruckID) in `fleet` that carries `load` and is free for [start, end), or None."""
+    for capacity, truck_id in fleet[bisect_left(fleet, (load, -1)):]:
+        if busy.is_free(truck_id, start, end):
+            return capacity, truck_id
+    return None
+
+
+def plan(bookings, trucks, matrix=None, busy=None):
+    """
+    Consolidates `bookings` (TripID, Origin, Destination, StartDate, EndDate,
+    Quantity) onto `trucks` (TruckID, Capacity_in_Tons), avoiding the trucks'
+    existing commitments in `busy` (see load_truck_busy). Returns {'routes',
+    'unplanned', 'summary'}. Distances include the return leg to the origin;
+    direct_distance_km is what the same bookings would cost as one round trip each.
+    """
+    started = time.perf_counter()
+    matrix = matrix or distance_matrix()
+    busy = busy or BusyIntervals()
+    fleet = sorted((t['Capacity_in_Tons'], t['TruckID']) for t in trucks if t['Capacity_in_Tons'])
+    max_capacity = fleet[-1][0] if fleet else 0
+
+    groups, unplanned = {}, []
+    for booking in bookings:
+        origin, dest = matrix.city_index(booking['Origin']), matrix.city_index(booking['Destination'])
+        quantity = int(booking['Quantity'] or 0)
+        if origin is None or dest is None:
+            unplanned.append({'trip_id': booking['TripID'], 'reason': 'Unknown city'})
+        elif quantity > max_capacity:
+            unplanned.append({'trip_id': booking['TripID'], 'reason': 'Load exceeds the largest truck'})
+        else:
+            end = max(booking['EndDate'], booking['StartDate'] + timedelta(days=1))
+            groups.setdefault((booking['StartDate'], origin), []).append(
+                (dest, {'TripID': booking['TripID'], 'Quantity': quantity, 'EndDate': end}))
+
+    routes = []
+    for (day, origin), items in sorted(groups.items()):
+        pending = items
+        # Tours are sized for the biggest truck free that day; whatever doesn't get a truck for
+        # its whole duration is re-planned, then sized for the next biggest, until all are placed.
+        capacities = sorted({capacity for capacity, truck_id in fleet
+                             if busy.is_free(truck_id, day, day + timedelta(days=1))}, reverse=True)
+        for capacity in capacities:
+            while pending:
+                leftover = []
+                # Biggest loads first, so they get the big trucks before smaller tours use them up.
+                for tour in sorted(plan_group(origin, pending, capacity, matrix), key=lambda t: -t['load']):
+                    truck = _free_truck(fleet, busy, tour['load'], day, tour['end_date'])
+                    if truck is None:
+                        leftover += tour['items']
+                        continue
+                    busy.add(truck[1], day, tour['end_date'], ('plan', len(routes)))
+                    routes.append(_route(day, origin, truck[1], truck[0], tour, matrix))
+                if len(leftover) == len(pending):
+                    break
+                pending = leftover
+            if not pending:
+                break
+        unplanned += [{'trip_id': booking['TripID'], 'reason': 'No truck free for these dates'} for _, booking in pending]
+
+    planned_km = sum(route['distance_km'] for route in routes)
+    direct_km = sum(route['direct_distance_km'] for route in routes)
+    total_capacity = sum(route['capacity'] for route in routes)
+    return {
+        'routes': routes,
+        'unplanned': unplanned,
+        'summary': {
+            'bookings': len(bookings),
+            'planned': len(bookings) - len(unplanned),
+            'routes': len(routes),
+            'distance_km': round(planned_km, 1),
+            'direct_distance_km': round(direct_km, 1),
+            'saved_km': round(direct_km - planned_km, 1),
+            'load_factor': round(sum(route['load'] for route in routes) / total_capacity, 4) if total_capacity else None,
+            'elapsed_seconds': round(time.perf_counter() - started, 3),
+        },
+    }
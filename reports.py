@@ -0,0 +1,225 @@
+"""
+Admin analytics reports.
+
+    python reports.py truck_utilization [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--format csv] [--output PATH]
+
+Every report covers trips starting in a period [start, end) and reads both the
+hot and the archived trip tables (see archive.py). Counts and tonnage are
+GROUP BYs run in the database once per table, and the per-table results are
+merged by key, so only aggregated rows reach Python. Utilization and workload
+need day overlaps with the period, which differ between SQL dialects. Those
+reports stream (id, StartDate, EndDate) tuples in chunks and add up per id.
+Memory stays proportional to the number of trucks or drivers, not trips.
+
+Each report returns (columns, rows), with rows as tuples. to_csv() and
+to_parquet() export that shape; Parquet needs pyarrow.
+"""
+import argparse
+import csv
+import io
+import sys
+from datetime import date, timedelta
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Trips that hold (or held) a truck and driver; Requested and Cancelled ones never used them.
+BOOKED_STATUSES = ('Scheduled', 'In Progress', 'Completed')
+SOURCES = (('TRIP', 'SHIPMENT'), ('TRIP_ARCHIVE', 'SHIPMENT_ARCHIVE'))
+CHUNK_SIZE = 5000
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def default_period(today=None):
+    """The last twelve months, current one included: (first day 11 months back, first day of next month)."""
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1
+    start = date((months - 11) // 12, (months - 11) % 12 + 1, 1)
+    end = date((months + 1) // 12, (months + 1) % 12 + 1, 1)
+    return start, end
+
+
+def _grouped(conn, sql, params, keys):
+    """
+    Runs `sql` (with {trip} and {shipment} placeholders) against each source and
+    sums the per-table rows by their first `keys` columns. Returns {key: [sums]}.
+    """
+    totals = {}
+    cursor = conn.cursor()
+    try:
+        for trip_table, shipment_table in SOURCES:
+            cursor.execute(sql.format(trip=trip_table, shipment=shipment_table), params)
+            for row in cursor.fetchall():
+                sums = totals.setdefault(tuple(row[:keys]), [0] * (len(row) - keys))
+                for i, value in enumerate(row[keys:]):
+                    sums[i] += int(value or 0)
+    finally:
+        cursor.close()
+    return totals
+
+
+def _booked_days(conn, column, start, end):
+    """{id: [trips, days booked inside [start, end)]} for trucks or drivers, streamed in chunks."""
+    booked = {}
+    cursor = conn.cursor()
+    try:
+        for trip_table, _ in SOURCES:
+            cursor.execute(f"""
+                SELECT {column}, StartDate, EndDate FROM {trip_table}
+                WHERE {column} IS NOT NULL AND EndDate > %s AND StartDate < %s
+                  AND Status IN ({_placeholders(BOOKED_STATUSES)})
+            """, [start, end, *BOOKED_STATUSES])
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                for resource_id, trip_start, trip_end in rows:
+                    entry = booked.setdefault(resource_id, [0, 0])
+                    entry[0] += 1
+                    entry[1] += (min(trip_end, end) - max(trip_start, start)).days
+    finally:
+        cursor.close()
+    return booked
+
+
+# --- Reports ---
+def truck_utilization(conn, start, end):
+    """Booked days per truck as a share of the period."""
+    booked = _booked_days(conn, 'TruckID', start, end)
+    days = (end - start).days
+    cursor = conn.cursor()
+    cursor.execute("SELECT TruckID, RegistrationNum, Capacity_in_Tons FROM TRUCK ORDER BY TruckID")
+    trucks = cursor.fetchall()
+    cursor.close()
+    rows = []
+    for truck_id, registration, capacity in trucks:
+        trips, booked_days = booked.get(truck_id, (0, 0))
+        rows.append((truck_id, registration, capacity, trips, booked_days, round(booked_days / days, 4) if days else 0))
+    return ['truck_id', 'registration', 'capacity_tons', 'trips', 'booked_days', 'utilization'], rows
+
+
+def driver_workload(conn, start, end):
+    """Trips and days on the road per driver, busiest first."""
+    booked = _booked_days(conn, 'DriverID', start, end)
+    days = (end - start).days
+    cursor = conn.cursor()
+    cursor.execute("SELECT DriverID, FirstName, LastName FROM DRIVER ORDER BY DriverID")
+    drivers = cursor.fetchall()
+    cursor.close()
+    rows = []
+    for driver_id, first_name, last_name in drivers:
+        trips, booked_days = booked.get(driver_id, (0, 0))
+        rows.append((driver_id, f'{first_name} {last_name}', trips, booked_days, round(booked_days / days, 4) if days else 0))
+    rows.sort(key=lambda row: (-row[3], row[0]))
+    return ['driver_id', 'driver', 'trips', 'days_on_road', 'share_of_period'], rows
+
+
+def route_counts(conn, start, end):
+    """Trips per origin -> destination, by outcome, most travelled first."""
+    totals = _grouped(conn, """
+        SELECT Origin, Destination, COUNT(*),
+               SUM(CASE WHEN Status = 'Completed' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN Status = 'Cancelled' THEN 1 ELSE 0 END)
+        FROM {trip} WHERE StartDate >= %s AND StartDate < %s
+        GROUP BY Origin, Destination
+    """, (start, end), keys=2)
+    rows = [(origin, destination, trips, completed, cancelled, trips - completed - cancelled)
+            for (origin, destination), (trips, completed, cancelled) in totals.items()]
+    rows.sort(key=lambda row: (-row[2], row[0], row[1]))
+    return ['origin', 'destination', 'trips', 'completed', 'cancelled', 'open'], rows
+
+
+def lane_volumes(conn, start, end):
+    """Trips and shipped tons per lane per month (cancelled trips excluded)."""
+    # SUBSTR of a DATE gives 'YYYY-MM' in both MySQL (implicit cast) and SQLite (ISO text).
+    totals = _grouped(conn, """
+        SELECT SUBSTR(t.StartDate, 1, 7), t.Origin, t.Destination, COUNT(DISTINCT t.TripID), SUM(s.Quantity)
+        FROM {trip} t LEFT JOIN {shipment} s ON s.TripID = t.TripID
+        WHERE t.StartDate >= %s AND t.StartDate < %s AND t.Status <> 'Cancelled'
+        GROUP BY SUBSTR(t.StartDate, 1, 7), t.Origin, t.Destination
+    """, (start, end), keys=3)
+    rows = sorted(key + tuple(sums) for key, sums in totals.items())
+    return ['month', 'origin', 'destination', 'trips', 'tons'], rows
+
+
+def tonnage_by_goods_type(conn, start, end):
+    """Shipped tons per goods type (cancelled trips excluded), heaviest first."""
+    totals = _grouped(conn, """
+        SELECT g.GoodsType, COUNT(*), COUNT(DISTINCT s.TripID), SUM(s.Quantity)
+        FROM {shipment} s
+        JOIN {trip} t ON t.TripID = s.TripID
+        JOIN GOODS g ON g.GoodsID = s.GoodsID
+        WHERE t.StartDate >= %s AND t.StartDate < %s AND t.Status <> 'Cancelled'
+        GROUP BY g.GoodsType
+    """, (start, end), keys=1)
+    rows = sorted(((goods_type, shipments, trips, tons) for (goods_type,), (shipments, trips, tons) in totals.items()),
+                  key=lambda row: (-row[3], row[0]))
+    return ['goods_type', 'shipments', 'trips', 'tons'], rows
+
+
+REPORTS = {
+    'truck_utilization': truck_utilization,
+    'driver_workload': driver_workload,
+    'route_counts': route_counts,
+    'lane_volumes': lane_volumes,
+    'tonnage_by_goods_type': tonnage_by_goods_type,
+}
+
+
+# --- Export ---
+def to_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def to_parquet(columns, rows):
+    """Parquet bytes for a report. Raises RuntimeError when pyarrow isn't installed."""
+    if pyarrow is None:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow).')
+    table = pyarrow.table({name: [row[i] for row in rows] for i, name in enumerate(columns)})
+    buffer = io.BytesIO()
+    pyarrow.parquet.write_table(table, buffer)
+    return buffer.getvalue()
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run an analytics report.')
+    parser.add_argument('report', choices=sorted(REPORTS))
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First start date (default 11 months back)')
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last start date (default end of this month)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--output', help='File to write (default stdout, CSV only)')
+    args = parser.parse_args(argv)
+
+    from app import app
+    from db import get_db
+
+    start, end = default_period()
+    start = args.date_from or start
+    end = args.date_to + timedelta(days=1) if args.date_to else end
+    with app.app_context():
+        columns, rows = REPORTS[args.report](get_db(), start, end)
+    if args.format == 'parquet':
+        if not args.output:
+            parser.error('--output is required for parquet')
+        with open(args.output, 'wb') as f:
+            f.write(to_parquet(columns, rows))
+    elif args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            f.write(to_csv(columns, rows))
+    else:
+        sys.stdout.write(to_csv(columns, rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+Batch assignment of trucks and drivers to requested trips.
+
+    python scheduler.py [--dry-run] [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--chunk-size 1000]
+
+Clients may book without picking a truck and driver; those trips are stored
+as 'Requested' with neither. assign_requests() places them all in one sweep
+over start dates. Each resource pool keeps idle trucks (or drivers) ordered by
+the start of their next commitment (an existing trip, or a maintenance window
+for trucks) and busy ones in a heap keyed by when they free up. A request
+[start, end) gets the idle resource whose next commitment comes soonest after
+`end`: the tightest gap, which keeps long free stretches for long trips.
+Trucks must also carry the trip's shipment tonnage. Each request costs a
+bisect plus heap pushes, so tens of thousands of requests take seconds.
+
+Assignments are written in chunked transactions. Each chunk locks its trucks
+and drivers (same order as reserve_trip) and re-checks them against the
+database, so a trip booked by hand since the plan was made is never
+double-booked; the losing request just stays Requested for the next run.
+"""
+import argparse
+import heapq
+import json
+import sys
+import time
+from bisect import bisect_left, insort
+from datetime import date
+
+import stats
+from availability import existing_ids, load_busy
+from bulk import chunked
+from db import for_update, is_sqlite
+from trips import ACTIVE_TRIP_FILTER, trip_to_json
+
+
+# --- Loading ---
+def load_requests(cursor, date_from, date_to=None):
+    """Requested trips starting in [date_from, date_to], with their shipment tons, in start order."""
+    sql = """
+        SELECT t.TripID, t.StartDate, t.EndDate, COALESCE(SUM(s.Quantity), 0) AS Quantity
+        FROM TRIP t LEFT JOIN SHIPMENT s ON s.TripID = t.TripID
+        WHERE t.Status = 'Requested' AND t.StartDate >= %s
+    """
+    params = [date_from]
+    if date_to:
+        sql += " AND t.StartDate <= %s"
+        params.append(date_to)
+    sql += " GROUP BY t.TripID, t.StartDate, t.EndDate ORDER BY t.StartDate, t.TripID"
+    cursor.execute(sql, params)
+    return [(trip_id, start, end, int(quantity or 0)) for trip_id, start, end, quantity in cursor.fetchall()]
+
+
+def load_commitments(cursor, column, since):
+    """{resource_id: [(start, end), ...]} for active trips on each truck or driver still running at `since`."""
+    cursor.execute(f"""
+        SELECT {column}, StartDate, EndDate FROM TRIP
+        WHERE {column} IS NOT NULL AND EndDate > %s AND {ACTIVE_TRIP_FILTER}
+    """, (since,))
+    commitments = {}
+    for resource_id, start, end in cursor.fetchall():
+        commitments.setdefault(resource_id, []).append((start, end))
+    return commitments
+
+
+def load_maintenance(cursor, since, commitments):
+    """Adds each maintenance window still running at `since` to the truck's commitments."""
+    cursor.execute("SELECT TruckID, MaintenanceDate, EndDate FROM MAINTENANCE WHERE EndDate > %s", (since,))
+    for truck_id, start, end in cursor.fetchall():
+        commitments.setdefault(truck_id, []).append((start, end))
+    return commitments
+
+
+# --- Planning ---
+class ResourcePool:
+    """
+    Trucks or drivers during a sweep over increasing start dates. `capacities`
+    maps resource id to capacity (0 for drivers); `commitments` maps it to the
+    (start, end) intervals it is already busy for.
+    """
+
+    def __init__(self, capacities, commitments):
+        self.capacities = capacities
+        self._commitments = {rid: sorted(intervals) for rid, intervals in commitments.items() if rid in capacities}
+        self._next = dict.fromkeys(capacities, 0)
+        self._idle = sorted((self._next_start(rid), rid) for rid in capacities)
+        self._busy = []
+
+    def _next_start(self, rid):
+        intervals = self._commitments.get(rid, ())
+        i = self._next[rid]
+        return intervals[i][0] if i < len(intervals) else date.max
+
+    def advance(self, now):
+        """Moves the sweep to `now`: commitments that have started make their resource busy, finished ones free it."""
+        while True:
+            while self._idle and self._idle[0][0] <= now:
+                _, rid = self._idle.pop(0)
+                start, end = self._commitments[rid][self._next[rid]]
+                self._next[rid] += 1
+                heapq.heappush(self._busy, (end, rid))
+            if not self._busy or self._busy[0][0] > now:
+                return
+            while self._busy and self._busy[0][0] <= now:
+                _, rid = heapq.heappop(self._busy)
+                insort(self._idle, (self._next_start(rid), rid))
+
+    def find(self, end, need=0):
+        """Position of the idle resource free until `end` with the soonest next commitment and enough capacity."""
+        for i in range(bisect_left(self._idle, (end,)), len(self._idle)):
+            if self.capacities[self._idle[i][1]] >= need:
+                return i
+        return None
+
+    def take(self, position, end):
+        _, rid = self._idle.pop(position)
+        heapq.heappush(self._busy, (end, rid))
+        return rid
+
+
+def plan_assignments(requests, trucks, drivers, truck_commitments, driver_commitments):
+    """
+    requests: (TripID, StartDate, EndDate, tons) in start order. trucks: {TruckID: capacity}.
+    drivers: iterable of DriverIDs. Returns (assignments, unassigned).
+    """
+    truck_pool = ResourcePool(trucks, truck_commitments)
+    driver_pool = ResourcePool(dict.fromkeys(drivers, 0), driver_commitments)
+    max_capacity = max(trucks.values(), default=0)
+    assignments, unassigned = [], []
+    for trip_id, start, end, tons in requests:
+        if tons > max_capacity:
+            unassigned.append({'trip_id': trip_id, 'reason': f'No truck can carry {tons} tons'})
+            continue
+        truck_pool.advance(start)
+        driver_pool.advance(start)
+        truck_pos = truck_pool.find(end, tons)
+        driver_pos = driver_pool.find(end)
+        if truck_pos is None or driver_pos is None:
+            reason = 'No truck free for these dates' if truck_pos is None else 'No driver free for these dates'
+            unassigned.append({'trip_id': trip_id, 'reason': reason})
+            continue
+        assignments.append({
+            'trip_id': trip_id,
+            'truck_id': truck_pool.take(truck_pos, end),
+            'driver_id': driver_pool.take(driver_pos, end),
+            'start_date': start,
+            'end_date': end,
+        })
+    return assignments, unassigned
+
+
+# --- Writing ---
+def apply_chunk(conn, chunk):
+    """
+    Writes one chunk of assignments in a single transaction, skipping any whose
+    truck or driver was booked meanwhile. Returns (changed, skipped trip ids),
+    with changed as (TripID, UserID, previous status) for each trip scheduled.
+    """
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        if is_sqlite(conn):
+            cursor.execute("BEGIN IMMEDIATE")
+        lock = for_update(conn)
+        existing_ids(cursor, 'TRUCK', 'TruckID', {a['truck_id'] for a in chunk}, lock)
+        existing_ids(cursor, 'DRIVER', 'DriverID', {a['driver_id'] for a in chunk}, lock)
+        start = min(a['start_date'] for a in chunk)
+        end = max(a['end_date'] for a in chunk)
+        truck_busy = load_busy(cursor, 'TruckID', {a['truck_id'] for a in chunk}, start, end)
+        driver_busy = load_busy(cursor, 'DriverID', {a['driver_id'] for a in chunk}, start, end)
+
+        accepted, skipped = [], []
+        for a in chunk:
+            if (truck_busy.is_free(a['truck_id'], a['start_date'], a['end_date'])
+                    and driver_busy.is_free(a['driver_id'], a['start_date'], a['end_date'])):
+                accepted.append(a)
+            else:
+                skipped.append(a['trip_id'])
+
+        changed = []
+        if accepted:
+            # Lock the trips still Requested; ones cancelled since loading are left untouched.
+            trip_ids = [a['trip_id'] for a in accepted]
+            cursor.execute(f"""
+                SELECT TripID, (SELECT UserID FROM CLIENT WHERE ClientID = TRIP.ClientID) FROM TRIP
+                WHERE TripID IN ({', '.join(['%s'] * len(trip_ids))}) AND Status = 'Requested'
+            """ + lock, trip_ids)
+            owners = dict(cursor.fetchall())
+            accepted = [a for a in accepted if a['trip_id'] in owners]
+        if accepted:
+            cursor.executemany(
+                "UPDATE TRIP SET TruckID = %s, DriverID = %s, Status = 'Scheduled' WHERE TripID = %s AND Status = 'Requested'",
+                [(a['truck_id'], a['driver_id'], a['trip_id']) for a in accepted],
+            )
+            stats.bump(cursor, stats.trip_stat('Requested'), -len(accepted))
+            stats.bump(cursor, stats.trip_stat('Scheduled'), len(accepted))
+            stats.bump_version(cursor, stats.TRIPS_VERSION)
+            changed = [(a['trip_id'], owners[a['trip_id']], 'Requested') for a in accepted]
+        conn.commit()
+        return changed, skipped
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def assign_requests(conn, date_from=None, date_to=None, dry_run=False, chunk_size=1000, on_change=None):
+    """
+    Plans and (unless dry_run) writes truck/driver assignments for every Requested
+    trip starting in [date_from (default today), date_to]. Calls
+    on_change(changed, 'Scheduled') after each committed chunk, like
+    lifecycle.advance(). Returns a report; a dry run includes the full plan.
+    """
+    started = time.perf_counter()
+    date_from = date_from or date.today()
+    cursor = conn.cursor()
+    requests = load_requests(cursor, date_from, date_to)
+    cursor.execute("SELECT TruckID, Capacity_in_Tons FROM TRUCK")
+    trucks = {truck_id: capacity or 0 for truck_id, capacity in cursor.fetchall()}
+    cursor.execute("SELECT DriverID FROM DRIVER")
+    drivers = [row[0] for row in cursor.fetchall()]
+    truck_commitments = load_maintenance(cursor, date_from, load_commitments(cursor, 'TruckID', date_from))
+    driver_commitments = load_commitments(cursor, 'DriverID', date_from)
+    cursor.close()
+    conn.rollback()
+    loaded = time.perf_counter()
+
+    assignments, unassigned = plan_assignments(requests, trucks, drivers, truck_commitments, driver_commitments)
+    planned = time.perf_counter()
+
+    report = {
+        'dry_run': dry_run,
+        'requests': len(requests),
+        'planned': len(assignments),
+        'unassigned': unassigned,
+        'trucks_used': len({a['truck_id'] for a in assignments}),
+        'drivers_used': len({a['driver_id'] for a in assignments}),
+        'truck_days': sum((a['end_date'] - a['start_date']).days for a in assignments),
+    }
+    if dry_run:
+        report['assignments'] = [trip_to_json(a) for a in assignments]
+    else:
+        report['assigned'] = 0
+        report['skipped'] = []
+        for chunk in chunked(assignments, chunk_size):
+            changed, skipped = apply_chunk(conn, chunk)
+            report['assigned'] += len(changed)
+            report['skipped'] += skipped
+            if changed and on_change is not None:
+                on_change(changed, 'Scheduled')
+    report['timings'] = {
+        'load_seconds': round(loaded - started, 3),
+        'plan_seconds': round(planned - loaded, 3),
+        'write_seconds': round(time.perf_counter() - planned, 3),
+    }
+    return report
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Assign trucks and drivers to requested trips.')
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First start date (default today)')
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last start date')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='Report the plan without writing it')
+    args = parser.parse_args(argv)
+
+    from app import app
+    from db import get_db
+
+    with app.app_context():
+        report = assign_requests(get_db(), args.date_from, args.date_to, args.dry_run, args.chunk_size)
+    json.dump(report, sys.stdout, indent=2, default=str)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+"""
+Admin search over trips by client, route, driver and truck.
+
+An in-process inverted index, kept like AvailabilityCalendar: each process
+loads its own copy, the booking/cancel/status routes update it as they write,
+and it is fully rebuilt every `refresh_seconds` to pick up other processes'
+changes. It covers TRIP and TRIP_ARCHIVE (see archive.py). Only the first load
+makes a request wait; rebuilds run on a background thread while searches keep
+using the current index, and searches never take the lock.
+
+The words indexed are the names of a few thousand clients, drivers, trucks and
+places, each pointing at the set of trips that use it. A query term matches
+words exactly, by prefix, or within one edit (typos, via a deletion index), so
+a search never scans trips. The term's score for a trip is the best match
+quality times the field's weight. A trip must match every term; results are
+ranked by total score, then newest first.
+
+Matching, filtering and counting are set unions and intersections over the
+posting sets, and ranking takes just one page from the best-scoring groups of
+trips, so per-trip Python work is bounded by the page size rather than the
+number of matches. MySQL FULLTEXT would need a second code path for the
+SQLite backend and can't do fuzzy matching.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from itertools import product
+from math import prod
+
+from trips import TRIP_TABLES
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# How much a match in each field counts, and how good each kind of match is.
+FIELD_WEIGHTS = {'truck': 4, 'client': 3, 'driver': 3, 'place': 2}
+EXACT, PREFIX, FUZZY = 3, 2, 1
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_LENGTH = 4
+MAX_TERMS = 8
+MAX_GROUPS = 64      # score combinations ranked group by group; past this, trip by trip
+DENSE_FACTOR = 50    # groups holding over 1/50 of all trips are ranked by walking the recency order
+CACHED_TERMS = 16    # recent terms' matches kept until the index next changes (paging repeats them)
+ID_MASK = (1 << 32) - 1
+
+Trip = namedtuple('Trip', 'TripID StartDate EndDate Status ClientID DriverID TruckID Origin Destination Archived')
+
+TRIP_SQL = """
+    SELECT TripID, StartDate, EndDate, Status, ClientID, DriverID, TruckID, Origin, Destination FROM {table}
+"""
+CHUNK_SIZE = 10000
+
+
+def tokens(text):
+    """Lower-case words of `text`, plus all of them run together (so 'MH-12 AB' also matches 'mh12ab')."""
+    words = TOKEN_RE.findall((text or '').lower())
+    if len(words) > 1:
+        words.append(''.join(words))
+    return words
+
+
+def _deletes(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _recency_key(trip):
+    """Sorts newest first: by StartDate, then TripID, both descending. The TripID is the low 32 bits."""
+    return -(trip.StartDate.toordinal() << 32 | trip.TripID)
+
+
+class InvertedIndex:
+    """The index data; TripSearchIndex handles loading, locking and refreshing."""
+
+    def __init__(self):
+        self.trips = {}
+        self.names = {'client': {}, 'driver': {}, 'truck': {}}
+        self.postings = {field: defaultdict(set) for field in FIELD_WEIGHTS}  # field -> key -> TripIDs
+        self.by_status = defaultdict(set)   # status -> TripIDs
+        self.recency = []                   # _recency_key() of every trip, sorted
+        self.vocab = defaultdict(set)       # word -> {(field, key)}
+        self.words = []                     # sorted vocab, for prefix ranges
+        self.deletes = defaultdict(set)     # word minus one letter -> words, for fuzzy matches
+        self._term_cache = {}
+        self._changes = 0                   # bumped after each change to the postings
+
+    # --- Building ---
+    def add_name(self, field, key, name, text):
+        if field != 'place':
+            self.names[field][key] = name
+        for word in tokens(text):
+            if word not in self.vocab:
+                insort(self.words, word)
+                if len(word) >= MIN_FUZZY_LENGTH:
+                    for deleted in _deletes(word):
+                        self.deletes[deleted].add(word)
+            self.vocab[word].add((field, key))
+
+    def add_trip(self, trip, ordered=True):
+        """Indexes `trip`. A bulk load passes ordered=False and calls sort() once at the end."""
+        # The trip goes into `trips` before any posting, so a concurrent search can always look it up.
+        previous = self.trips.get(trip.TripID)
+        self.trips[trip.TripID] = trip
+        if previous:
+            self._unindex(previous)
+        for field, key in self._keys(trip):
+            if field == 'place' and key not in self.postings['place']:
+                self.add_name('place', key, key, key)
+            self.postings[field][key].add(trip.TripID)
+        self.by_status[trip.Status].add(trip.TripID)
+        if ordered:
+            insort(self.recency, _recency_key(trip))
+        else:
+            self.recency.append(_recency_key(trip))
+        self._changes += 1
+        self._term_cache.clear()
+
+    def sort(self):
+        self.recency.sort()
+
+    def _unindex(self, trip):
+        for field, key in self._keys(trip):
+            self.postings[field][key].discard(trip.TripID)
+        self.by_status[trip.Status].discard(trip.TripID)
+        key = _recency_key(trip)
+        i = bisect_left(self.recency, key)
+        if i < len(self.recency) and self.recency[i] == key:
+            del self.recency[i]
+
+    def set_status(self, trip_ids, status):
+        for trip_id in trip_ids:
+            trip = self.trips.get(trip_id)
+            if trip:
+                self.by_status[trip.Status].discard(trip_id)
+                self.by_status[status].add(trip_id)
+                self.trips[trip_id] = trip._replace(Status=status)
+
+    @staticmethod
+    def _keys(trip):
+        keys = [('client', trip.ClientID), ('place', trip.Origin), ('place', trip.Destination)]
+        if trip.DriverID is not None:
+            keys.append(('driver', trip.DriverID))
+        if trip.TruckID is not None:
+            keys.append(('truck', trip.TruckID))
+        return [(field, key) for field, key in keys if key is not None]
+
+    # --- Querying ---
+    def _matching_words(self, term):
+        """{word: match quality} for the vocabulary words `term` matches."""
+        found = {}
+        if term in self.vocab:
+            found[term] = EXACT
+        if len(term) >= MIN_PREFIX_LENGTH:
+            i = bisect_left(self.words, term)
+            while i < len(self.words) and self.words[i].startswith(term):
+                found.setdefault(self.words[i], PREFIX)
+                i += 1
+        if len(term) >= MIN_FUZZY_LENGTH:
+            # One letter extra, missing or changed (a shared deletion).
+            candidates = set(self.deletes.get(term, ()))
+            for deleted in _deletes(term):
+                if deleted in self.vocab:
+                    candidates.add(deleted)
+                candidates.update(self.deletes.get(deleted, ()))
+            for word in candidates:
+                found.setdefault(word, FUZZY)
+        return found
+
+    def term_levels(self, term):
+        """
+        The trips one term matches, as ([(score, TripIDs)] best score first, all
+        TripIDs). Each trip sits in the level of its best match only.
+        """
+        cached = self._term_cache.get(term)
+        if cached is not None:
+            return cached
+        changes = self._changes
+        best = {}
+        for word, quality in self._matching_words(term).items():
+            for field, key in tuple(self.vocab[word]):
+                score = quality * FIELD_WEIGHTS[field]
+                if best.get((field, key), 0) < score:
+                    best[(field, key)] = score
+        by_score = defaultdict(list)
+        for (field, key), score in best.items():
+            by_score[score].append(self.postings[field].get(key, ()))
+        levels, matched = [], set()
+        for score in sorted(by_score, reverse=True):
+            trip_ids = set().union(*by_score[score]) - matched
+            if trip_ids:
+                levels.append((score, trip_ids))
+                matched |= trip_ids
+        # Not cached if a booking changed the postings meanwhile: the levels may predate it.
+        if changes == self._changes:
+            if len(self._term_cache) >= CACHED_TERMS:
+                self._term_cache.clear()
+            self._term_cache[term] = levels, matched
+            if changes != self._changes:
+                self._term_cache.pop(term, None)
+        return levels, matched
+
+    def _candidates(self, matched, filters):
+        """
+        Trips matching every term and the filters, and whether that narrowed the
+        matches down. Only the date filters look at trips one by one.
+        """
+        candidates = set.intersection(*matched) if len(matched) > 1 else matched[0]
+        narrowed = len(matched) > 1
+        for postings, key in ((self.by_status, filters.get('status')),
+                              (self.postings['client'], filters.get('client_id')),
+                              (self.postings['driver'], filters.get('driver_id'))):
+            if key is not None:
+                candidates, narrowed = candidates & postings.get(key, set()), True
+        date_from, date_to = filters.get('date_from'), filters.get('date_to')
+        if date_from or date_to:
+            candidates, narrowed = {trip_id for trip_id in candidates
+                                    if (date_from is None or self.trips[trip_id].StartDate >= date_from)
+                                    and (date_to is None or self.trips[trip_id].StartDate <= date_to)}, True
+        return candidates, narrowed
+
+    def _newest(self, trip_ids, count):
+        """The `count` most recent of `trip_ids`, newest first."""
+        if len(trip_ids) * DENSE_FACTOR > len(self.trips):
+            # A sizeable share of all trips: enough of them turn up early in the global order.
+            found = []
+            for key in self.recency:
+                trip_id = -key & ID_MASK
+                if trip_id in trip_ids:
+                    found.append(trip_id)
+                    if len(found) == count:
+                        break
+            return found
+        return heapq.nsmallest(count, trip_ids, key=lambda trip_id: _recency_key(self.trips[trip_id]))
+
+    def search(self, terms, filters, limit, offset):
+        """(total matches, one page of result rows); see TripSearchIndex.search()."""
+        per_term = [self.term_levels(term) for term in terms]
+        candidates, narrowed = self._candidates([matched for _, matched in per_term], filters)
+        if not candidates:
+            return 0, []
+
+        # Group the candidates by total score. Each combination of one level per term
+        # is a disjoint group; with too many combinations, score trip by trip instead.
+        groups = defaultdict(list)
+        if prod(len(levels) for levels, _ in per_term) <= MAX_GROUPS:
+            for combination in product(*(levels for levels, _ in per_term)):
+                if narrowed:
+                    trip_ids = candidates.intersection(*(trip_ids for _, trip_ids in combination))
+                else:
+                    trip_ids = combination[0][1]  # one term, no filters: its levels are the groups
+                if trip_ids:
+                    groups[sum(score for score, _ in combination)].append(trip_ids)
+        else:
+            for trip_id in candidates:
+                score = sum(next(score for score, trip_ids in levels if trip_id in trip_ids) for levels, _ in per_term)
+                groups[score].append({trip_id})
+
+        wanted, ranked = offset + limit, []
+        for score in sorted(groups, reverse=True):
+            group = groups[score][0] if len(groups[score]) == 1 else set().union(*groups[score])
+            newest = self._newest(group, wanted - len(ranked))
+            ranked.extend((trip_id, score) for trip_id in newest)
+            if len(ranked) >= wanted:
+                break
+        return len(candidates), [self.row(self.trips[trip_id], score) for trip_id, score in ranked[offset:]]
+
+    def row(self, trip, score):
+        """A trip in the shape of trips.list_trips() rows, plus the truck and the score."""
+        first_name, last_name = self.names['driver'].get(trip.DriverID, (None, None))
+        row = trip._asdict()
+        row.update(ClientName=self.names['client'].get(trip.ClientID), FirstName=first_name, LastName=last_name,
+                   RegistrationNum=self.names['truck'].get(trip.TruckID), Score=score)
+        return row
+
+
+class TripSearchIndex:
+    def __init__(self, refresh_seconds=300):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()        # serializes changes to the index and the swap
+        self._load_lock = threading.Lock()    # held by whoever is (re)building
+        self._index = None
+        self._loaded_at = None
+        self._generation = 0                  # bumped by invalidate()
+        self._pending = None  # changes made while a rebuild runs, replayed onto the new index
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds
+
+    def ensure_loaded(self, load):
+        """
+        Makes sure there is an index to search. `load` calls self.load() with a
+        connection of its own. The first load runs inline, so the caller waits.
+        A stale index is rebuilt by `load` on a background thread and keeps
+        serving meanwhile.
+        """
+        if not self._stale():
+            return
+        if self._index is None:
+            with self._load_lock:
+                if self._index is None:
+                    load()
+        elif self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild, args=(load,), name='search-index-rebuild', daemon=True).start()
+
+    def _rebuild(self, load):
+        try:
+            if self._stale():
+                load()
+        except Exception:
+            # Keep serving the current index; try again after another refresh period.
+            with self._lock:
+                self._loaded_at = time.monotonic()
+            raise
+        finally:
+            self._load_lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = None
+
+    def load(self, conn):
+        """Builds a fresh index from the database (outside the lock) and swaps it in."""
+        with self._lock:
+            self._pending = []
+            generation = self._generation
+        index = InvertedIndex()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT ClientID, ClientName FROM CLIENT")
+            for client_id, name in cursor.fetchall():
+                index.add_name('client', client_id, name, name)
+            cursor.execute("SELECT DriverID, FirstName, LastName FROM DRIVER")
+            for driver_id, first_name, last_name in cursor.fetchall():
+                index.add_name('driver', driver_id, (first_name, last_name), f'{first_name} {last_name}')
+            cursor.execute("SELECT TruckID, RegistrationNum FROM TRUCK")
+            for truck_id, registration in cursor.fetchall():
+                index.add_name('truck', truck_id, registration, registration)
+            for table in TRIP_TABLES:
+                cursor.execute(TRIP_SQL.format(table=table))
+                while True:
+                    rows = cursor.fetchmany(CHUNK_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        index.add_trip(Trip(*row, table != 'TRIP'), ordered=False)
+            index.sort()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        finally:
+            cursor.close()
+
+        with self._lock:
+            for change, args in self._pending:
+                change(index, *args)
+            self._index = index
+            self._pending = None
+            # Invalidated while building: the new index may predate that write, so it is stale already.
+            self._loaded_at = time.monotonic() if generation == self._generation else None
+
+    # --- Incremental Updates ---
+    def _apply(self, change, *args):
+        with self._lock:
+            if self._index is not None:
+                change(self._index, *args)
+            if self._pending is not None:
+                self._pending.append((change, args))
+
+    def sync_trip(self, conn, trip_id):
+        """Re-reads one trip (e.g. a new booking) and indexes it."""
+        cursor = conn.cursor()
+        cursor.execute(TRIP_SQL.format(table='TRIP') + " WHERE TripID = %s", (trip_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        if row:
+            self._apply(InvertedIndex.add_trip, Trip(*row, False))
+
+    def set_status(self, trip_ids, status):
+        self._apply(InvertedIndex.set_status, list(trip_ids), status)
+
+    # --- Search ---
+    def search(self, query, filters=None, limit=20, offset=0):
+        """Returns (total matches, one page of result rows) for `query`, best matches first."""
+        terms = sorted(set(TOKEN_RE.findall(query.lower())[:MAX_TERMS]))
+        # No lock: searches run side by side, and alongside the booking routes' updates.
+        index = self._index
+        if index is None or not terms:
+            return 0, []
+        return index.search(terms, filters or {}, limit, offset)
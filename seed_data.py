@@ -48,7 +48,7 @@ def run_seed():
             # We need the OwnerID, we assume it will be 1.
             "truck": "INSERT INTO TRUCK (RegistrationNum, Model_Id, Capacity_in_Tons, OwnerID) VALUES ('TN-01-AB-1234', 'Tata Ultra', 10, 1);",
             # We need TruckID, DriverID, ClientID. Assume they are all 1.
-            "trip": "INSERT INTO TRIP (Origin, Destination, StartDate, Status, TruckID, DriverID, ClientID) VALUES ('Chennai', 'Bangalore', '2025-10-10', 'Scheduled', 1, 1, 1);"
+            "trip": "INSERT INTO TRIP (Origin, Destination, StartDate, EndDate, Status, TruckID, DriverID, ClientID) VALUES ('Chennai', 'Bangalore', '2025-10-10', '2025-10-17', 'Scheduled', 1, 1, 1);"
         }
         
         print("Inserting new dummy data...")
@@ -0,0 +1,172 @@
+"""
+Goods and the shipments loaded onto trips.
+
+Shipments are attached to a trip in batches: one transaction locks the trip
+row, reads its current load and capacity in a single aggregate query, and
+inserts the whole batch with one multi-row INSERT. Loads are in tons and
+must fit the trip's truck, or the largest truck in the fleet while the trip
+is still 'Requested'. Shipments go with their trip: SHIPMENT.TripID is
+ON DELETE CASCADE.
+"""
+import stats
+from db import for_update, is_sqlite
+
+# Loads can change until the truck leaves.
+OPEN_STATUSES = ('Requested', 'Scheduled')
+
+
+class ShipmentError(Exception):
+    """A user-facing message plus the HTTP status the API should answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+# --- Goods ---
+def list_goods(cursor):
+    cursor.execute("SELECT GoodsID, GoodsName, GoodsType FROM GOODS ORDER BY GoodsName, GoodsID")
+    return cursor.fetchall()
+
+
+def add_goods(conn, goods):
+    """Inserts (GoodsName, GoodsType) pairs in one multi-row INSERT. Returns the number added."""
+    cursor = conn.cursor()
+    try:
+        cursor.executemany("INSERT INTO GOODS (GoodsName, GoodsType) VALUES (%s, %s)", goods)
+        conn.commit()
+        return len(goods)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# --- Shipments ---
+def parse_items(items, max_items):
+    """Validates [{'goods_id': .., 'quantity': ..}, ...] into (GoodsID, Quantity) pairs or raises ShipmentError."""
+    if not isinstance(items, list) or not items:
+        raise ShipmentError('Send a non-empty "shipments" list.')
+    if len(items) > max_items:
+        raise ShipmentError(f'At most {max_items} shipments can be added per request.')
+    parsed = []
+    for i, item in enumerate(items):
+        try:
+            goods_id, quantity = int(item['goods_id']), int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise ShipmentError(f'Shipment {i}: goods_id and quantity must be integers.')
+        if quantity <= 0:
+            raise ShipmentError(f'Shipment {i}: quantity must be positive.')
+        parsed.append((goods_id, quantity))
+    return parsed
+
+
+def _tables(archived):
+    return ('TRIP_ARCHIVE', 'SHIPMENT_ARCHIVE') if archived else ('TRIP', 'SHIPMENT')
+
+
+def trip_load(cursor, trip_id, lock_suffix='', archived=False):
+    """
+    The trip's status, owner, current load and capacity in one query; None if
+    there is no such trip. The load is a SUM over the (TripID, Quantity) index.
+    Pass for_update(conn) to lock the trip row (only TRIP; the subqueries don't lock),
+    or archived=True to read an archived trip.
+    """
+    trip_table, shipment_table = _tables(archived)
+    cursor.execute(f"""
+        SELECT t.TripID, t.Status, t.TruckID,
+               (SELECT UserID FROM CLIENT WHERE ClientID = t.ClientID) AS UserID,
+               (SELECT COALESCE(SUM(Quantity), 0) FROM {shipment_table} WHERE TripID = t.TripID) AS Loaded,
+               COALESCE((SELECT Capacity_in_Tons FROM TRUCK WHERE TruckID = t.TruckID),
+                        (SELECT MAX(Capacity_in_Tons) FROM TRUCK)) AS Capacity
+        FROM {trip_table} t WHERE t.TripID = %s
+    """ + lock_suffix, (trip_id,))
+    return cursor.fetchone()
+
+
+def list_shipments(cursor, trip_id, archived=False):
+    cursor.execute(f"""
+        SELECT s.ShipmentID, s.GoodsID, g.GoodsName, g.GoodsType, s.Quantity
+        FROM {_tables(archived)[1]} s JOIN GOODS g ON g.GoodsID = s.GoodsID
+        WHERE s.TripID = %s ORDER BY s.ShipmentID
+    """, (trip_id,))
+    return cursor.fetchall()
+
+
+def _check_owner(trip, trip_id, user_id):
+    if trip is None or (user_id is not None and trip['UserID'] != user_id):
+        raise ShipmentError(f'Trip {trip_id} not found.', 404)
+
+
+def add_shipments(conn, trip_id, items, user_id=None):
+    """
+    Attaches (GoodsID, Quantity) items to a trip in one transaction. `user_id`
+    restricts it to that client's trips (None for admins). Returns the trip's
+    new load summary or raises ShipmentError.
+    """
+    conn.rollback()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        if is_sqlite(conn):
+            cursor.execute("BEGIN IMMEDIATE")
+        # Locking the trip serializes concurrent batches, so the load check can't be raced.
+        trip = trip_load(cursor, trip_id, for_update(conn))
+        _check_owner(trip, trip_id, user_id)
+        if trip['Status'] not in OPEN_STATUSES:
+            raise ShipmentError(f"Shipments can't be changed on a trip that is {trip['Status']}.", 409)
+
+        goods_ids = sorted({goods_id for goods_id, _ in items})
+        cursor.execute(f"SELECT GoodsID FROM GOODS WHERE GoodsID IN ({_placeholders(goods_ids)})", goods_ids)
+        missing = set(goods_ids) - {row['GoodsID'] for row in cursor.fetchall()}
+        if missing:
+            raise ShipmentError(f'Unknown goods: {", ".join(map(str, sorted(missing)))}.')
+
+        load = int(trip['Loaded']) + sum(quantity for _, quantity in items)
+        capacity = trip['Capacity'] or 0
+        if load > capacity:
+            where = f"truck {trip['TruckID']}" if trip['TruckID'] else 'the largest truck'
+            raise ShipmentError(f'Total load of {load} tons would exceed the {capacity} tons {where} can carry.', 409)
+
+        # mysql.connector rewrites this into a single multi-row INSERT.
+        cursor.executemany("INSERT INTO SHIPMENT (TripID, GoodsID, Quantity) VALUES (%s, %s, %s)",
+                           [(trip_id, goods_id, quantity) for goods_id, quantity in items])
+        stats.bump_version(cursor, stats.TRIPS_VERSION)
+        conn.commit()
+        return {'trip_id': trip_id, 'added': len(items), 'load': load, 'capacity': capacity}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def remove_shipment(conn, trip_id, shipment_id, user_id=None):
+    """Deletes one shipment from an open trip, with the ownership and status check in the same statement."""
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        sql = f"""
+            DELETE FROM SHIPMENT WHERE ShipmentID = %s AND TripID = %s AND EXISTS (
+                SELECT 1 FROM TRIP t JOIN CLIENT c ON c.ClientID = t.ClientID
+                WHERE t.TripID = %s AND t.Status IN ({_placeholders(OPEN_STATUSES)})
+        """
+        params = [shipment_id, trip_id, trip_id, *OPEN_STATUSES]
+        if user_id is not None:
+            sql += " AND c.UserID = %s"
+            params.append(user_id)
+        cursor.execute(sql + ")", params)
+        removed = cursor.rowcount
+        if removed:
+            stats.bump_version(cursor, stats.TRIPS_VERSION)
+        conn.commit()
+        return removed > 0
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
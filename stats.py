@@ -0,0 +1,294 @@
+"""
+Admin dashboard counters and data versions kept in the STATS table.
+
+    python stats.py [--dry-run]
+
+Counters are bumped by every write in its own transaction. Reconciliation
+recounts them from the source tables and corrects any drift; run it nightly
+like archive.py, or on demand from POST /admin/kpis/reconcile.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from calendar import monthrange
+from datetime import date, timedelta
+
+from db import is_sqlite
+from trips import ACTIVE_TRIP_FILTER, TRIP_STATUSES
+
+# Counters live in the STATS table and are bumped inside the same transaction as
+# the write they describe, so reading the dashboard header is a single PK scan of
+# a handful of rows. Names: 'users' and 'trips:<Status>'.
+USERS = 'users'
+
+# Data versions ('version:<name>') are bumped by every write to the tables they
+# cover, so rendered fragments and page ETags can be keyed on them. They are not
+# derived from other tables, so reconciliation never writes them.
+FLEET_VERSION = 'version:fleet'   # TRUCK, DRIVER
+TRIPS_VERSION = 'version:trips'   # TRIP, SHIPMENT
+USERS_VERSION = 'version:users'   # USERS, CLIENT
+VERSIONS = (FLEET_VERSION, TRIPS_VERSION, USERS_VERSION)
+
+
+def trip_stat(status):
+    return f'trips:{status}'
+
+
+# --- Incremental Maintenance ---
+def bump(cursor, name, delta=1):
+    """Adjusts one counter, creating its row if needed. Call it inside the transaction that made the change."""
+    if not delta:
+        return
+    cursor.execute("UPDATE STATS SET StatValue = StatValue + %s WHERE StatName = %s", (delta, name))
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO STATS (StatName, StatValue) VALUES (%s, %s)", (name, delta))
+
+
+def record_status_change(cursor, old_status, new_status):
+    if old_status == new_status:
+        return
+    if old_status:
+        bump(cursor, trip_stat(old_status), -1)
+    if new_status:
+        bump(cursor, trip_stat(new_status), 1)
+
+
+def bump_version(cursor, name):
+    """Marks the data covered by `name` as changed. Call it inside the writing transaction."""
+    bump(cursor, name)
+
+
+def read_counters(cursor):
+    cursor.execute("SELECT StatName, StatValue FROM STATS")
+    return _as_dict(cursor.fetchall())
+
+
+def _as_dict(rows):
+    if rows and isinstance(rows[0], dict):
+        return {row['StatName']: row['StatValue'] for row in rows}
+    return {name: value for name, value in rows}
+
+
+# --- Reconciliation ---
+def compute_counters(cursor):
+    """Recomputes every counter from the source tables."""
+    counters = {USERS: 0}
+    counters.update({trip_stat(status): 0 for status in TRIP_STATUSES})
+
+    cursor.execute("SELECT COUNT(*) FROM USERS")
+    counters[USERS] = _first_value(cursor.fetchone())
+
+    # Archived trips (see archive.py) still count.
+    for table in ('TRIP', 'TRIP_ARCHIVE'):
+        cursor.execute(f"SELECT Status, COUNT(*) FROM {table} GROUP BY Status")
+        for row in cursor.fetchall():
+            status, count = row.values() if isinstance(row, dict) else row
+            counters[trip_stat(status)] = counters.get(trip_stat(status), 0) + count
+    return counters
+
+
+def reconcile_counters(conn, dry_run=False):
+    """
+    Corrects the counters in STATS that have drifted from the source tables.
+    Returns {name: (stored, counted)} for those. The stored values and the
+    counts are read from one consistent snapshot without locking anything, and
+    each correction is applied as a bump() of the difference, so writes that
+    commit during the scan neither wait for it nor lose their own bumps.
+    """
+    names = [USERS] + [trip_stat(status) for status in TRIP_STATUSES]
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN" if is_sqlite(conn) else "START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        cursor.execute(f"SELECT StatName, StatValue FROM STATS WHERE StatName IN ({', '.join(['%s'] * len(names))})", names)
+        stored = _as_dict(cursor.fetchall())
+        counted = compute_counters(cursor)
+        conn.rollback()
+        drift = {name: (stored.get(name), value) for name, value in counted.items() if stored.get(name, 0) != value}
+        if drift and not dry_run:
+            # Only the derived counters are written; the data versions are never touched.
+            if is_sqlite(conn):
+                cursor.execute("BEGIN IMMEDIATE")
+            for name, (was, now) in drift.items():
+                bump(cursor, name, now - (was or 0))
+            conn.commit()
+        return drift
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _first_value(row):
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+# --- Data Versions ---
+VERSIONS_SQL = "SELECT StatName, StatValue FROM STATS WHERE StatName IN (%s, %s, %s)"
+
+
+class DataVersions:
+    """
+    In-process view of the data versions, re-read from STATS at most every
+    `refresh_seconds`. Writes made by this process call expire() after commit so
+    they are seen immediately; other processes' writes show up within the refresh.
+
+    Versions are kept per `source` ('primary' or a read replica, see db.py):
+    content read from a replica must be keyed on that replica's versions, or a
+    lagging replica's rows could be cached under the primary's newer version.
+    """
+
+    def __init__(self, refresh_seconds=2):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._versions = {}  # source -> (versions, loaded_at)
+
+    def cached(self, source='primary'):
+        """The versions if they are fresh enough to use, otherwise None."""
+        with self._lock:
+            versions, loaded_at = self._versions.get(source, (None, 0.0))
+            if versions is None or time.monotonic() - loaded_at > self.refresh_seconds:
+                return None
+            return versions
+
+    def load(self, conn, source='primary'):
+        cursor = conn.cursor()
+        cursor.execute(VERSIONS_SQL, VERSIONS)
+        rows = cursor.fetchall()
+        cursor.close()
+        return self.remember(rows, source)
+
+    def remember(self, rows, source='primary'):
+        """Stores versions from STATS rows (tuples or dicts) fetched elsewhere, e.g. by asgi.py."""
+        found = dict(row.values() if isinstance(row, dict) else row for row in rows)
+        versions = {name.split(':', 1)[1]: found.get(name, 0) for name in VERSIONS}
+        with self._lock:
+            self._versions[source] = (versions, time.monotonic())
+        return versions
+
+    def current(self, get_conn, source='primary'):
+        """Cached versions, falling back to get_conn() only when a refresh is due."""
+        return self.cached(source) or self.load(get_conn(), source)
+
+    def expire(self):
+        with self._lock:
+            self._versions.clear()
+
+
+# --- Time-Based KPIs ---
+def compute_fleet_kpis(conn, today=None):
+    """
+    KPIs that depend on the current date, which can't be maintained by simple
+    counters: trucks on an active trip today and per-truck utilization for the
+    current month (booked days / days in month).
+    """
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    days_in_month = monthrange(today.year, today.month)[1]
+    month_end = month_start + timedelta(days=days_in_month)
+
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT TruckID, StartDate, EndDate FROM TRIP
+        WHERE EndDate > %s AND StartDate < %s AND {ACTIVE_TRIP_FILTER}
+    """, (month_start, month_end))
+
+    booked_days = {}
+    active_trucks = set()
+    for row in cursor:
+        truck_id, start, end = row.values() if isinstance(row, dict) else row
+        overlap = (min(end, month_end) - max(start, month_start)).days
+        booked_days[truck_id] = booked_days.get(truck_id, 0) + overlap
+        if start <= today < end:
+            active_trucks.add(truck_id)
+    cursor.close()
+
+    return {
+        'active_trucks': len(active_trucks),
+        'month': month_start.strftime('%Y-%m'),
+        'utilization': {
+            truck_id: round(min(days, days_in_month) / days_in_month, 4)
+            for truck_id, days in booked_days.items()
+        },
+    }
+
+
+class FleetStats:
+    """
+    Serves the admin KPIs. Counters are read from STATS on every call; the
+    date-based fleet KPIs are recomputed at most every `refresh_seconds`.
+    Counter reconciliation is a separate job (see reconcile_counters).
+    """
+
+    def __init__(self, refresh_seconds=600):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._refreshed_at = None
+        self._fleet = {'active_trucks': 0, 'month': None, 'utilization': {}}
+        self.last_drift = {}
+
+    def refresh(self, conn):
+        fleet = compute_fleet_kpis(conn)
+        with self._lock:
+            self._fleet = fleet
+            self._refreshed_at = time.monotonic()
+        return fleet
+
+    def reconcile(self, conn):
+        drift = reconcile_counters(conn)
+        with self._lock:
+            self.last_drift = drift
+        self.refresh(conn)
+        return drift
+
+    def _due(self):
+        with self._lock:
+            return self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.refresh_seconds
+
+    def snapshot(self, conn):
+        """The admin KPIs, read from `conn`."""
+        if self._due():
+            self.refresh(conn)
+        cursor = conn.cursor()
+        counters = read_counters(cursor)
+        cursor.close()
+
+        by_status = {status: counters.get(trip_stat(status), 0) for status in TRIP_STATUSES}
+        with self._lock:
+            fleet = dict(self._fleet)
+        return {
+            'total_users': counters.get(USERS, 0),
+            'trips_by_status': by_status,
+            'ongoing_trips': by_status['Scheduled'] + by_status['In Progress'],
+            'active_trucks': fleet['active_trucks'],
+            'month': fleet['month'],
+            'utilization': fleet['utilization'],
+        }
+
+
+# --- CLI ---
+def main(argv=None):
+    from app import app
+    from db import get_db
+
+    parser = argparse.ArgumentParser(description='Recount the STATS counters and correct any drift.')
+    parser.add_argument('--dry-run', action='store_true', help='Only report the drift')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    with app.app_context():
+        drift = reconcile_counters(get_db(), args.dry_run)
+    report = {
+        'dry_run': args.dry_run,
+        'drift': {name: {'was': was, 'now': now} for name, (was, now) in drift.items()},
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
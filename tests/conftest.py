@@ -0,0 +1,63 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connect_sqlite  # noqa: E402
+from generate_data import SQLITE_SCHEMA  # noqa: E402
+
+# Fleet shared by every test database: one client, trucks 1-2, drivers 1-3.
+CLIENT_USER_ID = 2
+CLIENT_ID = 1
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'tms.db')
+    conn = connect_sqlite(path)
+    cursor = conn.cursor()
+    for statement in SQLITE_SCHEMA:
+        cursor.execute(statement)
+    cursor.execute("INSERT INTO OWNER (OwnerID, OwnerName) VALUES (1, 'Speedy Logistics')")
+    cursor.executemany("INSERT INTO USERS (UserID, Username, PasswordHash, Role) VALUES (%s, %s, 'x', %s)",
+                       [(1, 'admin', 'admin'), (CLIENT_USER_ID, 'client', 'user')])
+    cursor.execute("INSERT INTO CLIENT (ClientID, ClientName, UserID) VALUES (%s, 'Global Electronics', %s)",
+                   (CLIENT_ID, CLIENT_USER_ID))
+    cursor.executemany("INSERT INTO TRUCK (TruckID, RegistrationNum, Capacity_in_Tons, OwnerID) VALUES (%s, %s, 10, 1)",
+                       [(1, 'TN-01-AB-1234'), (2, 'MH-12-XY-9876')])
+    cursor.executemany("INSERT INTO DRIVER (DriverID, FirstName, LastName) VALUES (%s, %s, %s)",
+                       [(1, 'Rajesh', 'Kumar'), (2, 'Anil', 'Mehta'), (3, 'Priya', 'Sharma')])
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = connect_sqlite(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def add_trip(conn):
+    """Inserts a trip straight into TRIP (or `table`) and returns its TripID."""
+    def add(start, end, status='Scheduled', truck_id=1, driver_id=1, table='TRIP', trip_id=None):
+        cursor = conn.cursor()
+        cursor.execute(f"INSERT INTO {table} (TripID, Origin, Destination, StartDate, EndDate, Status, TruckID, "
+                       f"DriverID, ClientID) VALUES (%s, 'Chennai', 'Pune', %s, %s, %s, %s, %s, %s)",
+                       (trip_id, start, end, status, truck_id, driver_id, CLIENT_ID))
+        conn.commit()
+        trip_id = cursor.lastrowid
+        cursor.close()
+        return trip_id
+    return add
+
+
+def day(n):
+    """A fixed future date, so tests never depend on today."""
+    return date(2040, 1, 1) + timedelta(days=n)
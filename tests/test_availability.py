@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from availability import BookingError, BusyIntervals, reserve_trip
+from conftest import CLIENT_USER_ID, day
+
+
+def reserve(conn, start, end, truck_id=1, driver_id=1):
+    return reserve_trip(conn, CLIENT_USER_ID, 'Chennai', 'Pune', day(start), day(end), truck_id, driver_id)
+
+
+def trip_count(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM TRIP")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+# --- reserve_trip ---
+def test_reserve_inserts_scheduled_trip(conn):
+    trip_id = reserve(conn, 0, 7)
+    cursor = conn.cursor()
+    cursor.execute("SELECT Status, TruckID, DriverID, ClientID FROM TRIP WHERE TripID = %s", (trip_id,))
+    assert cursor.fetchone() == ('Scheduled', 1, 1, 1)
+
+
+@pytest.mark.parametrize('truck_id, driver_id, message', [
+    (1, 2, 'truck is already booked'),
+    (2, 1, 'driver is already assigned'),
+])
+def test_reserve_rejects_overlapping_trip(conn, truck_id, driver_id, message):
+    existing = reserve(conn, 0, 7)
+    with pytest.raises(BookingError, match=message) as error:
+        reserve(conn, 6, 10, truck_id, driver_id)
+    assert f'Trip ID: {existing}' in str(error.value)
+    assert trip_count(conn) == 1
+
+
+def test_reserve_rejects_truck_in_maintenance(conn):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO MAINTENANCE (MaintenanceID, TruckID, MaintenanceDate, EndDate) VALUES (7, 1, %s, %s)",
+                   (day(3), day(4)))
+    conn.commit()
+    with pytest.raises(BookingError, match=r'maintenance.*Maintenance ID: 7'):
+        reserve(conn, 0, 7)
+    assert trip_count(conn) == 0
+
+
+def test_reserve_allows_back_to_back_trips(conn):
+    # Trips occupy [StartDate, EndDate): a trip may start the day the previous one ends.
+    reserve(conn, 0, 7)
+    reserve(conn, 7, 10)
+    reserve(conn, -5, 0)
+    assert trip_count(conn) == 3
+
+
+@pytest.mark.parametrize('status', ['Cancelled', 'Completed', 'Requested'])
+def test_reserve_ignores_inactive_trips(conn, add_trip, status):
+    add_trip(day(0), day(7), status)
+    reserve(conn, 0, 7)
+    assert trip_count(conn) == 2
+
+
+@pytest.mark.parametrize('truck_id, driver_id, message', [(99, 1, 'truck does not exist'), (1, 99, 'driver does not exist')])
+def test_reserve_rejects_unknown_resources(conn, truck_id, driver_id, message):
+    with pytest.raises(BookingError, match=message):
+        reserve(conn, 0, 7, truck_id, driver_id)
+
+
+# --- BusyIntervals ---
+def brute_force_free(intervals, start, end):
+    return all(not (busy_start < end and start < busy_end) for busy_start, busy_end, _ in intervals)
+
+
+def test_busy_intervals_match_brute_force():
+    rng = random.Random(7)
+    busy = BusyIntervals()
+    intervals = {resource_id: [] for resource_id in range(5)}
+    for ref in range(300):
+        resource_id = rng.randrange(5)
+        start = rng.randrange(365)
+        end = start + rng.randint(1, 30)
+        busy.add(resource_id, day(start), day(end), ref)
+        intervals[resource_id].append((day(start), day(end), ref))
+        if rng.random() < 0.2:
+            removed = rng.choice(intervals[resource_id])
+            assert busy.remove_from(resource_id, removed[2])
+            intervals[resource_id].remove(removed)
+
+        for _ in range(20):
+            query_id = rng.randrange(6)  # 5 has no intervals at all
+            start = rng.randrange(-10, 400)
+            end = start + rng.randint(1, 40)
+            assert busy.is_free(query_id, day(start), day(end)) == \
+                brute_force_free(intervals.get(query_id, []), day(start), day(end))
+
+
+def test_busy_intervals_remove_unknown_ref():
+    busy = BusyIntervals()
+    busy.add(1, day(0), day(5), 'a')
+    assert not busy.remove_from(1, 'b')
+    assert not busy.remove_from(2, 'a')
+    assert not busy.is_free(1, day(4), day(6))
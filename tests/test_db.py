@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from db import ConnectionPool, PoolTimeout, connect_sqlite
+
+
+@pytest.fixture
+def pool(db_path):
+    pool = ConnectionPool(lambda: connect_sqlite(db_path), size=1, max_overflow=1, timeout=0.2)
+    yield pool
+    pool.dispose()
+
+
+def test_released_connection_is_reused(pool):
+    conn = pool.acquire()
+    assert pool.stats()['in_use'] == 1
+    pool.release(conn)
+    assert pool.stats()['idle'] == 1
+    assert pool.acquire() is conn
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_release_rolls_back_open_transaction(pool):
+    conn = pool.acquire()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO GOODS (GoodsName) VALUES ('Rice')")
+    pool.release(conn)
+    cursor = pool.acquire().cursor()
+    cursor.execute("SELECT COUNT(*) FROM GOODS")
+    assert cursor.fetchone()[0] == 0
+
+
+def test_overflow_connections_are_closed_on_release(pool):
+    first, second = pool.acquire(), pool.acquire()
+    assert first is not second
+    pool.release(first)
+    pool.release(second)
+    stats = pool.stats()
+    assert (stats['open'], stats['idle'], stats['in_use']) == (1, 1, 0)
+
+
+def test_acquire_times_out_when_exhausted(pool):
+    held = [pool.acquire(), pool.acquire()]
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert time.monotonic() - started >= pool.timeout
+    assert pool.stats()['timeouts'] == 1
+    for conn in held:
+        pool.release(conn)
+
+
+def test_waiter_gets_released_connection(pool):
+    held = [pool.acquire(), pool.acquire()]
+    threading.Timer(0.05, pool.release, (held[0],)).start()
+    assert pool.acquire() is held[0]
+    assert pool.stats()['waits'] == 1
+
+
+def test_unhealthy_idle_connection_is_discarded(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()  # e.g. the server dropped it while idle
+    replacement = pool.acquire()
+    assert replacement is not conn
+    replacement.ping()
+    stats = pool.stats()
+    assert (stats['discarded'], stats['open']) == (1, 1)
+
+
+def test_release_with_discard_frees_the_slot(pool):
+    pool.release(pool.acquire(), discard=True)
+    stats = pool.stats()
+    assert (stats['open'], stats['idle'], stats['discarded']) == (0, 0, 1)
+
+
+def test_failed_connect_frees_the_slot():
+    def connect():
+        raise ConnectionError('server down')
+
+    pool = ConnectionPool(connect, size=1, max_overflow=0, timeout=0.1)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            pool.acquire()
+    assert pool.stats()['open'] == 0
@@ -0,0 +1,102 @@
+import pytest
+
+import lifecycle
+import stats
+from conftest import CLIENT_USER_ID, day
+
+
+def statuses(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT TripID, Status FROM TRIP")
+    result = dict(cursor.fetchall())
+    cursor.close()
+    return result
+
+
+def trip_counters(counters):
+    return {name: value for name, value in counters.items() if name.startswith('trips:') and value}
+
+
+def assert_counters_match(conn):
+    cursor = conn.cursor()
+    assert trip_counters(stats.read_counters(cursor)) == trip_counters(stats.compute_counters(cursor))
+    cursor.close()
+
+
+def test_forward_transitions(conn, add_trip):
+    trip_id = add_trip(day(0), day(7))
+    stats.reconcile_counters(conn)
+    for previous, new_status in (('Scheduled', 'In Progress'), ('In Progress', 'Completed')):
+        report = lifecycle.set_status(conn, [trip_id], new_status)
+        assert report['changed'] == [(trip_id, CLIENT_USER_ID, previous)]
+        assert statuses(conn)[trip_id] == new_status
+        assert_counters_match(conn)
+
+
+def test_report_classifies_every_trip(conn, add_trip):
+    scheduled = add_trip(day(0), day(7))
+    cancelled = add_trip(day(10), day(12), 'Cancelled', truck_id=2, driver_id=2)
+    requested = add_trip(day(0), day(7), 'Requested', truck_id=None, driver_id=None)
+    stats.reconcile_counters(conn)
+
+    report = lifecycle.set_status(conn, [scheduled, cancelled, requested, 999], 'Cancelled')
+    assert report['changed'] == [(scheduled, CLIENT_USER_ID, 'Scheduled'), (requested, CLIENT_USER_ID, 'Requested')]
+    assert report['unchanged'] == [cancelled]
+    assert report['missing'] == [999]
+    assert report['rejected'] == []
+    assert_counters_match(conn)
+
+
+def test_requested_trips_can_only_be_cancelled(conn, add_trip):
+    requested = add_trip(day(0), day(7), 'Requested', truck_id=None, driver_id=None)
+    scheduled = add_trip(day(0), day(7))
+    for new_status in ('Scheduled', 'In Progress', 'Completed'):
+        assert lifecycle.set_status(conn, [requested], new_status)['rejected'] == [requested]
+    assert lifecycle.set_status(conn, [scheduled], 'Requested')['rejected'] == [scheduled]
+    assert statuses(conn) == {requested: 'Requested', scheduled: 'Scheduled'}
+
+
+def test_unknown_status_raises(conn):
+    with pytest.raises(ValueError):
+        lifecycle.set_status(conn, [1], 'Lost')
+
+
+def test_reopen_when_resources_are_free(conn, add_trip):
+    trip_id = add_trip(day(0), day(7), 'Cancelled')
+    add_trip(day(7), day(9))  # same truck and driver, back to back
+    stats.reconcile_counters(conn)
+    report = lifecycle.set_status(conn, [trip_id], 'Scheduled')
+    assert report['changed'] == [(trip_id, CLIENT_USER_ID, 'Cancelled')]
+    assert_counters_match(conn)
+
+
+@pytest.mark.parametrize('truck_id, driver_id, reason', [(1, 2, 'truck'), (2, 1, 'driver')])
+def test_reopen_rejects_rebooked_resources(conn, add_trip, truck_id, driver_id, reason):
+    trip_id = add_trip(day(0), day(7), 'Cancelled')
+    add_trip(day(3), day(10), truck_id=truck_id, driver_id=driver_id)
+    report = lifecycle.set_status(conn, [trip_id], 'In Progress')
+    assert report['changed'] == []
+    assert report['rejected'] == [trip_id]
+    assert reason in report['conflicts'][0]['reason']
+    assert statuses(conn)[trip_id] == 'Cancelled'
+
+
+def test_reopen_rejects_truck_in_maintenance(conn, add_trip):
+    trip_id = add_trip(day(0), day(7), 'Completed')
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO MAINTENANCE (TruckID, MaintenanceDate, EndDate) VALUES (1, %s, %s)", (day(6), day(8)))
+    conn.commit()
+    assert lifecycle.set_status(conn, [trip_id], 'Scheduled')['rejected'] == [trip_id]
+
+
+def test_reopen_checks_trips_against_each_other(conn, add_trip):
+    first = add_trip(day(0), day(7), 'Cancelled', driver_id=1)
+    second = add_trip(day(5), day(9), 'Cancelled', driver_id=2)
+    report = lifecycle.set_status(conn, [first, second], 'Scheduled')
+    assert [trip_id for trip_id, _, _ in report['changed']] == [first]
+    assert report['rejected'] == [second]
+
+
+def test_reopen_rejects_trip_cancelled_while_requested(conn, add_trip):
+    trip_id = add_trip(day(0), day(7), 'Cancelled', truck_id=None, driver_id=None)
+    assert lifecycle.set_status(conn, [trip_id], 'Scheduled')['rejected'] == [trip_id]
@@ -0,0 +1,65 @@
+from datetime import date
+
+import pytest
+
+from conftest import day
+from trips import decode_cursor, encode_cursor, list_trips
+
+
+@pytest.fixture
+def history(conn, add_trip):
+    """Live and archived trips with interleaved start dates, several sharing a day. Returns (StartDate, TripID, Status)."""
+    trips = []
+    for n in range(12):
+        start = day(n // 2)
+        trip_id = add_trip(start, day(n // 2 + 3), 'Scheduled' if n % 3 else 'Completed')
+        trips.append((start, trip_id, 'Scheduled' if n % 3 else 'Completed'))
+    for n in range(9):
+        start = day(n // 3 - 1)
+        trip_id = add_trip(start, day(n // 3), 'Cancelled' if n % 2 else 'Completed', table='TRIP_ARCHIVE',
+                           trip_id=1000 + n)
+        trips.append((start, trip_id, 'Cancelled' if n % 2 else 'Completed'))
+    return trips
+
+
+def walk(conn, filters, limit):
+    """Follows next-page cursors through encode/decode until the last page."""
+    cursor = conn.cursor(dictionary=True)
+    seen, after, pages = [], None, 0
+    while True:
+        rows, next_cursor = list_trips(cursor, filters, after, limit)
+        assert len(rows) <= limit
+        seen += [(row['StartDate'], row['TripID']) for row in rows]
+        pages += 1
+        if next_cursor is None:
+            return seen, pages
+        after = decode_cursor(next_cursor)
+
+
+@pytest.mark.parametrize('limit', [1, 3, 5, 50])
+def test_pages_merge_live_and_archive_in_order(conn, history, limit):
+    seen, pages = walk(conn, {}, limit)
+    expected = sorted(((start, trip_id) for start, trip_id, _ in history), reverse=True)
+    assert seen == expected
+    assert pages == max(1, -(-len(history) // limit))
+
+
+@pytest.mark.parametrize('status', ['Completed', 'Cancelled', 'Scheduled'])
+def test_status_filter_spans_both_tables(conn, history, status):
+    seen, _ = walk(conn, {'status': status}, 2)
+    assert seen == sorted(((start, trip_id) for start, trip_id, s in history if s == status), reverse=True)
+
+
+def test_date_filter(conn, history):
+    seen, _ = walk(conn, {'date_from': day(0), 'date_to': day(2)}, 4)
+    assert seen == sorted(((start, trip_id) for start, trip_id, _ in history if day(0) <= start <= day(2)), reverse=True)
+
+
+def test_cursor_round_trip():
+    token = encode_cursor({'StartDate': date(2040, 1, 5), 'TripID': 42})
+    assert decode_cursor(token) == (date(2040, 1, 5), 42)
+
+
+@pytest.mark.parametrize('token', [None, '', 'garbage', '2040-13-01_1', '2040-01-01_x'])
+def test_malformed_cursor_is_ignored(token):
+    assert decode_cursor(token) is None
@@ -0,0 +1,139 @@
+from datetime import datetime
+
+# 'Requested' trips were booked without a truck and driver; scheduler.py assigns them.
+TRIP_STATUSES = ['Requested', 'Scheduled', 'In Progress', 'Completed', 'Cancelled']
+
+# Requested trips don't hold a truck or driver yet; Completed or Cancelled ones no longer do.
+ACTIVE_TRIP_FILTER = "Status NOT IN ('Requested', 'Completed', 'Cancelled')"
+INACTIVE_STATUSES = ('Requested', 'Completed', 'Cancelled')
+
+# Finished trips are moved from TRIP to TRIP_ARCHIVE after a while (see archive.py).
+ARCHIVED_STATUSES = ('Completed', 'Cancelled')
+TRIP_TABLES = ('TRIP', 'TRIP_ARCHIVE')
+
+
+# --- Page Queries ---
+# Shared by the Flask routes and asgi.py's native pages, so both serve the same data.
+USER_SQL = "SELECT UserID, Username, Role FROM USERS WHERE UserID = %s"
+CLIENT_ID_SQL = "SELECT ClientID FROM CLIENT WHERE UserID = %s"
+TRUCK_OPTIONS_SQL = "SELECT TruckID, RegistrationNum, Model_Id FROM TRUCK"
+DRIVER_OPTIONS_SQL = "SELECT DriverID, FirstName, LastName FROM DRIVER"
+TRIP_COLUMNS = "TripID, Origin, Destination, StartDate, EndDate, Status, TruckID, DriverID, ClientID"
+
+
+def client_trips_query(client_id):
+    """SQL and params for all of a client's trips, archived ones included, newest first."""
+    sql = " UNION ALL ".join(f"SELECT {TRIP_COLUMNS} FROM {table} WHERE ClientID = %s" for table in TRIP_TABLES)
+    return sql + " ORDER BY StartDate DESC, TripID DESC", [client_id] * len(TRIP_TABLES)
+
+
+# --- Keyset Pagination ---
+def encode_cursor(trip):
+    return f"{trip['StartDate']:%Y-%m-%d}_{trip['TripID']}"
+
+
+def decode_cursor(token):
+    """Turns an `after` token back into (StartDate, TripID). Returns None if it is malformed."""
+    try:
+        start, trip_id = token.split('_', 1)
+        return datetime.strptime(start, '%Y-%m-%d').date(), int(trip_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_trip_filters(args):
+    """Reads the admin trip filters from a request's query args, dropping empty or invalid values."""
+    filters = {}
+    if args.get('status') in TRIP_STATUSES:
+        filters['status'] = args.get('status')
+    for key in ('client_id', 'driver_id'):
+        value = args.get(key, type=int)
+        if value:
+            filters[key] = value
+    for key in ('date_from', 'date_to'):
+        try:
+            filters[key] = datetime.strptime(args.get(key, ''), '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    return filters
+
+
+def trip_page_query(filters=None, after=None, limit=50, table='TRIP'):
+    """
+    Builds the SQL and params for one page of trips in `table` (newest first)
+    joined with client and driver names. One extra row is requested to detect a
+    next page; pass the rows to split_page().
+
+    Pages are addressed by the (StartDate, TripID) of the last row seen rather than
+    an OFFSET, so every page is an index range scan of `limit` rows no matter how
+    deep into the history it is.
+    """
+    filters = filters or {}
+    where, params = [], []
+    if 'status' in filters:
+        where.append("t.Status = %s")
+        params.append(filters['status'])
+    if 'client_id' in filters:
+        where.append("t.ClientID = %s")
+        params.append(filters['client_id'])
+    if 'driver_id' in filters:
+        where.append("t.DriverID = %s")
+        params.append(filters['driver_id'])
+    if 'date_from' in filters:
+        where.append("t.StartDate >= %s")
+        params.append(filters['date_from'])
+    if 'date_to' in filters:
+        where.append("t.StartDate <= %s")
+        params.append(filters['date_to'])
+    if after:
+        where.append("(t.StartDate < %s OR (t.StartDate = %s AND t.TripID < %s))")
+        params.extend([after[0], after[0], after[1]])
+
+    sql = f"""
+        SELECT t.*, c.ClientName, d.FirstName, d.LastName
+        FROM {table} t
+        JOIN CLIENT c ON t.ClientID = c.ClientID
+        LEFT JOIN DRIVER d ON t.DriverID = d.DriverID
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY t.StartDate DESC, t.TripID DESC LIMIT %s"
+    params.append(limit + 1)
+    return sql, params
+
+
+def trip_page_queries(filters=None, after=None, limit=50):
+    """
+    Page queries for the hot table and, unless the status filter rules it out,
+    the archive. Each is its own index range scan; merge_pages() combines them.
+    """
+    filters = filters or {}
+    tables = TRIP_TABLES if filters.get('status', ARCHIVED_STATUSES[0]) in ARCHIVED_STATUSES else TRIP_TABLES[:1]
+    return [trip_page_query(filters, after, limit, table) for table in tables]
+
+
+def split_page(rows, limit):
+    """Returns (page rows, cursor for the next page or None)."""
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def merge_pages(row_lists, limit):
+    """Merges the per-table results of trip_page_queries() into one page (see split_page)."""
+    rows = sorted((row for rows in row_lists for row in rows),
+                  key=lambda trip: (trip['StartDate'], trip['TripID']), reverse=True)
+    return split_page(rows, limit)
+
+
+def list_trips(cursor, filters=None, after=None, limit=50):
+    """Returns one page of trips, archived ones included, and the cursor for the next one."""
+    row_lists = []
+    for sql, params in trip_page_queries(filters, after, limit):
+        cursor.execute(sql, params)
+        row_lists.append(cursor.fetchall())
+    return merge_pages(row_lists, limit)
+
+
+def trip_to_json(trip):
+    """Makes a TRIP row JSON-friendly (dates as YYYY-MM-DD)."""
+    return {key: value.isoformat() if hasattr(value, 'isoformat') else value for key, value in trip.items()}